@@ -0,0 +1,103 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from account.models import Store
+
+ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "account.session_store",
+}
+
+
+def _session_queries(queries):
+    reads = writes = 0
+    for query in queries:
+        sql = query["sql"]
+        if "django_session" not in sql:
+            continue
+        if sql.lstrip().upper().startswith("SELECT"):
+            reads += 1
+        else:
+            writes += 1
+    return reads, writes
+
+
+class Command(BaseCommand):
+    help = (
+        "セッションエンジン（django_session のみ / account.session_store）ごとに、ログイン済みの店舗ユーザーで"
+        "クーポン一覧と手動認証APIを呼び出し、1リクエストあたりの処理時間と django_session へのクエリ数を計測する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, required=True, help="計測に使用する店舗ID")
+        parser.add_argument("--requests", type=int, default=200, help="エンドポイントごとのリクエスト数（デフォルト: 200）")
+
+    def handle(self, *args, **options):
+        store = Store.objects.filter(id=options["store"]).first()
+        if store is None:
+            raise CommandError(f"店舗が存在しません: {options['store']}")
+        user = get_user_model().objects.get(id=store.user_id)
+        count = options["requests"]
+        # 発行されていない（チェック文字なしの）コード。認証APIは店舗・セッションの確認後に NOT_FOUND を返す
+        endpoints = [
+            ("list", "get", reverse("coupon:coupon_list")),
+            ("verify", "post", reverse("coupon:coupon_verify_manual", args=["ZZZZZZ"])),
+        ]
+
+        self.stdout.write(f"requests={count}")
+        self.stdout.write(
+            f"{'endpoint':>9} {'engine':>7} {'ms/req':>7} {'session reads/req':>18} {'session writes/req':>19}"
+        )
+        for name, method, path in endpoints:
+            for engine_name, engine in ENGINES.items():
+                with override_settings(SESSION_ENGINE=engine):
+                    elapsed, reads, writes = self._measure(user, store, method, path, count)
+                self.stdout.write(
+                    f"{name:>9} {engine_name:>7} {elapsed / count * 1e3:>7.2f} "
+                    f"{reads / count:>18.2f} {writes / count:>19.2f}"
+                )
+
+        # 同じ値の再設定（ログイン時の store_id など）で保存されるか
+        for engine_name, engine in ENGINES.items():
+            with override_settings(SESSION_ENGINE=engine):
+                client = self._login(user, store)
+                session = client.session
+                with CaptureQueriesContext(connection) as queries:
+                    session["store_id"] = store.id
+                    session.save()
+                _, writes = _session_queries(queries)
+                session.delete()
+            self.stdout.write(f"same-value save ({engine_name}): session writes={writes}")
+
+    @staticmethod
+    def _login(user, store):
+        client = Client(HTTP_ACCEPT="text/html")
+        client.force_login(user)
+        session = client.session
+        session["store_id"] = store.id
+        session.save()
+        return client
+
+    def _measure(self, user, store, method, path, count):
+        client = self._login(user, store)
+        request = getattr(client, method)
+        # 1回目（キャッシュへの読み込み）は計測に含めない
+        request(path)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(count):
+                    response = request(path)
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 500:
+                raise CommandError(f"{path}: status={response.status_code}")
+        finally:
+            client.session.delete()
+        reads, writes = _session_queries(queries)
+        return elapsed, reads, writes
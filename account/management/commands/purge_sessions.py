@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.session_store import SessionStore
+
+
+class Command(BaseCommand):
+    help = (
+        "期限切れのセッションを django_session から少しずつ削除する。"
+        "clearsessions と異なり1回の DELETE の件数を制限し、チャンクの間に待機する。cron などで定期実行する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="1回の DELETE で削除する件数",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="チャンクごとの待機秒数（デフォルト: 0.1）",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            help="実行時間の上限秒数（超えた場合は残りを次回の実行に回す）",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size には1以上を指定してください")
+        if options["pause"] < 0:
+            raise CommandError("--pause には0以上を指定してください")
+
+        purged, done = SessionStore.purge_expired(
+            chunk_size=options["chunk_size"],
+            pause=options["pause"],
+            max_seconds=options["max_seconds"],
+        )
+        message = f"{purged}件の期限切れのセッションを削除しました"
+        if not done:
+            message += "（実行時間の上限に達したため、残りは次回の実行で削除します）"
+        self.stdout.write(self.style.SUCCESS(message))
@@ -5,6 +5,8 @@ from django.core.exceptions import ValidationError
 from django.db import IntegrityError, DatabaseError, models
 import logging
 
+from . import store_cache
+
 logger = logging.getLogger(__name__)
 
 class CustomUserManager(BaseUserManager):
@@ -158,6 +160,7 @@ class Store(models.Model):
     def get_store_id_for_user(cls, user_id):
         """
         指定されたユーザーIDに紐づく店舗のIDを1件取得する
+        （店舗情報のキャッシュがあればDBを参照しない）
         Args:
             user_id (UUID): 取得対象のユーザーID
         Returns:
@@ -165,6 +168,16 @@ class Store(models.Model):
             None: 存在しない場合
             raise: DBエラー、予期しないエラーの場合
         """
+        return store_cache.get_or_load(
+            store_cache.user_store_id_key(user_id),
+            lambda: cls._fetch_store_id_for_user(user_id),
+        )
+
+    @classmethod
+    def _fetch_store_id_for_user(cls, user_id):
+        """
+        get_store_id_for_user のDB取得処理（キャッシュを使用しない）
+        """
         try:
             store_id = (
                 cls.objects
@@ -192,6 +205,7 @@ class Store(models.Model):
     def get_store_name(cls, store_id):
         """
         指定された店舗IDに紐づく店舗名を取得する
+        （店舗情報のキャッシュがあればDBを参照しない）
         Args:
             store_id (int): 取得対象の店舗ID
         Returns:
@@ -199,6 +213,16 @@ class Store(models.Model):
             None: 存在しない場合
             raise: DBエラー、予期しないエラーの場合
         """
+        return store_cache.get_or_load(
+            store_cache.store_name_key(store_id),
+            lambda: cls._fetch_store_name(store_id),
+        )
+
+    @classmethod
+    def _fetch_store_name(cls, store_id):
+        """
+        get_store_name のDB取得処理（キャッシュを使用しない）
+        """
         try:
             store_name = (
                 cls.objects
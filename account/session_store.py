@@ -0,0 +1,108 @@
+"""
+キャッシュ優先・DB併用のセッションストア（SESSION_ENGINE = "account.session_store"）
+
+- 読み込みは SESSION_CACHE_ALIAS のキャッシュを優先し、なければ django_session から読み込んでキャッシュする
+  （キャッシュが使用できない場合も django_session から読み込む）
+- 保存は django_session とキャッシュの両方に書き込む。ただし、読み込み時から内容が変わっていない場合
+  （同じ値の再設定など）は書き込まない
+- 書き込まない場合は有効期限も延長されない。SESSION_SAVE_EVERY_REQUEST = True（アクセスのたびに有効期限を
+  延長する）の場合は、内容が変わっていなくても毎回書き込む
+- 期限切れのセッションは purge_sessions コマンドで少しずつ削除する
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import DatabaseError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "account.session"
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # 読み込み時のセッションの内容（シリアライズ後）。未読み込み・新規の場合は None
+        self._loaded_data = None
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        # 存在しないセッションは新規作成として保存する必要があるため、比較の対象にしない
+        self._loaded_data = self._serialize(data) if self.session_key else None
+        return data
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and not settings.SESSION_SAVE_EVERY_REQUEST
+            and self.session_key
+            and self._loaded_data is not None
+            and self._serialize(self._get_session()) == self._loaded_data
+        ):
+            return
+        super().save(must_create)
+        self._loaded_data = self._serialize(self._get_session())
+
+    def cycle_key(self):
+        # 新しいキーでは必ず保存する
+        self._loaded_data = None
+        super().cycle_key()
+
+    @classmethod
+    def clear_expired(cls):
+        cls.purge_expired()
+
+    @classmethod
+    def purge_expired(cls, chunk_size=1000, pause=0.0, max_seconds=None, now=None):
+        """
+        期限切れのセッションを django_session から削除する（purge_sessions コマンド用）
+        - expire_date のインデックスで対象を chunk_size 件ずつ取得し、チャンクごとに1回の DELETE で削除する
+        - チャンクごとに pause 秒待機し、max_seconds 秒を超えたら残りは次回の実行に回す
+        - キャッシュ上のセッションは有効期限で自動的に消えるため削除しない
+        Args:
+            chunk_size (int): 1回の DELETE で削除する件数
+            pause (float): チャンクごとの待機秒数
+            max_seconds (float): 実行時間の上限秒数（None の場合は上限なし）
+            now (datetime): 基準日時（省略時は現在日時）
+        Returns:
+            tuple[int, bool]: (削除した件数, 期限切れのセッションをすべて削除したか)
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        model = cls.get_model_class()
+        now = now or timezone.now()
+        started = time.monotonic()
+        purged = 0
+        try:
+            while True:
+                keys = list(
+                    model.objects
+                    .filter(expire_date__lt=now)
+                    .order_by("expire_date")
+                    .values_list("session_key", flat=True)[:chunk_size]
+                )
+                if not keys:
+                    return purged, True
+                deleted, _ = model.objects.filter(session_key__in=keys, expire_date__lt=now).delete()
+                purged += deleted
+                if len(keys) < chunk_size:
+                    return purged, True
+                if max_seconds is not None and time.monotonic() - started >= max_seconds:
+                    return purged, False
+                if pause:
+                    time.sleep(pause)
+        except DatabaseError as e:
+            logger.error(f"[Session][PurgeExpired] Database error: purged={purged}, error={e}")
+            raise
+        except Exception as e:
+            logger.exception(f"[Session][PurgeExpired] Unexpected error: purged={purged}, error={e}")
+            raise
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import store_cache
+from .models import Store
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_cache(sender, instance, **kwargs):
+    """
+    店舗の保存・削除時に店舗情報のキャッシュを無効化する
+    """
+    store_cache.invalidate(store_id=instance.id, user_id=instance.user_id)
@@ -0,0 +1,86 @@
+"""
+店舗情報（ユーザーID→店舗ID、店舗ID→店舗名）のキャッシュ
+
+- リクエスト内のメモ（StoreCacheMiddleware が有効なリクエストのみ）
+- 共有キャッシュ（settings.CACHES の STORE_CACHE_ALIAS。全プロセスで共有するバックエンドを指定する）
+の順に参照し、どちらにもなければDBから取得して両方に保存する。
+Store の保存・削除時にシグナル（account.signals）で無効化する。
+"""
+import contextvars
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = "store"
+
+_request_memo = contextvars.ContextVar("store_cache_request_memo", default=None)
+
+
+def _cache():
+    return caches[getattr(settings, "STORE_CACHE_ALIAS", "stores")]
+
+
+def user_store_id_key(user_id):
+    return f"{KEY_PREFIX}:user:{user_id}:store_id"
+
+
+def store_name_key(store_id):
+    return f"{KEY_PREFIX}:{store_id}:store_name"
+
+
+def get_or_load(key, loader):
+    """
+    キャッシュから値を取得し、なければ loader の結果を保存して返す
+    - loader が None を返した場合（存在しない場合）はキャッシュしない
+    Args:
+        key (str): キャッシュキー
+        loader (Callable[[], Any]): DBから値を取得する関数
+    Returns:
+        キャッシュまたは loader から取得した値
+    """
+    memo = _request_memo.get()
+    if memo is not None and key in memo:
+        return memo[key]
+
+    value = _cache().get(key)
+    if value is None:
+        value = loader()
+        if value is not None:
+            _cache().set(key, value, getattr(settings, "STORE_CACHE_TIMEOUT", 3600))
+
+    if memo is not None and value is not None:
+        memo[key] = value
+    return value
+
+
+def invalidate(store_id=None, user_id=None):
+    """
+    指定された店舗・ユーザーに関するキャッシュを削除する
+    """
+    keys = []
+    if store_id is not None:
+        keys.append(store_name_key(store_id))
+    if user_id is not None:
+        keys.append(user_store_id_key(user_id))
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    memo = _request_memo.get()
+    if memo is not None:
+        for key in keys:
+            memo.pop(key, None)
+
+
+class StoreCacheMiddleware:
+    """
+    リクエストごとに店舗情報のメモを用意し、同一リクエスト内の共有キャッシュ参照を1回にする
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _request_memo.reset(token)
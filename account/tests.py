@@ -1,3 +1,110 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account import session_store
+from account.session_store import SessionStore
+
+
+@override_settings(SESSION_SAVE_EVERY_REQUEST=False)
+class SessionStoreTests(TestCase):
+    """
+    内容が変わっていないセッションの書き込みの省略と、期限切れのセッションの削除を確認する
+    """
+
+    def setUp(self):
+        caches["sessions"].clear()
+        session = SessionStore()
+        session["store_id"] = 1
+        session.create()
+        self.session_key = session.session_key
+
+    def load(self):
+        session = SessionStore(self.session_key)
+        session.load()
+        return session
+
+    def save_writes(self, session):
+        """
+        セッションを保存し、django_session への書き込み（INSERT・UPDATE）の回数を返す
+        """
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        return sum(query["sql"].startswith(("INSERT", "UPDATE")) for query in queries.captured_queries)
+
+    def test_unchanged_session_skips_write(self):
+        session = self.load()
+        # 同じ値の再設定は変更とみなさない
+        session["store_id"] = 1
+        self.assertTrue(session.modified)
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_modified_session_writes(self):
+        session = self.load()
+        session["store_id"] = 2
+        self.assertEqual(self.save_writes(session), 1)
+        self.assertEqual(Session.objects.get(session_key=self.session_key).get_decoded()["store_id"], 2)
+        caches["sessions"].clear()
+        self.assertEqual(self.load()["store_id"], 2)
+
+        # 書き込み後は、書き込んだ内容を基準に比較する
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_cycle_key_always_writes(self):
+        session = self.load()
+        session.cycle_key()
+        self.assertNotEqual(session.session_key, self.session_key)
+        self.assertTrue(Session.objects.filter(session_key=session.session_key).exists())
+        self.assertFalse(Session.objects.filter(session_key=self.session_key).exists())
+        self.assertEqual(SessionStore(session.session_key)["store_id"], 1)
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_save_every_request_extends_expiry(self):
+        Session.objects.filter(session_key=self.session_key).update(
+            expire_date=timezone.now() + timedelta(minutes=1)
+        )
+        caches["sessions"].clear()
+        session = self.load()
+        self.assertEqual(self.save_writes(session), 1)
+        expire_date = Session.objects.get(session_key=self.session_key).expire_date
+        self.assertGreater(expire_date, timezone.now() + timedelta(days=1))
+
+    def create_expired(self, count, now):
+        Session.objects.bulk_create(
+            Session(session_key=f"expired{i:05d}", session_data="", expire_date=now - timedelta(minutes=i + 1))
+            for i in range(count)
+        )
+
+    def test_purge_expired_in_chunks(self):
+        now = timezone.now()
+        self.create_expired(5, now)
+
+        # 1チャンクごとに SELECT と DELETE の2回（最後の1件のチャンクで終了する）
+        with self.assertNumQueries(6):
+            purged, done = SessionStore.purge_expired(chunk_size=2, now=now)
+        self.assertEqual((purged, done), (5, True))
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), [self.session_key])
+
+    def test_purge_expired_stops_at_max_seconds(self):
+        now = timezone.now()
+        self.create_expired(5, now)
+
+        # 1チャンク目の削除後に上限を超えたとみなす
+        with mock.patch.object(session_store.time, "monotonic", side_effect=[0.0, 10.0]):
+            purged, done = SessionStore.purge_expired(chunk_size=2, max_seconds=5, now=now)
+        self.assertEqual((purged, done), (2, False))
+        # 古いものから削除する
+        self.assertFalse(Session.objects.filter(session_key__in=["expired00004", "expired00003"]).exists())
+        self.assertEqual(Session.objects.filter(expire_date__lt=now).count(), 3)
+
+        purged, done = SessionStore.purge_expired(chunk_size=2, now=now)
+        self.assertEqual((purged, done), (3, True))
+        self.assertTrue(Session.objects.filter(session_key=self.session_key).exists())
@@ -0,0 +1,17 @@
+"""
+接続プール付きの MySQL バックエンド（ENGINE = "config.db.mysql"）
+- プールの動作は config/db/pool.py を参照
+"""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from config.db.pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, MySQLDatabaseWrapper):
+    def ping_connection(self, connection):
+        # COM_PING（SQLを実行しない疎通確認）。切断されていても再接続はしない
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except self.Database.Error:
+            return False
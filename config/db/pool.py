@@ -0,0 +1,226 @@
+"""
+DB接続のプロセス内プール（データベースバックエンドの DatabaseWrapper に組み込んで使用する）
+
+Django は CONN_MAX_AGE = 0 の場合、リクエストの終了時に接続を閉じる。
+このプールを組み込んだバックエンドでは、閉じる代わりに接続をプールに戻し、次の接続時に再利用する。
+
+- 再利用前に、最後に使用してから health_check_after 秒以上経過した接続だけを確認する（MySQL は COM_PING）
+- 作成から max_lifetime 秒を超えた接続、エラーが発生した接続、トランザクション中に閉じた接続は破棄する
+- プールに残す接続は max_idle 件まで（uwsgi の1プロセス・1スレッドでは通常1件）
+- fork 後の子プロセスでは、親プロセスの接続を使用しない
+
+設定は DATABASES の OPTIONS["pool"] に指定する:
+    "OPTIONS": {"pool": {"max_idle": 2, "max_lifetime": 3600, "health_check_after": 1.0}}
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_OPTIONS = {
+    # プールに残す接続の最大数
+    "max_idle": 2,
+    # 接続を作成してから破棄するまでの秒数
+    "max_lifetime": 3600,
+    # 最後に使用してからこの秒数以上経過した接続は、再利用前に疎通を確認する
+    "health_check_after": 1.0,
+}
+
+
+class _PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # init_connection_state（セッション変数の設定）を実行済みか
+        self.initialized = False
+
+
+class ConnectionPool:
+    """
+    1つのDB設定（エイリアス）の接続のプール
+    """
+
+    def __init__(self, options):
+        self.options = {**DEFAULT_POOL_OPTIONS, **options}
+        self.lock = threading.Lock()
+        self.idle = []
+        self.pid = os.getpid()
+        self.stats = {
+            "created": 0,
+            "reused": 0,
+            "health_checks": 0,
+            "discarded_age": 0,
+            "discarded_error": 0,
+            "discarded_unusable": 0,
+            "discarded_overflow": 0,
+        }
+
+    def _check_fork(self):
+        # fork 前に作成された接続は親プロセスと共有されるため、閉じずに手放す
+        if self.pid != os.getpid():
+            self.idle = []
+            self.pid = os.getpid()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def checkout(self, connect, ping, close):
+        """
+        プールから接続を取り出す（なければ作成する）
+        Args:
+            connect (Callable[[], Any]): 接続を作成する関数
+            ping (Callable[[Any], bool]): 接続が使用できるかを確認する関数
+            close (Callable[[Any], None]): 接続を閉じる関数
+        Returns:
+            _PooledConnection: 取り出した接続
+        """
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                self._check_fork()
+                entry = self.idle.pop() if self.idle else None
+            if entry is None:
+                break
+            if now - entry.created_at >= self.options["max_lifetime"]:
+                self._discard(entry, "discarded_age", close)
+                continue
+            if now - entry.last_used >= self.options["health_check_after"]:
+                self._count("health_checks")
+                if not ping(entry.connection):
+                    self._discard(entry, "discarded_unusable", close)
+                    continue
+            self._count("reused")
+            return entry
+
+        entry = _PooledConnection(connect())
+        self._count("created")
+        return entry
+
+    def checkin(self, entry, reusable, close):
+        """
+        接続をプールに戻す（再利用できない場合・プールが満杯の場合は閉じる）
+        Args:
+            entry (_PooledConnection): checkout で取り出した接続
+            reusable (bool): エラーが発生しておらず、トランザクション外であるか
+            close (Callable[[Any], None]): 接続を閉じる関数
+        """
+        now = time.monotonic()
+        if not reusable:
+            self._discard(entry, "discarded_error", close)
+            return
+        if now - entry.created_at >= self.options["max_lifetime"]:
+            self._discard(entry, "discarded_age", close)
+            return
+        with self.lock:
+            self._check_fork()
+            if len(self.idle) < self.options["max_idle"]:
+                entry.last_used = now
+                self.idle.append(entry)
+                return
+        self._discard(entry, "discarded_overflow", close)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _discard(self, entry, reason, close):
+        self._count(reason)
+        try:
+            close(entry.connection)
+        except Exception as e:
+            logger.warning(f"[ConnectionPool][Discard] Close failed: reason={reason}, error={e}")
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {**self.stats, "idle": len(self.idle), "pid": self.pid}
+
+
+_pools_lock = threading.Lock()
+_pools = {}
+
+
+def get_pool(alias, options):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(options)
+        return pool
+
+
+def stats():
+    """
+    このプロセスの接続プールの統計
+    Returns:
+        dict[str, dict]: エイリアスごとの作成・再利用・確認・破棄の件数とプール内の接続数
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.snapshot() for alias, pool in pools.items()}
+
+
+class PooledConnectionMixin:
+    """
+    DatabaseWrapper に組み込み、接続の作成・クローズをプールからの取り出し・プールへの返却に置き換える
+    - サブクラスで ping_connection を実装する（デフォルトは SELECT 1）
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool_entry = None
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict["OPTIONS"].get("pool") or {})
+
+    def get_connection_params(self):
+        # OPTIONS["pool"] はドライバーの接続パラメータではないため取り除く
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        self._pool_entry = self.pool.checkout(
+            lambda: super(PooledConnectionMixin, self).get_new_connection(conn_params),
+            self.ping_connection,
+            self.close_connection,
+        )
+        return self._pool_entry.connection
+
+    def init_connection_state(self):
+        # 再利用した接続はセッション変数の設定済みのため実行しない
+        if self._pool_entry is not None and self._pool_entry.initialized:
+            return
+        super().init_connection_state()
+        if self._pool_entry is not None:
+            self._pool_entry.initialized = True
+
+    def _close(self):
+        entry, self._pool_entry = self._pool_entry, None
+        if entry is None or entry.connection is not self.connection:
+            return super()._close()
+        reusable = (
+            not self.errors_occurred
+            and not self.in_atomic_block
+            and self.get_autocommit() == self.settings_dict["AUTOCOMMIT"]
+        )
+        self.pool.checkin(entry, reusable, self.close_connection)
+
+    def ping_connection(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            return True
+        except self.Database.Error:
+            return False
+
+    def close_connection(self, connection):
+        connection.close()
+
+    def pool_stats(self):
+        return self.pool.snapshot()
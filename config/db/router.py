@@ -0,0 +1,128 @@
+"""
+読み取り専用レプリカへの振り分け（DATABASE_ROUTERS = ["config.db.router.ReplicaRouter"]）
+
+- 読み取り専用の取得処理（Coupon.get_coupon など）は read_alias() のDBを使用する
+  （クエリセットの作成時に using で指定する。遅延評価のクエリセットも同じDBで実行される）
+- read_alias() は次の場合にプライマリ（default）を返し、それ以外はレプリカを返す
+  - レプリカ（DATABASE_REPLICA_ALIAS）が DATABASES にない場合
+  - リクエストの外（管理コマンドなど）の場合
+  - トランザクション中の場合
+  - 同じリクエストで書き込みがあった場合、または DATABASE_REPLICA_PIN_SECONDS 秒以内に
+    同じブラウザで書き込みがあった場合（ReplicaPinMiddleware の Cookie で判定する）
+  - use_primary() の中（結果をキャッシュする取得処理など、遅延した内容を返してはいけない場合）
+- 書き込みは常にプライマリに送る。セッション（django_session）の書き込みでは固定しない
+"""
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# 書き込みでプライマリに固定しない（常にプライマリで読み書きする）アプリ
+PRIMARY_ONLY_APPS = frozenset({"sessions"})
+PIN_COOKIE_NAME = "db_primary"
+
+
+class _RequestState:
+    def __init__(self, pinned):
+        # プライマリから読み込むか
+        self.pinned = pinned
+        # このリクエストで書き込みがあったか
+        self.wrote = False
+
+
+_request_state = contextvars.ContextVar("db_replica_request_state", default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, "DATABASE_REPLICA_ALIAS", "replica")
+    return alias if alias in settings.DATABASES else None
+
+
+def read_alias():
+    """
+    読み取り専用の取得処理で使用するDBのエイリアス
+    Returns:
+        str: レプリカを使用できる場合はレプリカ、それ以外は default
+    """
+    alias = replica_alias()
+    state = _request_state.get()
+    if alias is None or state is None or state.pinned:
+        return DEFAULT_DB_ALIAS
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+@contextlib.contextmanager
+def use_primary():
+    """
+    with の中の read_alias() をプライマリにする
+    - お客様向けページのように結果を共有キャッシュに保存する取得処理で使用する
+      （使用直後にレプリカから未使用の内容を読み込み、キャッシュの TIMEOUT の間表示し続けないため）
+    """
+    state = _request_state.get()
+    if state is None or state.pinned:
+        yield
+        return
+    pinned = _RequestState(pinned=True)
+    token = _request_state.set(pinned)
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+        # with の中で書き込んだ場合は、with の後の読み込みもプライマリに固定する
+        if pinned.wrote:
+            state.pinned = True
+            state.wrote = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # using を指定しない読み込みはプライマリ（関連の取得は取得元のインスタンスと同じDB）
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state.pinned = True
+            state.wrote = True
+        # レプリカから取得したインスタンスの保存もプライマリに送る
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # プライマリとレプリカは同じデータ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカにはレプリケーションで反映する
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    書き込みのあったリクエストの応答に Cookie を付け、DATABASE_REPLICA_PIN_SECONDS 秒の間
+    同じブラウザの読み込みをプライマリに固定する（書き込み直後に古い発行数・使用数を表示しないため）
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestState(pinned=PIN_COOKIE_NAME in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote and replica_alias() is not None:
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                "1",
+                max_age=getattr(settings, "DATABASE_REPLICA_PIN_SECONDS", 5),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
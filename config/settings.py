@@ -68,11 +68,14 @@ LOGOUT_REDIRECT_URL = 'account:login'
 
 MIDDLEWARE = [ 
     'django.middleware.security.SecurityMiddleware',
+    "config.db.router.ReplicaPinMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     "coupon.middleware.ClearFlowSessionOnLeaveMiddleware",
+    "account.store_cache.StoreCacheMiddleware",
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "coupon.sharding.ShardMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -100,9 +103,13 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# ENGINE の config.db.mysql は、uwsgi の各プロセスで接続をプールして再利用する MySQL バックエンド（config/db/pool.py）
+# - MYSQL_POOL_MAX_IDLE: プールに残す接続の最大数（0 の場合はプールせず、リクエストごとに接続を閉じる）
+# - MYSQL_POOL_MAX_LIFETIME: 接続を作成してから破棄するまでの秒数
+# - MYSQL_POOL_HEALTH_CHECK_AFTER: 最後に使用してからこの秒数以上経過した接続は、再利用前に COM_PING で確認する
 DATABASES = {
         'default': {
-                    'ENGINE': 'django.db.backends.mysql',
+                    'ENGINE': 'config.db.mysql',
                     'NAME': os.getenv("MYSQL_DATABASE", "dummyValue"),
                     'USER': os.getenv("MYSQL_USER", "dummyValue"),
                     'PASSWORD': os.getenv("MYSQL_PASSWORD", "dummyValue"),
@@ -110,9 +117,45 @@ DATABASES = {
                     'PORT': '3306',
                     'OPTIONS': {
                         'charset': 'utf8mb4',
+                        'pool': {
+                            'max_idle': int(os.getenv("MYSQL_POOL_MAX_IDLE", "2")),
+                            'max_lifetime': int(os.getenv("MYSQL_POOL_MAX_LIFETIME", "3600")),
+                            'health_check_after': float(os.getenv("MYSQL_POOL_HEALTH_CHECK_AFTER", "1.0")),
+                        },
                     },
         }
 }
+# 読み取り専用レプリカ（MYSQL_REPLICA_HOST を指定した場合のみ。config/db/router.py）
+# - クーポン詳細・一覧・お客様向けページなどの読み取り専用の取得処理をレプリカで実行する
+# - 書き込みのあったブラウザは DATABASE_REPLICA_PIN_SECONDS 秒の間プライマリから読み込む（レプリケーション遅延の対策）
+if os.getenv("MYSQL_REPLICA_HOST"):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv("MYSQL_REPLICA_HOST"),
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        'TEST': {'MIRROR': 'default'},
+    }
+# クーポンデータの店舗単位のシャーディング（COUPON_SHARD_HOSTS を指定した場合のみ。coupon/sharding.py）
+# - COUPON_SHARD_HOSTS: 追加するシャードのホスト（カンマ区切り。shard1, shard2, ... として DATABASES に追加する）
+# - default はユーザー・店舗・セッションなどのディレクトリと、1つ目のシャードを兼ねる
+# - 各シャードの auto_increment_increment / auto_increment_offset を揃え、id を全シャードで一意にする
+#   （rebalance_coupon_shards は移動先で id が重複する店舗を移動しない）
+# - migrate は --database ごとに実行する。シャードには店舗のテーブルを作成しないため、shard1 以降への接続は
+#   外部キー制約を検査しない（foreign_key_checks=0。coupon.sharding.disable_shard_fk_checks）
+# - シャーディングが有効な場合、レプリカは使用しない
+COUPON_SHARD_HOSTS = [host.strip() for host in os.getenv("COUPON_SHARD_HOSTS", "").split(",") if host.strip()]
+for number, host in enumerate(COUPON_SHARD_HOSTS, start=1):
+    DATABASES[f'shard{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+    }
+COUPON_SHARDS = ["default", *(f"shard{number}" for number in range(1, len(COUPON_SHARD_HOSTS) + 1))] if COUPON_SHARD_HOSTS else []
+# 店舗の保存先のキャッシュ秒数（rebalance_coupon_shards は保存先の変更後、この秒数待ってから次の手順に進む）
+COUPON_SHARD_CACHE_TIMEOUT = int(os.getenv("COUPON_SHARD_CACHE_TIMEOUT", "30"))
+DATABASE_ROUTERS = ["coupon.sharding.ShardRouter", "config.db.router.ReplicaRouter"]
+DATABASE_REPLICA_ALIAS = "replica"
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DATABASE_REPLICA_PIN_SECONDS", "5"))
 #DATABASES = {
 #    'default': {
 #        'ENGINE': 'django.db.backends.sqlite3',
@@ -121,6 +164,44 @@ DATABASES = {
 #}
 
 
+# Cache
+# 複数プロセス（uwsgi）で無効化を共有するため、本番では Redis 等の共有バックエンドを指定する
+# 例: COUPON_PAGE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#     COUPON_PAGE_CACHE_LOCATION=redis://cache:6379/1
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "voucherz-default"),
+    },
+    "coupon_pages": {
+        "BACKEND": os.getenv("COUPON_PAGE_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("COUPON_PAGE_CACHE_LOCATION", "/tmp/voucherz/coupon_pages"),
+        "TIMEOUT": int(os.getenv("COUPON_PAGE_CACHE_TIMEOUT", "300")),
+        # ページ・バージョン・クーポンIDの3種類のキーを保存するため、デフォルト（300件）より多くする
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("COUPON_PAGE_CACHE_MAX_ENTRIES", "30000"))},
+    },
+    # 店舗情報（account/store_cache.py）・店舗の保存先のシャード（coupon/sharding.py）。
+    # 店舗の保存時の無効化を全プロセスに反映するため、プロセス間で共有できないバックエンド（LocMemCache）は指定しない
+    "stores": {
+        "BACKEND": os.getenv("STORE_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("STORE_CACHE_LOCATION", "/tmp/voucherz/stores"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("STORE_CACHE_MAX_ENTRIES", "10000"))},
+    },
+    # セッション（account.session_store）。プロセス間で共有できないバックエンド（LocMemCache）は指定しない
+    "sessions": {
+        "BACKEND": os.getenv("SESSION_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("SESSION_CACHE_LOCATION", "/tmp/voucherz/sessions"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))},
+    },
+}
+
+# Sessions
+# キャッシュ優先・DB併用で、内容が変わっていない場合は保存しない（account/session_store.py）
+# 期限切れのセッションは purge_sessions コマンドを定期実行して削除する
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "account.session_store")
+SESSION_CACHE_ALIAS = "sessions"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -191,3 +272,62 @@ FLOW_GUARDS = [
         ],
     },
 ]
+
+# クーポンコードの生成方式
+# - "random": ランダム生成（重複時はリトライ）
+# - "permutation": 店舗ごとの連番を鍵付き置換で並べ替え（店舗内で重複しない）
+COUPON_CODE_GENERATOR = os.getenv("COUPON_CODE_GENERATOR", "random")
+
+# 新しく発行するクーポンコードの末尾にチェック文字（ISO/IEC 7064 MOD 37,36）を付けて7文字にする
+# 手入力の認証で入力ミスをDBを参照せずに弾ける（チェック文字なしの6文字のコードも引き続き使用できる）
+COUPON_CODE_CHECK_DIGIT = os.getenv("COUPON_CODE_CHECK_DIGIT", "false").lower() == "true"
+# チェック文字なしの6文字のコードを受け付けるかどうか（チェック文字なしのコードがすべて使用済み・期限切れになったら false にする）
+# false にすると、チェック文字付きのコードの1文字抜けも入力ミスとして弾ける
+COUPON_CODE_ACCEPT_UNCHECKED = os.getenv("COUPON_CODE_ACCEPT_UNCHECKED", "true").lower() == "true"
+
+# 発行済みクーポンコード・UUIDの店舗ごとの Bloom フィルタ（認証APIで存在しないコードをDBを参照せずに弾く）
+# - COUPON_CODE_FILTER_FP_RATE: 誤検知率（存在しないコードをDBで確認する割合）
+# - COUPON_CODE_FILTER_MAX_LAG: 他のプロセスで発行されたコードを読み込む間隔（秒）
+# - COUPON_CODE_FILTER_REBUILD_SECONDS: フィルタを作り直す間隔（秒）
+# - COUPON_CODE_FILTER_COMMIT_WINDOW: 発行（INSERT）からコミットまでの最大の時間（秒）。
+#   これより長い発行のトランザクションのコードは、フィルタの作り直しまで「存在しない」と判定されうる
+COUPON_CODE_FILTER_ENABLED = os.getenv("COUPON_CODE_FILTER_ENABLED", "false").lower() == "true"
+COUPON_CODE_FILTER_FP_RATE = float(os.getenv("COUPON_CODE_FILTER_FP_RATE", "0.01"))
+COUPON_CODE_FILTER_MAX_LAG = float(os.getenv("COUPON_CODE_FILTER_MAX_LAG", "1.0"))
+COUPON_CODE_FILTER_REBUILD_SECONDS = int(os.getenv("COUPON_CODE_FILTER_REBUILD_SECONDS", "3600"))
+COUPON_CODE_FILTER_COMMIT_WINDOW = float(os.getenv("COUPON_CODE_FILTER_COMMIT_WINDOW", "60"))
+
+# 事前生成済みクーポンコード（refill_code_pool コマンドで補充）
+# - COUPON_CODE_POOL_LOW_WATER: 未使用件数がこれを下回った店舗を補充対象にする
+# - COUPON_CODE_POOL_SIZE: 補充後の未使用件数
+COUPON_CODE_POOL_ENABLED = os.getenv("COUPON_CODE_POOL_ENABLED", "false").lower() == "true"
+COUPON_CODE_POOL_LOW_WATER = int(os.getenv("COUPON_CODE_POOL_LOW_WATER", "100"))
+COUPON_CODE_POOL_SIZE = int(os.getenv("COUPON_CODE_POOL_SIZE", "500"))
+
+# 店舗情報（ユーザーID→店舗ID、店舗ID→店舗名）のキャッシュ
+STORE_CACHE_ALIAS = "stores"
+STORE_CACHE_TIMEOUT = int(os.getenv("STORE_CACHE_TIMEOUT", "3600"))
+
+# お客様向けクーポンページのキャッシュ
+COUPON_PAGE_CACHE_ALIAS = "coupon_pages"
+# ブラウザにキャッシュさせる最大秒数（Cache-Control: max-age）
+COUPON_PAGE_MAX_AGE = int(os.getenv("COUPON_PAGE_MAX_AGE", "60"))
+
+# クーポン一覧の1ページあたりの件数（キーセットページング）
+COUPON_LIST_PAGE_SIZE = int(os.getenv("COUPON_LIST_PAGE_SIZE", "30"))
+
+# クーポン一括認証API（/coupon/api/verify/batch/）で1回に受け付ける最大件数
+COUPON_VERIFY_BATCH_MAX = int(os.getenv("COUPON_VERIFY_BATCH_MAX", "50"))
+
+# 発行数・使用数の推移API（/coupon/api/stats/）で指定できる最大日数
+COUPON_STATS_MAX_DAYS = int(os.getenv("COUPON_STATS_MAX_DAYS", "92"))
+
+# お客様向けページのURLのスキーム・ホスト（クーポンコードのエクスポート・QRコード画像で使用）
+COUPON_PUBLIC_BASE_URL = os.getenv("COUPON_PUBLIC_BASE_URL", "https://voucherz.jp")
+
+# QRコード画像（/coupon/qr/）のエンコード結果をプロセス内に保持する件数（LRU）
+COUPON_QR_CACHE_SIZE = int(os.getenv("COUPON_QR_CACHE_SIZE", "1024"))
+
+# クーポンの発行数・使用数の分散カウンタのスロット数（0 の場合は Coupon の行を直接更新する）
+# 有効にする場合は compact_coupon_counters コマンドを定期実行する
+COUPON_COUNTER_SHARDS = int(os.getenv("COUPON_COUNTER_SHARDS", "0"))
@@ -0,0 +1,39 @@
+"""
+テスト用の設定（python manage.py test --settings=config.test_settings）
+
+- MySQL を使わず、ローカルの SQLite でテストする（テスト用DBはエイリアスごとにメモリ上に作成される）
+- 読み取り専用レプリカ（replica。TEST MIRROR で default と同じDB）と、シャーディングのテスト用のシャード
+  （shard1, shard2）のエイリアスを用意する。COUPON_SHARDS は空のままにし、シャーディングのテストで指定する
+- キャッシュはプロセス内のもの（LocMemCache）にする
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_default.sqlite3",
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_default.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
+    "shard1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_shard1.sqlite3",
+    },
+    "shard2": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_shard2.sqlite3",
+    },
+}
+COUPON_SHARDS = []
+
+CACHES = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"test-{alias}"}
+    for alias in ("default", "coupon_pages", "stores", "sessions")
+}
+
+ALLOWED_HOSTS = ["*"]
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
@@ -0,0 +1,231 @@
+import itertools
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase
+
+from account.models import Store, User
+from config.db import pool, router
+from coupon.models import Coupon
+
+PASSWORD = "Test-Passw0rd!"
+# レプリカのエイリアスがない設定ではレプリカへの振り分けのテストを行わない
+HAS_REPLICA = router.replica_alias() is not None
+
+
+@skipUnless(HAS_REPLICA, "config.test_settings のレプリカのエイリアス（TEST MIRROR）が必要です")
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    リクエスト中の読み込みのレプリカへの振り分けと、書き込み後のプライマリへの固定を確認する
+    （TestCase はテストをトランザクションで囲み、read_alias() が常に default になるため TransactionTestCase を使う）
+    """
+    databases = {"default", router.replica_alias()} if HAS_REPLICA else {"default"}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.replica = router.replica_alias()
+
+    def run_request(self, view, cookies=None):
+        """
+        ReplicaPinMiddleware を通して view を実行する
+        Returns:
+            tuple[HttpResponse, list]: (レスポンス, view が記録した値)
+        """
+        request = self.factory.get("/")
+        request.COOKIES.update(cookies or {})
+        seen = []
+
+        def get_response(request):
+            view(seen)
+            return HttpResponse()
+
+        return router.ReplicaPinMiddleware(get_response)(request), seen
+
+    def test_read_alias(self):
+        # リクエストの外はプライマリ
+        self.assertEqual(router.read_alias(), "default")
+
+        def view(seen):
+            seen.append(router.read_alias())
+            with router.use_primary():
+                seen.append(router.read_alias())
+            seen.append(router.read_alias())
+
+        response, seen = self.run_request(view)
+        self.assertEqual(seen, [self.replica, "default", self.replica])
+        self.assertNotIn(router.PIN_COOKIE_NAME, response.cookies)
+
+    def test_replica_reads_mirrored_data(self):
+        user = User.objects.create_user(email="store@example.com", password=PASSWORD)
+        store = Store.objects.create(user=user, store_name="テスト店舗")
+
+        def view(seen):
+            seen.append(Store.objects.using(router.read_alias()).filter(id=store.id).exists())
+
+        _, seen = self.run_request(view)
+        self.assertEqual(seen, [True])
+
+    def test_write_pins_request_and_sets_cookie(self):
+        def view(seen):
+            seen.append(router.read_alias())
+            self.assertEqual(router.ReplicaRouter().db_for_write(Coupon), "default")
+            seen.append(router.read_alias())
+
+        response, seen = self.run_request(view)
+        self.assertEqual(seen, [self.replica, "default"])
+        cookie = response.cookies[router.PIN_COOKIE_NAME]
+        self.assertEqual(cookie["max-age"], settings.DATABASE_REPLICA_PIN_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+    def test_write_inside_use_primary_sets_cookie(self):
+        def view(seen):
+            with router.use_primary():
+                router.ReplicaRouter().db_for_write(Coupon)
+            seen.append(router.read_alias())
+
+        response, seen = self.run_request(view)
+        self.assertEqual(seen, ["default"])
+        self.assertIn(router.PIN_COOKIE_NAME, response.cookies)
+
+    def test_session_write_does_not_pin(self):
+        from django.contrib.sessions.models import Session
+
+        def view(seen):
+            router.ReplicaRouter().db_for_write(Session)
+            seen.append(router.read_alias())
+
+        response, seen = self.run_request(view)
+        self.assertEqual(seen, [self.replica])
+        self.assertNotIn(router.PIN_COOKIE_NAME, response.cookies)
+
+    def test_cookie_pins_next_request(self):
+        def view(seen):
+            seen.append(router.read_alias())
+
+        _, seen = self.run_request(view, cookies={router.PIN_COOKIE_NAME: "1"})
+        self.assertEqual(seen, ["default"])
+
+    def test_transaction_reads_primary(self):
+        from django.db import transaction
+
+        def view(seen):
+            with transaction.atomic():
+                seen.append(router.read_alias())
+
+        _, seen = self.run_request(view)
+        self.assertEqual(seen, ["default"])
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(router.ReplicaRouter().allow_migrate(self.replica, "coupon", model_name="coupon"))
+        self.assertIsNone(router.ReplicaRouter().allow_migrate("default", "coupon", model_name="coupon"))
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    接続プールの取り出し・返却、寿命とプールの上限による破棄、fork 後のリセットを確認する
+    （接続の作成・疎通確認・クローズはスタブで置き換え、時刻は time.monotonic をパッチして進める）
+    """
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(pool.time, "monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ids = itertools.count(1)
+        self.alive = True
+        self.pings = []
+        self.closed = []
+        self.pool = pool.ConnectionPool({"max_idle": 1, "max_lifetime": 60, "health_check_after": 1.0})
+
+    def connect(self):
+        return f"conn{next(self.ids)}"
+
+    def ping(self, connection):
+        self.pings.append(connection)
+        return self.alive
+
+    def close(self, connection):
+        self.closed.append(connection)
+
+    def checkout(self):
+        return self.pool.checkout(self.connect, self.ping, self.close)
+
+    def checkin(self, entry, reusable=True):
+        self.pool.checkin(entry, reusable, self.close)
+
+    def test_checkout_reuses_checked_in_connection(self):
+        entry = self.checkout()
+        self.assertEqual(entry.connection, "conn1")
+        self.checkin(entry)
+
+        # 直後の再利用では疎通を確認しない
+        self.assertIs(self.checkout(), entry)
+        self.assertEqual(self.pings, [])
+        self.checkin(entry)
+
+        # 一定時間使用していない接続は確認してから再利用する
+        self.now += 2
+        self.assertIs(self.checkout(), entry)
+        self.assertEqual(self.pings, ["conn1"])
+        self.assertEqual(self.closed, [])
+        stats = self.pool.snapshot()
+        self.assertEqual((stats["created"], stats["reused"], stats["health_checks"]), (1, 2, 1))
+
+    def test_unusable_connection_is_replaced(self):
+        entry = self.checkout()
+        self.checkin(entry)
+        self.now += 2
+        self.alive = False
+        self.assertEqual(self.checkout().connection, "conn2")
+        self.assertEqual(self.closed, ["conn1"])
+        self.assertEqual(self.pool.snapshot()["discarded_unusable"], 1)
+
+    def test_error_connection_is_discarded(self):
+        self.checkin(self.checkout(), reusable=False)
+        self.assertEqual(self.closed, ["conn1"])
+        self.assertEqual(self.pool.snapshot()["idle"], 0)
+        self.assertEqual(self.pool.snapshot()["discarded_error"], 1)
+
+    def test_lifetime_discard(self):
+        # プール内で寿命を超えた接続は取り出し時に破棄する
+        entry = self.checkout()
+        self.checkin(entry)
+        self.now += 60
+        entry = self.checkout()
+        self.assertEqual(entry.connection, "conn2")
+        self.assertEqual(self.closed, ["conn1"])
+
+        # 使用中に寿命を超えた接続は返却時に破棄する
+        self.now += 60
+        self.checkin(entry)
+        self.assertEqual(self.closed, ["conn1", "conn2"])
+        self.assertEqual(self.pool.snapshot()["discarded_age"], 2)
+
+    def test_overflow_discard(self):
+        first, second = self.checkout(), self.checkout()
+        self.checkin(first)
+        self.checkin(second)
+        self.assertEqual(self.closed, ["conn2"])
+        stats = self.pool.snapshot()
+        self.assertEqual((stats["idle"], stats["discarded_overflow"]), (1, 1))
+
+    def test_close_error_is_ignored(self):
+        def close(connection):
+            raise OSError("broken pipe")
+
+        with self.assertLogs(pool.logger, "WARNING"):
+            self.pool.checkin(self.checkout(), False, close)
+        self.assertEqual(self.pool.snapshot()["discarded_error"], 1)
+
+    def test_fork_reset(self):
+        self.checkin(self.checkout())
+        self.assertEqual(self.pool.snapshot()["idle"], 1)
+
+        # 子プロセスでは親の接続を閉じずに手放し、新しく接続する
+        with mock.patch.object(pool.os, "getpid", return_value=self.pool.pid + 1):
+            self.assertEqual(self.checkout().connection, "conn2")
+            stats = self.pool.snapshot()
+        self.assertEqual(self.closed, [])
+        self.assertEqual((stats["created"], stats["reused"], stats["idle"]), (1, 0, 0))
+        self.assertEqual(stats["pid"], self.pool.pid)
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from account.views import TopPageView
+from coupon.views import CouponCodeShortView
 import environ
 from .views import health_check
 
@@ -28,6 +29,8 @@ urlpatterns = [
     path('coupon/', include('coupon.urls', namespace='coupon')),
     path('', TopPageView.as_view(), name='index'),
     path('health/', health_check, name='health_check'),
+    # お客様向けクーポンページの短縮URL（QRコード用。英数字モードで格納できるよう大文字）
+    path('C/<str:token>/', CouponCodeShortView.as_view(), name='coupon_short_view'),
 ]
 
 if settings.DEBUG and env("DJANGO_ENV") == "development":
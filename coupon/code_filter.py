@@ -0,0 +1,272 @@
+"""
+発行済みクーポンコード・UUIDの店舗ごとの Bloom フィルタ（プロセス内）
+
+クーポン認証API（手入力・QR・一括）で、発行されていないことが確実なコード・UUIDを
+DBを参照せずに「無効なクーポンコード」として返すために使用する（総当たりの不正アクセス対策）。
+
+- フィルタは店舗ごとに、その店舗の最初の認証時に coupon_codes から作成する
+  （ワーカーの起動時にまとめて作成すると、店舗数・コード数に比例して起動が遅くなるため）
+- 同じプロセスで発行したコードは発行時（コミット後）に追加する
+- 他のプロセスで発行されたコードは、「存在しない」と判定する前に coupon_codes の末尾を読み込んで追加する。
+  読み込みは COUPON_CODE_FILTER_MAX_LAG 秒に1回まで
+  - id の採番順とコミット順は前後するため、前回の読み込みの COUPON_CODE_FILTER_COMMIT_WINDOW 秒前の時点で
+    確認済みだった id の次から読み直す（採番からその秒数以内にコミットされた行は取りこぼさない）
+- 作成から COUPON_CODE_FILTER_REBUILD_SECONDS 秒経過した場合、または想定件数を超えた場合は作り直す
+- 作成・読み込みに失敗した場合は「存在しうる」として扱い、従来どおりDBを検索する
+"""
+import collections
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Max
+
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+# 最初の末尾の確認で、確認した最大の id より前から読み直す件数
+# （確認の時点でコミットされていなかった行を取りこぼさないため）
+TAIL_OVERLAP = 1000
+# 1店舗のフィルタの最小の想定件数
+MIN_CAPACITY = 1024
+# 作成時の件数に対する想定件数の倍率（作成後の発行分の余裕）
+GROWTH = 1.5
+
+
+class BloomFilter:
+    """
+    Bloom フィルタ（ダブルハッシュで k 個のビット位置を求める）
+    """
+
+    def __init__(self, capacity, fp_rate):
+        self.capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        # 登録済みのキー（末尾の読み直しなど）は件数に含めない
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+
+def code_key(code):
+    # DBの照合順序（大文字・小文字を区別しない）に合わせる
+    return f"c:{code.upper()}"
+
+
+def uuid_key(coupon_code_uuid):
+    return f"u:{str(coupon_code_uuid).replace('-', '').lower()}"
+
+
+class _StoreFilter:
+    def __init__(self, bloom):
+        self.bloom = bloom
+        self.built_at = time.monotonic()
+
+    def add(self, code, coupon_code_uuid):
+        self.bloom.add(code_key(code))
+        self.bloom.add(uuid_key(coupon_code_uuid))
+
+    def is_stale(self):
+        age = time.monotonic() - self.built_at
+        return (
+            age > getattr(settings, "COUPON_CODE_FILTER_REBUILD_SECONDS", 3600)
+            or self.bloom.count > self.bloom.capacity
+        )
+
+
+_lock = threading.Lock()
+_filters = {}
+# DB（シャード）ごとの、末尾の読み込みで確認した coupon_codes の最大の id と、読み込んだ時刻
+# （history は COUPON_CODE_FILTER_COMMIT_WINDOW 秒前までの (読み込んだ時刻, その時点の最大の id)）
+_tails = {}
+
+
+def enabled():
+    return getattr(settings, "COUPON_CODE_FILTER_ENABLED", False)
+
+
+def _load_store(store_id, chunk_size=10000):
+    """
+    店舗のクーポンコードをすべて読み込んでフィルタを作成する
+    - (store_id, coupon_code) の一意インデックスの順にキーセットで読み込む
+    """
+    from .models import CouponCode
+
+    total = CouponCode.objects.filter(store_id=store_id).count()
+    # コードとUUIDの2件ずつ登録する
+    capacity = max(MIN_CAPACITY, int(total * GROWTH)) * 2
+    store_filter = _StoreFilter(
+        BloomFilter(capacity, getattr(settings, "COUPON_CODE_FILTER_FP_RATE", 0.01))
+    )
+    last_code = ""
+    while True:
+        rows = list(
+            CouponCode.objects
+            .filter(store_id=store_id, coupon_code__gt=last_code)
+            .order_by("coupon_code")
+            .values_list("coupon_code", "coupon_uuid")[:chunk_size]
+        )
+        for code, coupon_code_uuid in rows:
+            store_filter.add(code, coupon_code_uuid)
+        if len(rows) < chunk_size:
+            break
+        last_code = rows[-1][0]
+    return store_filter
+
+
+def _get_tail():
+    # id はシャードごとに採番されるため、現在の店舗のシャードごとに管理する
+    return _tails.setdefault(
+        sharding.current_alias(), {"max_id": None, "checked_at": 0.0, "history": collections.deque()}
+    )
+
+
+def _tail_start(_tail):
+    """
+    末尾の読み込みを始める id（この id より大きい行を読み込む）
+    - 前回の読み込みの COUPON_CODE_FILTER_COMMIT_WINDOW 秒前の時点で確認済みだった最大の id。
+      その時点で採番されていなかった行は、採番からその秒数以内にコミットされていれば今回読み込める
+    - それより古い記録は不要になるため削除する（最初の確認の記録しかない場合はそれを使う）
+    """
+    history = _tail["history"]
+    since = _tail["checked_at"] - getattr(settings, "COUPON_CODE_FILTER_COMMIT_WINDOW", 60)
+    while len(history) > 1 and history[1][0] <= since:
+        history.popleft()
+    return history[0][1]
+
+
+def _refresh_tail(force=False):
+    """
+    現在の店舗のシャードの末尾に発行されたクーポンコードを、作成済みの店舗のフィルタに追加する
+    - COUPON_CODE_FILTER_MAX_LAG 秒以内に読み込み済みの場合は何もしない（force の場合を除く）
+    """
+    from .models import CouponCode
+
+    _tail = _get_tail()
+    now = time.monotonic()
+    if not force and now - _tail["checked_at"] < getattr(settings, "COUPON_CODE_FILTER_MAX_LAG", 1.0):
+        return
+    if _tail["max_id"] is None:
+        _tail["max_id"] = CouponCode.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        _tail["history"].append((now, max(0, _tail["max_id"] - TAIL_OVERLAP)))
+    else:
+        rows = list(
+            CouponCode.objects
+            .filter(id__gt=_tail_start(_tail))
+            .values_list("id", "store_id", "coupon_code", "coupon_uuid")
+        )
+        for row_id, store_id, code, coupon_code_uuid in rows:
+            store_filter = _filters.get(store_id)
+            if store_filter is not None:
+                store_filter.add(code, coupon_code_uuid)
+            _tail["max_id"] = max(_tail["max_id"], row_id)
+        _tail["history"].append((now, _tail["max_id"]))
+    _tail["checked_at"] = now
+
+
+def _get_store_filter(store_id):
+    store_filter = _filters.get(store_id)
+    if store_filter is None or store_filter.is_stale():
+        # 末尾の位置を先に確定させ、作成中に発行されたコードは次の末尾の読み込みで追加する
+        if _get_tail()["max_id"] is None:
+            _refresh_tail(force=True)
+        store_filter = _load_store(store_id)
+        _filters[store_id] = store_filter
+        logger.info(
+            f"[CodeFilter][Build] store_id={store_id}, codes={store_filter.bloom.count // 2}, "
+            f"bytes={store_filter.bloom.nbytes}"
+        )
+    return store_filter
+
+
+def might_exist(store_id, code=None, uuid=None):
+    """
+    指定された店舗で、クーポンコードまたはUUIDが発行済みでありうるかを判定する
+    Args:
+        store_id (int): 店舗ID
+        code (str): クーポンコード
+        uuid (uuid.UUID | str): クーポンコードのUUID
+    Returns:
+        bool: False の場合は発行されていないことが確実（True の場合はDBで確認する必要がある）
+    """
+    if not enabled():
+        return True
+    key = uuid_key(uuid) if uuid else code_key(code)
+    try:
+        with _lock:
+            store_filter = _get_store_filter(store_id)
+            if key in store_filter.bloom:
+                return True
+            # 他のプロセスで発行された直後のコードでないか、末尾を確認してから判定する
+            _refresh_tail()
+            return key in store_filter.bloom
+    except DatabaseError as e:
+        logger.error(f"[CodeFilter][Lookup] Database error: store_id={store_id}, error={e}")
+        return True
+
+
+def add(store_id, pairs):
+    """
+    発行したクーポンコードを作成済みのフィルタに追加する（発行のコミット後に呼び出す）
+    Args:
+        store_id (int): 店舗ID
+        pairs (Iterable[tuple[str, uuid.UUID]]): (クーポンコード, UUID)
+    """
+    if not enabled():
+        return
+    with _lock:
+        store_filter = _filters.get(store_id)
+        if store_filter is None:
+            return
+        for code, coupon_code_uuid in pairs:
+            store_filter.add(code, coupon_code_uuid)
+
+
+def clear():
+    """
+    作成済みのフィルタをすべて破棄する
+    """
+    with _lock:
+        _filters.clear()
+        _tails.clear()
+
+
+def stats():
+    """
+    作成済みのフィルタの件数・メモリ使用量
+    Returns:
+        dict: {"stores": int, "codes": int, "bytes": int}
+    """
+    with _lock:
+        return {
+            "stores": len(_filters),
+            "codes": sum(store_filter.bloom.count for store_filter in _filters.values()) // 2,
+            "bytes": sum(store_filter.bloom.nbytes for store_filter in _filters.values()),
+        }
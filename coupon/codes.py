@@ -0,0 +1,180 @@
+"""
+クーポンコードの生成に関する処理
+
+- CODE_CHARS: クーポンコードに使用する文字（英大文字 + 数字の36文字）
+- permute_code: 店舗ごとの連番を、店舗ごとの鍵で 36^length の空間上に
+  並べ替えたクーポンコードに変換する（フォーマット保存型の置換）
+- feistel / feistel_inverse: 2の累乗の空間上の置換とその逆変換（permute・coupon.sharding で使用する）
+- check_char / is_plausible_code: チェック文字付きのコード（COUPON_CODE_CHECK_DIGIT = True で発行）
+  length 文字の本体の末尾に ISO/IEC 7064 MOD 37,36 のチェック文字を付けた length + 1 文字
+  1文字の誤りはすべて、隣接する2文字の入れ替えもほとんど（約99.8%）検出でき、入力ミスをDBを参照せずに弾ける
+"""
+import hashlib
+import hmac
+import string
+
+from django.conf import settings
+
+CODE_CHARS = string.ascii_uppercase + string.digits
+FEISTEL_ROUNDS = 8
+
+_CODE_INDEX = {char: index for index, char in enumerate(CODE_CHARS)}
+
+
+def code_space(length):
+    """
+    指定された文字数で表現できるクーポンコードの総数を返す
+    """
+    return len(CODE_CHARS) ** length
+
+
+def encode(value, length):
+    """
+    整数を CODE_CHARS による固定長の36進文字列に変換する
+    Args:
+        value (int): 0 以上 code_space(length) 未満の整数
+        length (int): 文字数
+    Returns:
+        str: クーポンコード
+    """
+    base = len(CODE_CHARS)
+    chars = []
+    for _ in range(length):
+        value, rem = divmod(value, base)
+        chars.append(CODE_CHARS[rem])
+    return "".join(reversed(chars))
+
+
+def store_key(store_id):
+    """
+    店舗ごとの置換に使用する鍵を SECRET_KEY から導出する
+    """
+    secret = getattr(settings, "COUPON_CODE_SECRET", None) or settings.SECRET_KEY
+    return hmac.new(
+        secret.encode(), f"coupon-code:{store_id}".encode(), hashlib.sha256
+    ).digest()
+
+
+def feistel(value, key, half_bits):
+    """
+    2 * half_bits ビットの空間上の置換（平衡Feistel構造）
+    - クーポンコードの並べ替え（permute）と、クーポンコードUUIDへの店舗IDの埋め込み（coupon.sharding）で使用する
+    Args:
+        value (int): 0 以上 2 ** (2 * half_bits) 未満の整数
+        key (bytes): 置換の鍵
+        half_bits (int): 空間のビット数の半分
+    Returns:
+        int: 置換後の整数（feistel_inverse で元に戻せる）
+    """
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    for round_no in range(FEISTEL_ROUNDS):
+        digest = hmac.new(
+            key, bytes([round_no]) + right.to_bytes(8, "big"), hashlib.sha256
+        ).digest()
+        left, right = right, left ^ (int.from_bytes(digest[:8], "big") & mask)
+    return (left << half_bits) | right
+
+
+def feistel_inverse(value, key, half_bits):
+    """
+    feistel の逆変換
+    """
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    for round_no in reversed(range(FEISTEL_ROUNDS)):
+        digest = hmac.new(
+            key, bytes([round_no]) + left.to_bytes(8, "big"), hashlib.sha256
+        ).digest()
+        left, right = right ^ (int.from_bytes(digest[:8], "big") & mask), left
+    return (left << half_bits) | right
+
+
+def permute(value, key, length):
+    """
+    0 以上 code_space(length) 未満の整数を、同じ範囲の整数に一対一で並べ替える
+    - 2の累乗の空間上の Feistel 置換を、範囲内に収まるまで繰り返し適用する（cycle walking）
+    Args:
+        value (int): 並べ替える整数
+        key (bytes): 置換の鍵
+        length (int): クーポンコードの文字数
+    Returns:
+        int: 並べ替え後の整数
+    """
+    domain = code_space(length)
+    if not 0 <= value < domain:
+        raise ValueError(f"value must be in [0, {domain}): {value}")
+    half_bits = ((domain - 1).bit_length() + 1) // 2
+    while True:
+        value = feistel(value, key, half_bits)
+        if value < domain:
+            return value
+
+
+def permute_code(store_id, counter, length=6):
+    """
+    店舗ごとの連番をクーポンコードに変換する
+    - 同じ店舗の異なる連番からは必ず異なるコードが生成される
+    - 鍵を知らない限り、コードから連番や他のコードは推測できない
+    Args:
+        store_id (int): 店舗ID
+        counter (int): 店舗ごとの連番（0 始まり）
+        length (int): クーポンコードの文字数
+    Returns:
+        str: クーポンコード
+    """
+    return encode(permute(counter, store_key(store_id), length), length)
+
+
+def check_digit_enabled():
+    """
+    新しく発行するクーポンコードにチェック文字を付けるかどうか
+    """
+    return getattr(settings, "COUPON_CODE_CHECK_DIGIT", False)
+
+
+def check_char(payload):
+    """
+    クーポンコード本体のチェック文字（ISO/IEC 7064 MOD 37,36）を返す
+    Args:
+        payload (str): CODE_CHARS からなるクーポンコード本体
+    Returns:
+        str: CODE_CHARS の1文字
+    """
+    modulus = len(CODE_CHARS)
+    product = modulus
+    for char in payload:
+        total = (product + _CODE_INDEX[char]) % modulus or modulus
+        product = total * 2 % (modulus + 1)
+    return CODE_CHARS[(modulus + 1 - product) % modulus]
+
+
+def with_check_char(payload):
+    """
+    クーポンコード本体の末尾にチェック文字を付ける
+    """
+    return payload + check_char(payload)
+
+
+def is_plausible_code(code, length=6, accept_unchecked=None):
+    """
+    入力されたクーポンコードが発行済みのコードでありうるかをDBを参照せずに判定する
+    - チェック文字なし（length 文字）: 使用文字のみ確認する（従来のコード）
+    - チェック文字付き（length + 1 文字）: 使用文字とチェック文字を確認する
+    大文字・小文字は区別しない（照合順序で区別しないDBの検索結果と合わせる）
+    Args:
+        code (str): 入力されたクーポンコード
+        length (int): クーポンコード本体の文字数
+        accept_unchecked (bool): チェック文字なしのコードを受け付けるかどうか
+            （None の場合は COUPON_CODE_ACCEPT_UNCHECKED に従う）
+    Returns:
+        bool: 発行済みのコードでありうる場合は True（False の場合はDBを検索する必要がない）
+    """
+    if accept_unchecked is None:
+        accept_unchecked = getattr(settings, "COUPON_CODE_ACCEPT_UNCHECKED", True)
+    code = code.upper()
+    if len(code) not in (length, length + 1) or any(char not in _CODE_INDEX for char in code):
+        return False
+    if len(code) == length:
+        return accept_unchecked
+    return code[-1] == check_char(code[:-1])
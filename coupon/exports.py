@@ -0,0 +1,131 @@
+"""
+クーポンコードの一括エクスポート（CSV / JSON Lines）
+
+- 行は id のキーセット（id > 前回の最後の id）で chunk_size 件ずつ取得し、values_list のタプルのまま書き出す
+  （MySQL のドライバは QuerySet.iterator() でも結果セット全体をクライアントに読み込むため、
+  チャンクごとにクエリを分けてメモリ使用量を件数によらず一定にする）
+- エクスポートAPI（CouponCodeExportView）と export_coupon_codes コマンドで共通に使う
+"""
+import csv
+import json
+import uuid
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import sharding
+from .models import CouponCode
+
+FORMATS = ("csv", "jsonl")
+HEADER = ("coupon_code", "coupon_uuid", "customer_url", "issued_at", "redeemed_at")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+_PLACEHOLDER = uuid.UUID(int=0)
+
+
+def customer_url_template(base_url=None):
+    """
+    お客様向けページのURLの書式（UUID の位置が {} の文字列）を返す
+    - 行ごとに reverse しないよう、書式を1回だけ作成する
+    """
+    base_url = (base_url or getattr(settings, "COUPON_PUBLIC_BASE_URL", "")).rstrip("/")
+    path = reverse("coupon:coupon_customer_view", args=[_PLACEHOLDER])
+    return base_url + path.replace(str(_PLACEHOLDER), "{}")
+
+
+def iter_rows(coupon_id, chunk_size=2000, base_url=None, using=None):
+    """
+    指定されたクーポンのクーポンコードを1件ずつ返す
+    Args:
+        coupon_id (int): クーポンID
+        chunk_size (int): 1回のクエリで取得する件数
+        base_url (str): お客様向けページのURLのスキーム・ホスト（省略時は COUPON_PUBLIC_BASE_URL）
+        using (str): 読み込むDBのエイリアス（省略時は現在の店舗のシャード）
+    Yields:
+        tuple: (coupon_code, coupon_uuid, customer_url, issued_at, redeemed_at)
+    """
+    url_template = customer_url_template(base_url)
+    queryset = CouponCode.objects.using(using or sharding.current_alias())
+    last_id = 0
+    while True:
+        rows = list(
+            queryset
+            .filter(coupon_id=coupon_id, id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "coupon_code", "coupon_uuid", "created_at", "redeemed_at")[:chunk_size]
+        )
+        if not rows:
+            return
+        for _, code, code_uuid, created_at, redeemed_at in rows:
+            yield (
+                code,
+                str(code_uuid),
+                url_template.format(code_uuid),
+                _format_datetime(created_at),
+                _format_datetime(redeemed_at),
+            )
+        last_id = rows[-1][0]
+        if len(rows) < chunk_size:
+            return
+
+
+def _format_datetime(value):
+    return timezone.localtime(value).isoformat() if value is not None else ""
+
+
+class _Echo:
+    """csv.writer の書き込み先（書き込んだ文字列をそのまま返す）"""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """
+    行をCSVの1行ずつの文字列にして返す（先頭はヘッダー行）
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    """
+    行をJSON Lines の1行ずつの文字列にして返す
+    """
+    for row in rows:
+        record = dict(zip(HEADER, row))
+        record["redeemed_at"] = record["redeemed_at"] or None
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_export(coupon_id, export_format="csv", chunk_size=2000, base_url=None):
+    """
+    指定された形式のエクスポートを1行ずつの文字列で返す
+    Raises:
+        ValueError: 形式が csv, jsonl 以外の場合
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f"形式には {', '.join(FORMATS)} のいずれかを指定してください")
+    # ストリーミングの応答はミドルウェアの処理後に読み込むため、呼び出し時点の店舗のシャードを渡す
+    rows = iter_rows(coupon_id, chunk_size=chunk_size, base_url=base_url, using=sharding.current_alias())
+    lines = iter_csv(rows) if export_format == "csv" else iter_jsonl(rows)
+    return _join(lines, chunk_size)
+
+
+def _join(lines, size):
+    """
+    size 行ずつ連結して返す（1行ずつ書き込むとレスポンスの書き込み回数が行数分になるため）
+    """
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
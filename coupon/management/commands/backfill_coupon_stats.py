@@ -0,0 +1,59 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from coupon import sharding
+from coupon.models import Coupon, CouponStatBucket
+
+
+class Command(BaseCommand):
+    help = (
+        "coupon_codes の作成日時・使用日時から、クーポンごと・1時間ごとの発行数・使用数の集計"
+        "（coupon_stat_buckets）を作り直す。現在の時間帯は発行・使用時の加算に任せ、再集計しない"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--coupon",
+            type=int,
+            action="append",
+            dest="coupon_ids",
+            help="対象のクーポンID（複数指定可）",
+        )
+        parser.add_argument(
+            "--store",
+            type=int,
+            action="append",
+            dest="store_ids",
+            help="対象の店舗ID（複数指定可。--coupon と両方省略時は全クーポン）",
+        )
+        parser.add_argument(
+            "--since",
+            help="この日（YYYY-MM-DD、TIME_ZONE の日付）以降のみ再集計する（省略時は全期間）",
+        )
+
+    def handle(self, *args, **options):
+        start = None
+        if options["since"]:
+            try:
+                since = date.fromisoformat(options["since"])
+            except ValueError:
+                raise CommandError("--since は YYYY-MM-DD 形式で指定してください")
+            start = timezone.make_aware(datetime.combine(since, time.min))
+        end = CouponStatBucket.bucket_of(timezone.now())
+
+        rebuilt = 0
+        buckets = 0
+        for _ in sharding.each_shard():
+            coupons = Coupon.objects.all()
+            if options["coupon_ids"]:
+                coupons = coupons.filter(id__in=options["coupon_ids"])
+            if options["store_ids"]:
+                coupons = coupons.filter(store_id__in=options["store_ids"])
+            for coupon_id in coupons.order_by("id").values_list("id", flat=True).iterator():
+                buckets += CouponStatBucket.rebuild(coupon_id, start=start, end=end)
+                rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{rebuilt}件のクーポンの集計を作り直しました（{buckets}件の時間帯）"
+        ))
@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from coupon.codes import CODE_CHARS, is_plausible_code, with_check_char
+from coupon.models import CouponCode
+
+
+def _substitute(code):
+    i = random.randrange(len(code))
+    return code[:i] + random.choice(CODE_CHARS.replace(code[i], "")) + code[i + 1:]
+
+
+def _transpose(code):
+    i = random.randrange(len(code) - 1)
+    return code[:i] + code[i + 1] + code[i] + code[i + 2:]
+
+
+def _delete(code):
+    i = random.randrange(len(code))
+    return code[:i] + code[i + 1:]
+
+
+def _insert(code):
+    i = random.randrange(len(code) + 1)
+    return code[:i] + random.choice(CODE_CHARS) + code[i:]
+
+
+def _symbol(code):
+    i = random.randrange(len(code))
+    return code[:i] + random.choice("-_ .O0") + code[i + 1:]
+
+
+# 手入力で起こりやすい入力ミス
+TYPOS = {
+    "substitute": _substitute,
+    "transpose": _transpose,
+    "delete": _delete,
+    "insert": _insert,
+    "symbol": _symbol,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "チェック文字付きクーポンコードの入力ミスの種類ごとに、"
+        "DBを参照せずに弾ける割合と判定時間を計測する（--store を指定するとDB検索の時間と比較する）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=10000, help="入力ミスの種類ごとの件数（デフォルト: 10000）")
+        parser.add_argument(
+            "--store",
+            type=int,
+            help="指定した店舗IDで入力ミスのコードをDB検索し、1件あたりの時間を比較する",
+        )
+        parser.add_argument("--db-samples", type=int, default=200, help="DB検索の計測件数（デフォルト: 200）")
+        parser.add_argument(
+            "--reject-unchecked",
+            action="store_true",
+            help="チェック文字なしのコードを受け付けない設定（COUPON_CODE_ACCEPT_UNCHECKED = False）で計測する",
+        )
+
+    def handle(self, *args, **options):
+        samples = options["samples"]
+        accept_unchecked = False if options["reject_unchecked"] else None
+        codes = [with_check_char("".join(random.choices(CODE_CHARS, k=6))) for _ in range(samples)]
+
+        self.stdout.write(f"samples={samples}")
+        self.stdout.write(f"{'typo':>11} {'rejected':>9} {'us/check':>9}")
+        all_typos = []
+        for name, typo in TYPOS.items():
+            inputs = [typo(code) for code in codes]
+            # 同じ文字の入れ替えなど、元のコードと変わらないものは入力ミスではない
+            inputs = [value for value, code in zip(inputs, codes) if value != code]
+            all_typos.extend(inputs)
+            started = time.perf_counter()
+            rejected = sum(1 for value in inputs if not is_plausible_code(value, accept_unchecked=accept_unchecked))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{name:>11} {rejected / len(inputs):>9.2%} {elapsed / len(inputs) * 1e6:>9.2f}"
+            )
+
+        started = time.perf_counter()
+        for code in codes:
+            is_plausible_code(code, accept_unchecked=accept_unchecked)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{'valid':>11} {'-':>9} {elapsed / len(codes) * 1e6:>9.2f}")
+
+        if options["store"] is not None:
+            inputs = random.sample(all_typos, min(options["db_samples"], len(all_typos)))
+            started = time.perf_counter()
+            for value in inputs:
+                CouponCode.get_coupon_code(options["store"], code=value)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{'db lookup':>11} {'-':>9} {elapsed / len(inputs) * 1e6:>9.2f}")
@@ -0,0 +1,67 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from coupon.code_filter import BloomFilter, code_key, uuid_key
+from coupon.codes import CODE_CHARS
+
+
+class Command(BaseCommand):
+    help = (
+        "発行済みクーポンコードの Bloom フィルタについて、誤検知率（存在しないコードを"
+        "「存在しうる」と判定する割合）・メモリ使用量・作成時間・判定時間を計測する（DBは使用しない）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--codes", type=int, default=1_000_000, help="登録するクーポンコード数（デフォルト: 1000000）")
+        parser.add_argument("--probes", type=int, default=100_000, help="存在しないコード・UUIDの判定件数（デフォルト: 100000）")
+        parser.add_argument(
+            "--fp-rate",
+            type=float,
+            nargs="+",
+            help="計測する誤検知率の設定値（デフォルト: COUPON_CODE_FILTER_FP_RATE）",
+        )
+
+    def handle(self, *args, **options):
+        count = options["codes"]
+        probes = options["probes"]
+        rates = options["fp_rate"] or [getattr(settings, "COUPON_CODE_FILTER_FP_RATE", 0.01)]
+
+        codes = set()
+        while len(codes) < count:
+            codes.add("".join(random.choices(CODE_CHARS, k=6)))
+        uuids = [uuid.uuid4() for _ in range(count)]
+        absent_codes = []
+        while len(absent_codes) < probes:
+            code = "".join(random.choices(CODE_CHARS, k=6))
+            if code not in codes:
+                absent_codes.append(code)
+        absent_uuids = [uuid.uuid4() for _ in range(probes)]
+
+        self.stdout.write(f"codes={count:,}, probes={probes:,}（コードとUUIDを1件ずつ登録）")
+        self.stdout.write(
+            f"{'fp rate':>8} {'hashes':>6} {'MiB':>7} {'MiB/1M':>7} {'build s':>8} "
+            f"{'code fp':>8} {'uuid fp':>8} {'us/check':>9}"
+        )
+        for rate in rates:
+            bloom = BloomFilter(count * 2, rate)
+            started = time.perf_counter()
+            for code, value in zip(codes, uuids):
+                bloom.add(code_key(code))
+                bloom.add(uuid_key(value))
+            build_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            code_hits = sum(1 for code in absent_codes if code_key(code) in bloom)
+            check_elapsed = time.perf_counter() - started
+            uuid_hits = sum(1 for value in absent_uuids if uuid_key(value) in bloom)
+
+            mib = bloom.nbytes / 1024 / 1024
+            self.stdout.write(
+                f"{rate:>8.2%} {bloom.hashes:>6} {mib:>7.2f} {mib / count * 1_000_000:>7.2f} "
+                f"{build_elapsed:>8.1f} {code_hits / probes:>8.3%} {uuid_hits / probes:>8.3%} "
+                f"{check_elapsed / probes * 1e6:>9.2f}"
+            )
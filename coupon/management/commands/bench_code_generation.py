@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from coupon.codes import code_space, encode, permute, store_key
+from coupon.models import CouponCode
+
+
+class Command(BaseCommand):
+    help = (
+        "クーポンコード生成方式（random / permutation）ごとに、"
+        "コード空間の充填率別の1発行あたりのINSERT試行回数を計測する（DBは使用しない）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--length",
+            type=int,
+            default=3,
+            help="シミュレーションに使うコードの文字数（デフォルト: 3 = 46,656通り）",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=1000,
+            help="充填率ごとに発行するコード数（デフォルト: 1000）",
+        )
+        parser.add_argument(
+            "--fill",
+            type=float,
+            nargs="+",
+            default=[0.1, 0.5, 0.9],
+            help="計測する充填率（デフォルト: 0.1 0.5 0.9）",
+        )
+
+    def handle(self, *args, **options):
+        length = options["length"]
+        samples = options["samples"]
+        space = code_space(length)
+        key = store_key(0)
+
+        self.stdout.write(f"code space: {space:,} (length={length}), samples={samples}")
+        self.stdout.write(f"{'fill':>6} {'mode':>12} {'attempts/code':>14} {'max':>5} {'us/code':>9}")
+        for fill in options["fill"]:
+            filled = int(space * fill)
+            if filled + samples > space:
+                self.stderr.write(f"fill={fill}: samples がコード空間を超えるためスキップします")
+                continue
+
+            # random: 既存コードと衝突した場合は再生成（= INSERT のリトライ）
+            existing = set()
+            while len(existing) < filled:
+                existing.add(CouponCode.generate_code(length))
+            attempts = []
+            started = time.perf_counter()
+            for _ in range(samples):
+                tries = 1
+                code = CouponCode.generate_code(length)
+                while code in existing:
+                    tries += 1
+                    code = CouponCode.generate_code(length)
+                existing.add(code)
+                attempts.append(tries)
+            elapsed = time.perf_counter() - started
+            self._report(fill, "random", attempts, elapsed, samples)
+
+            # permutation: 連番 filled 以降を並べ替えるだけで重複しない
+            existing = {encode(permute(n, key, length), length) for n in range(filled)}
+            attempts = []
+            started = time.perf_counter()
+            for counter in range(filled, filled + samples):
+                code = encode(permute(counter, key, length), length)
+                attempts.append(1 if code not in existing else 2)
+                existing.add(code)
+            elapsed = time.perf_counter() - started
+            self._report(fill, "permutation", attempts, elapsed, samples)
+
+    def _report(self, fill, mode, attempts, elapsed, samples):
+        self.stdout.write(
+            f"{fill:>6.0%} {mode:>12} {sum(attempts) / len(attempts):>14.2f} "
+            f"{max(attempts):>5} {elapsed / samples * 1e6:>9.1f}"
+        )
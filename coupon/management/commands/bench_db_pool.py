@@ -0,0 +1,122 @@
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from account.models import Store
+from config.db import pool
+from config.db.pool import PooledConnectionMixin
+
+
+def _wrapper_classes(wrapper_cls):
+    """
+    default の DatabaseWrapper から、プールなし・プールありのクラスを作る
+    - どちらも接続の作成回数（counter["connects"]）を数える
+    - プールなしのバックエンド（SQLite など）の場合は PooledConnectionMixin を組み込む
+    """
+    pooled_attrs = {}
+    if issubclass(wrapper_cls, PooledConnectionMixin):
+        pooled_attrs["ping_connection"] = wrapper_cls.ping_connection
+        wrapper_cls = next(
+            cls for cls in wrapper_cls.__mro__[1:]
+            if cls is not PooledConnectionMixin and not issubclass(cls, PooledConnectionMixin)
+        )
+    counter = {"connects": 0}
+
+    def get_new_connection(self, conn_params):
+        counter["connects"] += 1
+        return wrapper_cls.get_new_connection(self, conn_params)
+
+    plain_cls = type("DatabaseWrapper", (wrapper_cls,), {"get_new_connection": get_new_connection})
+    pooled_cls = type("DatabaseWrapper", (PooledConnectionMixin, plain_cls), pooled_attrs)
+    return plain_cls, pooled_cls, counter
+
+
+class Command(BaseCommand):
+    help = (
+        "DB接続のプール（config.db.pool）の有無で、ログイン済みの店舗ユーザーのクーポン一覧・手動認証APIの"
+        "1リクエストあたりの処理時間と接続の作成回数を計測する（default のDBを使用する）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, required=True, help="計測に使用する店舗ID")
+        parser.add_argument("--requests", type=int, default=300, help="エンドポイントごとのリクエスト数（デフォルト: 300）")
+        parser.add_argument(
+            "--health-check-after",
+            type=float,
+            default=1.0,
+            help="プールの health_check_after（0 を指定すると再利用のたびに疎通を確認する。デフォルト: 1.0）",
+        )
+
+    def handle(self, *args, **options):
+        store = Store.objects.filter(id=options["store"]).first()
+        if store is None:
+            raise CommandError(f"店舗が存在しません: {options['store']}")
+        user = store.user
+        count = options["requests"]
+
+        original = connections[DEFAULT_DB_ALIAS]
+        settings_dict = {**original.settings_dict, "CONN_MAX_AGE": 0}
+        options_without_pool = {k: v for k, v in settings_dict["OPTIONS"].items() if k != "pool"}
+        pool_options = {"health_check_after": options["health_check_after"]}
+        plain_cls, pooled_cls, counter = _wrapper_classes(type(original))
+        backends = {
+            "plain": (plain_cls, {**settings_dict, "OPTIONS": options_without_pool}),
+            "pooled": (pooled_cls, {**settings_dict, "OPTIONS": {**options_without_pool, "pool": pool_options}}),
+        }
+        endpoints = [
+            ("list", "get", reverse("coupon:coupon_list")),
+            ("verify", "post", reverse("coupon:coupon_verify_manual", args=["ZZZZZZ"])),
+        ]
+
+        # テストクライアントはリクエストの終了時に接続を閉じないため、WSGIHandler を直接呼び出す
+        client = Client()
+        client.force_login(user)
+        session = client.session
+        session["store_id"] = store.id
+        session.save()
+        csrf_request = RequestFactory().get("/")
+        csrf_header = get_token(csrf_request)
+        csrf_token = csrf_request.META["CSRF_COOKIE"]
+        factory = RequestFactory(
+            HTTP_ACCEPT="text/html",
+            HTTP_COOKIE=f"{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}",
+            HTTP_X_CSRFTOKEN=csrf_header,
+        )
+        handler = WSGIHandler()
+
+        def request(method, path):
+            statuses = []
+            response = handler(getattr(factory, method)(path).environ, lambda status, headers: statuses.append(status))
+            response.close()
+            return int(statuses[0].split()[0])
+
+        self.stdout.write(f"engine={settings_dict['ENGINE']}, requests={count}, pool={pool_options}")
+        self.stdout.write(f"{'endpoint':>9} {'backend':>7} {'ms/req':>7} {'connects/req':>13}")
+        try:
+            for name, method, path in endpoints:
+                for backend, (wrapper_cls, backend_settings) in backends.items():
+                    wrapper = wrapper_cls(backend_settings, DEFAULT_DB_ALIAS)
+                    connections[DEFAULT_DB_ALIAS] = wrapper
+                    # 1回目（プールへの接続の作成）は計測に含めない
+                    status = request(method, path)
+                    if status >= 500 or status in (302, 403):
+                        raise CommandError(f"{path}: status={status}")
+                    counter["connects"] = 0
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        request(method, path)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{name:>9} {backend:>7} {elapsed / count * 1e3:>7.2f} {counter['connects'] / count:>13.2f}"
+                    )
+                    wrapper.close()
+            self.stdout.write(f"pool stats: {pool.stats()}")
+        finally:
+            connections[DEFAULT_DB_ALIAS] = original
+            session.delete()
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve, reverse
+
+from coupon.middleware import ClearFlowSessionOnLeaveMiddleware
+
+
+def _legacy_guard(request):
+    """
+    書き換え前の ClearFlowSessionOnLeaveMiddleware の判定（比較用）
+    - リクエストごとに URL を解決し、FLOW_GUARDS を読み、セッションを読み込む
+    """
+    path = request.path_info or "/"
+    try:
+        match = resolve(path)
+        ns = ":".join(match.namespaces) if match.namespaces else ""
+        name = match.url_name
+    except Resolver404:
+        ns, name = None, None
+    for flow in getattr(settings, "FLOW_GUARDS", []):
+        key = flow["session_key"]
+        if key not in request.session:
+            continue
+        if any(path.startswith(pref) for pref in flow.get("ignore_prefixes", ())):
+            continue
+        if not any((ns == allowed_ns and name == allowed_name) for (allowed_ns, allowed_name) in flow.get("allow", [])):
+            request.session.pop(key, None)
+
+
+class Command(BaseCommand):
+    help = (
+        "フロー外への遷移でセッションを掃除するミドルウェアの、書き換え前後の1リクエストあたりの"
+        "処理時間とDBクエリ数を計測する（ビューは実行しない）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="ケースごとのリクエスト数（デフォルト: 2000）")
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        factory = RequestFactory(HTTP_ACCEPT="text/html")
+        middleware = ClearFlowSessionOnLeaveMiddleware(lambda request: HttpResponse())
+
+        session = SessionStore()
+        session["store_id"] = 1
+        session.create()
+        cookies = {settings.SESSION_COOKIE_NAME: session.session_key}
+        some_uuid = "00000000-0000-4000-8000-000000000000"
+        cases = [
+            ("customer page, no cookie", reverse("coupon:coupon_customer_view", args=[some_uuid]), {}),
+            ("staff page, cookie", reverse("coupon:coupon_list"), cookies),
+            ("flow page, cookie", reverse("coupon:coupon_create"), cookies),
+        ]
+
+        self.stdout.write(f"requests={count}")
+        self.stdout.write(f"{'case':>26} {'impl':>7} {'us/req':>8} {'queries/req':>12}")
+        try:
+            for label, path, case_cookies in cases:
+                for impl in ("legacy", "new"):
+                    elapsed, queries = self._measure(factory, middleware, impl, path, case_cookies, count)
+                    self.stdout.write(f"{label:>26} {impl:>7} {elapsed / count * 1e6:>8.1f} {queries / count:>12.2f}")
+        finally:
+            session.delete()
+
+    @staticmethod
+    def _measure(factory, middleware, impl, path, cookies, count):
+        # URL の解決は Django のハンドラがビューの呼び出し前に行うため、新しい実装では計測に含めない
+        match = resolve(path)
+        requests = []
+        for _ in range(count):
+            request = factory.get(path)
+            request.COOKIES.update(cookies)
+            request.session = SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+            request.resolver_match = match
+            requests.append(request)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for request in requests:
+                if impl == "legacy":
+                    _legacy_guard(request)
+                else:
+                    middleware.process_view(request, match.func, match.args, match.kwargs)
+                    middleware(request)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries)
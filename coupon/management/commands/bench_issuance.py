@@ -0,0 +1,91 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from account.models import Store, User
+from coupon.models import Coupon, CouponCode, CouponCounterShard
+
+
+class Command(BaseCommand):
+    help = (
+        "同時に発行する書き込みスレッド数を指定して、CouponCode.issue のスループットを "
+        "分散カウンタなし／ありで比較する（設定中のDBにベンチマーク用の店舗・クーポンを作成する）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=32, help="同時に発行するスレッド数")
+        parser.add_argument("--per-writer", type=int, default=50, help="1スレッドあたりの発行数")
+        parser.add_argument("--shards", type=int, default=16, help="分散カウンタありの場合のスロット数")
+        parser.add_argument(
+            "--max-issuance",
+            type=int,
+            default=None,
+            help="クーポンの発行数の上限（上限の維持も確認する）",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="ベンチマーク用に作成したデータを削除しない",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:12]}@example.com",
+            password=uuid.uuid4().hex,
+        )
+        store = Store.objects.create(user=user, store_name="benchmark")
+        try:
+            for shards in (0, options["shards"]):
+                with override_settings(COUPON_COUNTER_SHARDS=shards):
+                    self.run(store, shards, options)
+        finally:
+            if not options["keep"]:
+                user.delete()
+
+    def run(self, store, shards, options):
+        coupon = Coupon.create(
+            store.id, "benchmark", "-", "-", None, None, options["max_issuance"]
+        )
+        writers = options["writers"]
+        per_writer = options["per_writer"]
+        issued = [0] * writers
+        errors = [0] * writers
+        barrier = threading.Barrier(writers)
+
+        def writer(index):
+            try:
+                barrier.wait()
+                for _ in range(per_writer):
+                    try:
+                        if CouponCode.issue(coupon.id) is not None:
+                            issued[index] += 1
+                    except Exception:
+                        errors[index] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if shards:
+            CouponCounterShard.compact(coupon.id)
+        coupon.refresh_from_db()
+        rows = CouponCode.objects.filter(coupon_id=coupon.id).count()
+        self.stdout.write(
+            f"shards={shards:>3} writers={writers} issued={sum(issued)} errors={sum(errors)} "
+            f"elapsed={elapsed:.2f}s throughput={sum(issued) / elapsed:.1f}/s "
+            f"issued_count={coupon.issued_count} rows={rows}"
+        )
+        if coupon.issued_count != rows:
+            self.stderr.write("issued_count と発行済みコード数が一致しません")
+        if options["max_issuance"] is not None and rows > options["max_issuance"]:
+            self.stderr.write("発行数の上限を超えて発行されました")
@@ -0,0 +1,433 @@
+import contextlib
+import json
+import math
+import platform
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from http.cookies import SimpleCookie
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.middleware.csrf import get_token
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from account.models import Store, User
+from coupon import sharding
+from coupon.models import Coupon, CouponCode, CouponCodePool, CouponCodeSequence, StoreShard
+
+PASSWORD = "Bench-Passw0rd!"
+# 比較する指標（値が大きいほど悪い指標は True）
+COMPARED_METRICS = {
+    "throughput": False,
+    "p50_ms": True,
+    "p95_ms": True,
+    "p99_ms": True,
+    "queries": True,
+}
+_CODE_DETAIL_PATTERN = re.compile(r"/code/(\d+)/")
+# ローカルのDBとみなすホスト（SQLite は常にローカル）
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+
+
+def percentile(sorted_values, rank):
+    """
+    最近接順位法のパーセンタイル（sorted_values は昇順）
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(rank / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def remote_aliases():
+    """
+    ベンチマークのデータを作成・削除するDB（default・シャード）のうち、ローカル以外のDBのエイリアス
+    """
+    aliases = dict.fromkeys([DEFAULT_DB_ALIAS, *sharding.shard_aliases()])
+    return [
+        alias for alias in aliases
+        if connections[alias].vendor != "sqlite" and connections[alias].settings_dict.get("HOST", "") not in LOCAL_HOSTS
+    ]
+
+
+def new_csrf_cookie():
+    """
+    CSRF の Cookie に設定する値（get_token でリクエストに発行したシークレット）
+    """
+    request = RequestFactory().get("/")
+    get_token(request)
+    return request.META["CSRF_COOKIE"]
+
+
+class _Browser:
+    """
+    Cookie（セッション・CSRF）を保持して WSGIHandler を直接呼び出すクライアント
+    - テストクライアントと異なり、リクエストの終了時の接続の後処理（close_old_connections）も本番と同じく実行される
+    """
+
+    def __init__(self, handler, host):
+        self.handler = handler
+        self.cookies = SimpleCookie()
+        self.cookies[settings.CSRF_COOKIE_NAME] = new_csrf_cookie()
+        self.factory = RequestFactory(HTTP_HOST=host)
+
+    def request(self, method, path, data=None, accept="text/html"):
+        extra = {
+            "HTTP_ACCEPT": accept,
+            "HTTP_COOKIE": "; ".join(f"{name}={morsel.value}" for name, morsel in self.cookies.items()),
+            "HTTP_X_CSRFTOKEN": self.cookies[settings.CSRF_COOKIE_NAME].value,
+        }
+        request = getattr(self.factory, method)(path, data or {}, **extra)
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started.append((int(status.split()[0]), headers))
+
+        response = self.handler(request.environ, start_response)
+        try:
+            body = b"".join(response)
+        finally:
+            response.close()
+        status, headers = started[0]
+        location = None
+        for name, value in headers:
+            if name.lower() == "set-cookie":
+                self.cookies.load(value)
+            elif name.lower() == "location":
+                location = value
+        for name, morsel in list(self.cookies.items()):
+            if morsel["max-age"] == "0":
+                del self.cookies[name]
+        return status, location, body
+
+
+class _Recorder:
+    """
+    エンドポイントごとの処理時間・クエリ数・想定外のステータス数を集計する（スレッド間で共有する）
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, elapsed, queries, status, ok):
+        with self.lock:
+            self.samples[endpoint].append((elapsed, queries))
+            self.statuses[endpoint][status] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(elapsed for elapsed, _ in samples)
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": self.errors[endpoint],
+                "throughput": len(samples) / wall_seconds if wall_seconds else 0.0,
+                "mean_ms": sum(latencies) / len(latencies) * 1e3,
+                "p50_ms": percentile(latencies, 50) * 1e3,
+                "p95_ms": percentile(latencies, 95) * 1e3,
+                "p99_ms": percentile(latencies, 99) * 1e3,
+                "queries": sum(queries for _, queries in samples) / len(samples),
+                "statuses": {str(status): count for status, count in sorted(self.statuses[endpoint].items())},
+            }
+        return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "店舗ユーザーのログイン → クーポン作成 → 発行 → お客様向けページの表示 → QR・手動認証を、"
+        "指定した数の仮想ユーザー（スレッド）で同時に実行し、エンドポイントごとのスループット・"
+        "p50/p95/p99 の処理時間・1リクエストあたりのクエリ数を表示する。"
+        "アプリは WSGIHandler をプロセス内で直接呼び出し、設定中のDBを使用する（ネットワーク・外部サービスは不要）。"
+        "設定中のDBに店舗ユーザー・クーポンを作成・削除するため、ローカル以外のDBでは --allow-remote-database が必要。"
+        "--output で結果をJSONに保存し、--compare で保存した結果（ベースライン）と比較する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=4, help="同時に実行する仮想ユーザー（店舗）の数（デフォルト: 4）")
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=25,
+            help="仮想ユーザーごとの発行 → 表示 → 認証の繰り返し回数（デフォルト: 25）",
+        )
+        parser.add_argument(
+            "--views",
+            type=int,
+            default=3,
+            help="発行したクーポンコードごとのお客様向けページの表示回数（デフォルト: 3）",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=2,
+            help="集計に含めない最初の繰り返し回数（テンプレート・キャッシュの準備。デフォルト: 2）",
+        )
+        parser.add_argument("--host", help="リクエストの Host（省略時は ALLOWED_HOSTS の最初のホスト）")
+        parser.add_argument("--output", help="結果を保存するJSONファイル（ベースライン）")
+        parser.add_argument("--compare", help="比較するベースラインのJSONファイル")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            default=None,
+            help="--compare で、いずれかの指標がこの割合（%%）を超えて悪化した場合にエラー終了する",
+        )
+        parser.add_argument("--keep", action="store_true", help="ベンチマーク用に作成したデータを削除しない")
+        parser.add_argument(
+            "--allow-remote-database",
+            action="store_true",
+            help="ローカル以外のDB（SQLite・localhost 以外）にベンチマーク用のデータを作成・削除することを許可する",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("users", "iterations"):
+            if options[name] <= 0:
+                raise CommandError(f"--{name} には1以上を指定してください")
+        if options["views"] < 0 or options["warmup"] < 0:
+            raise CommandError("--views, --warmup には0以上を指定してください")
+        remote = remote_aliases()
+        if remote and not options["allow_remote_database"]:
+            raise CommandError(
+                f"ローカル以外のDB（{', '.join(remote)}）にデータを作成・削除するため実行しません"
+                "（本番のDBでないことを確認し、--allow-remote-database を指定してください）"
+            )
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"ベースラインを読み込めません: {options['compare']}: {e}")
+
+        run_id = uuid.uuid4().hex[:8]
+        stores = self.create_stores(run_id, options["users"])
+        try:
+            recorder, wall_seconds = self.run(stores, run_id, options)
+        finally:
+            if not options["keep"]:
+                self.cleanup(stores)
+
+        result = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "users": options["users"],
+                "iterations": options["iterations"],
+                "views": options["views"],
+                "warmup": options["warmup"],
+                "wall_seconds": wall_seconds,
+                "database": connections["default"].vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "endpoints": recorder.summary(wall_seconds),
+        }
+        self.report(result)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(result, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f"結果を {options['output']} に保存しました")
+        if baseline is not None:
+            worst = self.compare(baseline, result)
+            if options["max_regression"] is not None and worst > options["max_regression"]:
+                raise CommandError(f"ベースラインから {worst:.1f}% 悪化した指標があります（上限: {options['max_regression']}%）")
+
+    def create_stores(self, run_id, count):
+        stores = []
+        for number in range(count):
+            user = User.objects.create_user(email=f"bench-{run_id}-{number}@example.com", password=PASSWORD)
+            stores.append(Store.objects.create(user=user, store_name=f"benchmark {run_id}-{number}"))
+        return stores
+
+    def cleanup(self, stores):
+        for store in stores:
+            with sharding.use_store(store.id):
+                Coupon.objects.filter(store_id=store.id).delete()
+                CouponCodeSequence.objects.filter(store_id=store.id).delete()
+                CouponCodePool.objects.filter(store_id=store.id).delete()
+            if sharding.enabled():
+                StoreShard.objects.using(sharding.DIRECTORY_ALIAS).filter(store_id=store.id).delete()
+            store.user.delete()
+
+    def default_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            host = host.lstrip(".")
+            if host and host != "*":
+                return host
+        return "localhost"
+
+    def run(self, stores, run_id, options):
+        handler = WSGIHandler()
+        host = options["host"] or self.default_host()
+        recorder = _Recorder()
+        failures = []
+        barrier = threading.Barrier(len(stores) + 1)
+
+        def user_thread(number, store):
+            try:
+                barrier.wait()
+                _Scenario(handler, host, recorder, store, f"{run_id}-{number}", options).run()
+            except Exception as e:
+                failures.append(f"store_id={store.id}: {type(e).__name__}: {e}")
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=user_thread, args=(number, store))
+            for number, store in enumerate(stores)
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - started
+        for failure in failures:
+            self.stderr.write(f"仮想ユーザーが中断しました: {failure}")
+        if not recorder.samples:
+            raise CommandError("計測できたリクエストがありません")
+        return recorder, wall_seconds
+
+    def report(self, result):
+        meta = result["meta"]
+        self.stdout.write(
+            f"users={meta['users']} iterations={meta['iterations']} views={meta['views']} "
+            f"database={meta['database']} wall={meta['wall_seconds']:.2f}s"
+        )
+        self.stdout.write(
+            f"{'endpoint':<34} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>8}"
+        )
+        for endpoint, stats in result["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:<34} {stats['requests']:>6} {stats['errors']:>6} {stats['throughput']:>8.1f} "
+                f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['queries']:>8.2f}"
+            )
+
+    def compare(self, baseline, result):
+        """
+        ベースラインとの差（%）を表示し、最も悪化した指標の割合を返す
+        """
+        worst = 0.0
+        self.stdout.write(f"ベースライン（{baseline.get('meta', {}).get('created_at', '-')}）との比較:")
+        for endpoint, stats in result["endpoints"].items():
+            base = baseline.get("endpoints", {}).get(endpoint)
+            if base is None:
+                self.stdout.write(f"{endpoint:<34} ベースラインなし")
+                continue
+            changes = []
+            for metric, higher_is_worse in COMPARED_METRICS.items():
+                before, after = base.get(metric), stats[metric]
+                if not before:
+                    continue
+                change = (after - before) / before * 100
+                regression = change if higher_is_worse else -change
+                worst = max(worst, regression)
+                changes.append(f"{metric} {before:.2f}→{after:.2f} ({change:+.1f}%)")
+            self.stdout.write(f"{endpoint:<34} " + ", ".join(changes))
+        return worst
+
+
+class _Scenario:
+    """
+    1人の仮想ユーザー（店舗）の操作
+    """
+
+    def __init__(self, handler, host, recorder, store, label, options):
+        self.recorder = recorder
+        self.store = store
+        self.label = label
+        self.options = options
+        self.staff = _Browser(handler, host)
+        self.customer = _Browser(handler, host)
+
+    def request(self, browser, method, path, expected, data=None, accept="text/html", record=True):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count))
+            started = time.perf_counter()
+            status, location, body = browser.request(method, path, data, accept)
+            elapsed = time.perf_counter() - started
+        if record:
+            endpoint = f"{method.upper()} {resolve(path).view_name}"
+            self.recorder.add(endpoint, elapsed, queries[0], status, status == expected)
+        return status == expected, location, body
+
+    def run(self):
+        ok, _, _ = self.request(
+            self.staff,
+            "post",
+            reverse("account:login"),
+            302,
+            data={"username": self.store.user.email, "password": PASSWORD},
+        )
+        if not ok:
+            raise RuntimeError("ログインに失敗しました")
+        coupon_id = self.create_coupon()
+        for iteration in range(self.options["warmup"] + self.options["iterations"]):
+            self.lifecycle(coupon_id, iteration, record=iteration >= self.options["warmup"])
+
+    def create_coupon(self):
+        title = f"benchmark {self.label}"
+        self.request(
+            self.staff,
+            "post",
+            reverse("coupon:coupon_create"),
+            302,
+            data={
+                "title": title,
+                "discount": "10% OFF",
+                "target_product": "benchmark",
+                "message": "",
+                "no_max_issuance": "on",
+                "expiration_date": (date.today() + timedelta(days=30)).isoformat(),
+            },
+        )
+        self.request(self.staff, "get", reverse("coupon:coupon_create_confirm"), 200)
+        self.request(self.staff, "post", reverse("coupon:coupon_create_confirm"), 302)
+        with sharding.use_store(self.store.id):
+            coupon_id = Coupon.objects.filter(store_id=self.store.id, title=title).values_list("id", flat=True).first()
+        if coupon_id is None:
+            raise RuntimeError("クーポンを作成できませんでした")
+        return coupon_id
+
+    def lifecycle(self, coupon_id, iteration, record):
+        ok, location, _ = self.request(
+            self.staff, "post", reverse("coupon:coupon_issue", args=[coupon_id]), 302, record=record
+        )
+        match = _CODE_DETAIL_PATTERN.search(location or "") if ok else None
+        if match is None:
+            return
+        # 発行したコードはDBから取得する（計測に含めない）
+        with sharding.use_store(self.store.id):
+            code, code_uuid = CouponCode.objects.values_list("coupon_code", "coupon_uuid").get(id=int(match.group(1)))
+
+        for _ in range(self.options["views"]):
+            self.request(
+                self.customer, "get", reverse("coupon:coupon_customer_view", args=[code_uuid]), 200, record=record
+            )
+        # 手入力とQRコードの読み取りを交互に認証する
+        if iteration % 2:
+            path = reverse("coupon:coupon_verify_manual", args=[code])
+        else:
+            path = reverse("coupon:coupon_verify_qr", args=[code_uuid])
+        self.request(self.staff, "post", path, 200, accept="application/json", record=record)
@@ -0,0 +1,79 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from coupon import qr
+
+
+class Command(BaseCommand):
+    help = (
+        "QRコードの内容の形式ごとの型番・エンコード時間（キャッシュなし）・描画時間と、"
+        "アクセスが一部のクーポンコードに偏る場合の LRU キャッシュのヒット率を計測する（DBは使用しない）"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=200, help="エンコード時間の計測件数（デフォルト: 200）")
+        parser.add_argument("--codes", type=int, default=5000, help="アクセス対象のクーポンコード数（デフォルト: 5000）")
+        parser.add_argument("--requests", type=int, default=50000, help="シミュレーションするリクエスト数（デフォルト: 50000）")
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="アクセスの偏り（Zipf 分布の指数。大きいほど一部のコードに集中する。デフォルト: 1.1）",
+        )
+
+    def handle(self, *args, **options):
+        base_url = settings.COUPON_PUBLIC_BASE_URL.rstrip("/")
+        uuids = [uuid.uuid4() for _ in range(options["samples"])]
+        # QRコードの内容の形式（CouponQrImageView の mode）
+        formats = {
+            "url": lambda value: f"{base_url}/coupon/view/{value}/",
+            "uuid": str,
+            "short": qr.short_url,
+            "compact": qr.compact_payload,
+        }
+
+        self.stdout.write(f"samples={len(uuids)}")
+        self.stdout.write(
+            f"{'mode':>8} {'chars':>6} {'version':>8} {'modules':>8} "
+            f"{'encode ms':>10} {'svg ms':>7} {'png ms':>7}"
+        )
+        for mode, build in formats.items():
+            texts = [build(value) for value in uuids]
+            started = time.perf_counter()
+            matrices = [qr._encode(text) for text in texts]
+            encode_elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            for matrix in matrices:
+                qr.to_svg(matrix)
+            svg_elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            for matrix in matrices:
+                qr.to_png(matrix)
+            png_elapsed = time.perf_counter() - started
+
+            samples = len(texts)
+            size = len(matrices[0])
+            self.stdout.write(
+                f"{mode:>8} {len(texts[0]):>6} {(size - 17) // 4:>8} {size:>8} "
+                f"{encode_elapsed / samples * 1e3:>10.2f} {svg_elapsed / samples * 1e3:>7.2f} "
+                f"{png_elapsed / samples * 1e3:>7.2f}"
+            )
+
+        # Zipf 分布でクーポンコードを選び、キャッシュ経由でエンコードする
+        codes = [qr.short_url(uuid.uuid4()) for _ in range(options["codes"])]
+        weights = [1 / (rank ** options["skew"]) for rank in range(1, len(codes) + 1)]
+        workload = random.choices(codes, weights=weights, k=options["requests"])
+        qr.encode.cache_clear()
+        started = time.perf_counter()
+        for text in workload:
+            qr.encode(text)
+        elapsed = time.perf_counter() - started
+        info = qr.encode.cache_info()
+        self.stdout.write(
+            f"cache: size={info.maxsize}, codes={len(codes)}, requests={len(workload)}, "
+            f"hit rate={info.hits / len(workload):.1%}, {elapsed / len(workload) * 1e3:.2f} ms/request"
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from coupon import query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Coupon / CouponCode のクラスメソッドが発行するクエリの実行計画（EXPLAIN）を、設定中のDBの既存のデータで取得し、"
+        "フルスキャンになっているクエリがあればエラー終了する（更新系のメソッドも実行するため、確認後にロールバックする）。"
+        "テスト用DBでの確認は coupon/tests.py の QueryPlanTests で行う"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plan", action="store_true", help="実行計画をすべて表示する")
+
+    def handle(self, *args, **options):
+        sample = query_plans.find_sample()
+        if sample is None:
+            raise CommandError("未使用の有効なクーポンコードがありません")
+
+        failures = []
+        with transaction.atomic():
+            for name, call in query_plans.access_paths(sample):
+                for sql in query_plans.capture(call):
+                    plan = query_plans.explain(sql)
+                    scans = query_plans.full_scans(plan)
+                    status = "FULL SCAN" if scans else "ok"
+                    self.stdout.write(f"[{status:>9}] {name}: {sql[:100]}")
+                    if options["verbose_plan"] or scans:
+                        for line in plan:
+                            self.stdout.write(f"              {line}")
+                    if scans:
+                        failures.append((name, scans))
+            transaction.set_rollback(True)
+
+        if failures:
+            names = ", ".join(sorted({name for name, _ in failures}))
+            raise CommandError(f"フルスキャンになっているクエリがあります: {names}")
+        self.stdout.write(self.style.SUCCESS("すべてのクエリがインデックスを使用しています"))
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from coupon import sharding
+from coupon.models import CouponCounterShard
+
+
+class Command(BaseCommand):
+    help = (
+        "分散カウンタ（coupon_counter_shards）の発行数・使用数を "
+        "Coupon.issued_count / redeemed_count に集約し、発行可能数を再配分する。"
+        "--loop を指定すると常駐して定期的に集約する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--coupon",
+            type=int,
+            action="append",
+            dest="coupon_ids",
+            help="対象のクーポンID（複数指定可。省略時は未集約の値があるすべてのクーポン）",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="常駐して --interval 秒ごとに集約する",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10,
+            help="--loop 指定時の集約間隔（秒）",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.compact(options["coupon_ids"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def compact(self, coupon_ids):
+        compacted = 0
+        if coupon_ids:
+            for coupon_id in coupon_ids:
+                with sharding.use_coupon(coupon_id):
+                    CouponCounterShard.compact(coupon_id)
+                compacted += 1
+        else:
+            for _ in sharding.each_shard():
+                pending_ids = (
+                    CouponCounterShard.objects
+                    .filter(Q(issued__gt=0) | Q(redeemed__gt=0))
+                    .values_list("coupon_id", flat=True)
+                    .distinct()
+                )
+                for coupon_id in pending_ids:
+                    CouponCounterShard.compact(coupon_id)
+                    compacted += 1
+        self.stdout.write(self.style.SUCCESS(f"{compacted}件のクーポンのカウンタを集約しました"))
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coupon import exports, sharding
+from coupon.models import Coupon
+
+
+class Command(BaseCommand):
+    help = "指定したクーポンのクーポンコードを CSV または JSON Lines で出力する（件数によらずメモリ使用量は一定）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("coupon_id", type=int, help="対象のクーポンID")
+        parser.add_argument(
+            "--format",
+            choices=exports.FORMATS,
+            default="csv",
+            help="出力形式（デフォルト: csv）",
+        )
+        parser.add_argument(
+            "--output",
+            help="出力先のファイル（省略時は標準出力）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="1回のクエリで取得する件数（デフォルト: 2000）",
+        )
+        parser.add_argument(
+            "--base-url",
+            help="お客様向けページのURLのスキーム・ホスト（省略時は COUPON_PUBLIC_BASE_URL）",
+        )
+
+    def handle(self, *args, **options):
+        coupon_id = options["coupon_id"]
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size には1以上を指定してください")
+        with sharding.use_coupon(coupon_id):
+            if not Coupon.objects.filter(id=coupon_id).exists():
+                raise CommandError(f"クーポンが存在しません: coupon_id={coupon_id}")
+            lines = exports.iter_export(
+                coupon_id,
+                options["format"],
+                chunk_size=options["chunk_size"],
+                base_url=options["base_url"],
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                written = self.write_lines(output, lines)
+            # CSV はヘッダー行を除いた件数を表示する
+            if options["format"] == "csv":
+                written -= 1
+            self.stderr.write(f"{written}件のクーポンコードを {options['output']} に出力しました")
+        else:
+            self.write_lines(sys.stdout, lines)
+
+    def write_lines(self, output, lines):
+        """
+        出力して行数を返す（lines は複数行を連結した文字列のため改行の数で数える）
+        """
+        written = 0
+        for line in lines:
+            output.write(line)
+            written += line.count("\n")
+        return written
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coupon import sharding
+from coupon.models import CouponCode
+
+
+class Command(BaseCommand):
+    help = "指定したクーポンのクーポンコードを一括発行する（チラシ印刷などの大量発行用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("coupon_id", type=int, help="発行対象のクーポンID")
+        parser.add_argument("count", type=int, help="発行する件数")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="1トランザクションで登録する件数（デフォルト: 1000）",
+        )
+
+    def handle(self, *args, **options):
+        coupon_id = options["coupon_id"]
+        count = options["count"]
+        chunk_size = options["chunk_size"]
+        if count <= 0:
+            raise CommandError("発行件数には1以上を指定してください")
+        if chunk_size <= 0:
+            raise CommandError("--chunk-size には1以上を指定してください")
+
+        with sharding.use_coupon(coupon_id):
+            issued = CouponCode.issue_batch(coupon_id, count, chunk_size=chunk_size)
+        if issued is None:
+            raise CommandError(f"クーポンが存在しません: coupon_id={coupon_id}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{issued}件のクーポンコードを発行しました（coupon_id={coupon_id}）")
+        )
+        if issued < count:
+            self.stderr.write(
+                f"要求件数 {count} 件のうち {count - issued} 件は発行できませんでした"
+                "（削除済み・有効期限切れ・発行数上限の到達など）"
+            )
@@ -0,0 +1,187 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from account.models import Store
+from coupon import sharding
+from coupon.models import (
+    Coupon,
+    CouponCode,
+    CouponCodePool,
+    CouponCodeSequence,
+    CouponCounterShard,
+    CouponStatBucket,
+    StoreShard,
+)
+
+# 移動するモデルと店舗のデータの条件（コピーはこの順、削除は逆順に行う）
+STORE_MODELS = [
+    (Coupon, "store_id"),
+    (CouponCode, "store_id"),
+    (CouponCodeSequence, "store_id"),
+    (CouponCodePool, "store_id"),
+    (CouponCounterShard, "coupon__store_id"),
+    (CouponStatBucket, "store_id"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "店舗のクーポンデータを別のシャードに移動する（COUPON_SHARDS を指定した場合のみ）。"
+        "移動中はその店舗への書き込みを拒否し、コピー・件数の確認の後に保存先を切り替えてから移動元の行を削除する。"
+        "--status を指定するとシャードごとの店舗数・クーポン数・クーポンコード数を表示する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", action="store_true", help="移動せずにシャードごとの件数のみ表示する")
+        parser.add_argument("--store", type=int, help="移動する店舗ID")
+        parser.add_argument("--to", help="移動先のシャード（COUPON_SHARDS のエイリアス）")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="1回のクエリでコピー・削除する件数（デフォルト: 2000）",
+        )
+        parser.add_argument(
+            "--wait",
+            type=float,
+            default=None,
+            help="保存先の変更を全プロセスに反映させるための待ち時間（秒。デフォルト: COUPON_SHARD_CACHE_TIMEOUT）",
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("シャーディングが無効です（COUPON_SHARDS を指定してください）")
+        if options["status"]:
+            self.show_status()
+            return
+        if options["store"] is None or not options["to"]:
+            raise CommandError("--store と --to を指定してください（または --status）")
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size には1以上を指定してください")
+        target = options["to"]
+        if target not in sharding.shard_aliases():
+            raise CommandError(f"--to には {', '.join(sharding.shard_aliases())} のいずれかを指定してください")
+        store_id = options["store"]
+        placement = sharding.get_placement(store_id)
+        if placement is None:
+            raise CommandError(f"店舗が存在しません: store_id={store_id}")
+        source, moving = placement
+        if moving:
+            raise CommandError(
+                f"店舗は移動中です: store_id={store_id}（中断した場合は移動元 {source} の状態を確認し、"
+                "StoreShard.moving を戻してください）"
+            )
+        if source == target:
+            self.stdout.write(f"store_id={store_id} は既に {target} にあります")
+            return
+        wait = settings.COUPON_SHARD_CACHE_TIMEOUT if options["wait"] is None else options["wait"]
+        self.move(store_id, source, target, options["chunk_size"], wait)
+
+    def show_status(self):
+        self.stdout.write(f"{'shard':>10} {'stores':>8} {'coupons':>10} {'codes':>12}")
+        for alias in sharding.shard_aliases():
+            stores = StoreShard.objects.using(sharding.DIRECTORY_ALIAS).filter(alias=alias).count()
+            coupons = Coupon.objects.using(alias).count()
+            codes = CouponCode.objects.using(alias).count()
+            self.stdout.write(f"{alias:>10} {stores:>8} {coupons:>10} {codes:>12}")
+        unassigned = Store.objects.exclude(
+            id__in=StoreShard.objects.using(sharding.DIRECTORY_ALIAS).values("store_id")
+        ).count()
+        self.stdout.write(f"未登録の店舗（初回の参照時に登録）: {unassigned}")
+
+    def move(self, store_id, source, target, chunk_size, wait):
+        self.stdout.write(f"store_id={store_id}: {source} -> {target}")
+        StoreShard.assign(store_id, moving=True)
+        try:
+            self.wait(wait, "書き込みの停止")
+            self.check_collisions(store_id, source, target, chunk_size)
+            with transaction.atomic(using=target):
+                for model, field in STORE_MODELS:
+                    copied = self.copy(model, {field: store_id}, source, target, chunk_size)
+                    self.stdout.write(f"  {model._meta.db_table}: {copied}件コピーしました")
+                self.verify(store_id, source, target)
+        except BaseException:
+            StoreShard.assign(store_id, moving=False)
+            raise
+
+        # 切り替え後、古い保存先をキャッシュしたプロセスは移動元を読み込むため、反映を待ってから削除する
+        StoreShard.assign(store_id, alias=target, moving=False)
+        self.wait(wait, "保存先の切り替え")
+        for model, field in reversed(STORE_MODELS):
+            self.delete(model, {field: store_id}, source, chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"store_id={store_id} を {target} に移動しました"))
+
+    def wait(self, seconds, label):
+        if seconds > 0:
+            self.stdout.write(f"  {label}の反映を {seconds} 秒待ちます")
+            time.sleep(seconds)
+
+    def check_collisions(self, store_id, source, target, chunk_size):
+        """
+        移動先に同じ id の行（別の店舗の行・前回の移動で残った行）がある場合は中止する
+        """
+        for model, field in STORE_MODELS:
+            if model._base_manager.using(target).filter(**{field: store_id}).exists():
+                raise CommandError(
+                    f"移動先 {target} の {model._meta.db_table} に store_id={store_id} の行が残っています"
+                )
+            for ids in self.iter_ids(model, {field: store_id}, source, chunk_size):
+                if model._base_manager.using(target).filter(pk__in=ids).exists():
+                    raise CommandError(
+                        f"移動先 {target} の {model._meta.db_table} で id が重複しています"
+                        "（シャードの auto_increment_offset を確認してください）"
+                    )
+
+    def iter_ids(self, model, filters, using, chunk_size):
+        last_pk = None
+        queryset = model._base_manager.using(using).filter(**filters).order_by("pk")
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            ids = list(chunk.values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                return
+            yield ids
+            last_pk = ids[-1]
+
+    def copy(self, model, filters, source, target, chunk_size):
+        """
+        主キーを保ったままコピーする
+        - auto_now / auto_now_add の値も保つため、loaddata と同じく raw で挿入する
+        - 生成列（Coupon.sort_priority など）は移動先のDBで計算されるため挿入しない
+        """
+        fields = [field for field in model._meta.concrete_fields if not field.generated]
+        attnames = [field.attname for field in fields]
+        copied = 0
+        for ids in self.iter_ids(model, filters, source, chunk_size):
+            rows = model._base_manager.using(source).filter(pk__in=ids).order_by("pk").values(*attnames)
+            objs = [model(**row) for row in rows]
+            batch_size = connections[target].ops.bulk_batch_size(fields, objs) or len(objs)
+            for start in range(0, len(objs), batch_size):
+                model._base_manager._insert(objs[start:start + batch_size], fields=fields, raw=True, using=target)
+            copied += len(objs)
+        return copied
+
+    def verify(self, store_id, source, target):
+        for model, field in STORE_MODELS:
+            filters = {field: store_id}
+            expected = model._base_manager.using(source).filter(**filters).count()
+            actual = model._base_manager.using(target).filter(**filters).count()
+            if expected != actual:
+                raise CommandError(
+                    f"{model._meta.db_table} の件数が一致しません: {source}={expected}, {target}={actual}"
+                )
+
+    def delete(self, model, filters, source, chunk_size):
+        deleted = 0
+        while True:
+            ids = list(
+                model._base_manager.using(source).filter(**filters).values_list("pk", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            model._base_manager.using(source).filter(pk__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write(f"  {model._meta.db_table}: 移動元から{deleted}件削除しました")
@@ -0,0 +1,105 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from account.models import Store
+from coupon import sharding
+from coupon.models import CouponCodePool
+
+
+class Command(BaseCommand):
+    help = (
+        "事前生成済みクーポンコードの未使用件数が低水位を下回った店舗に補充する。"
+        "--loop を指定すると常駐して定期的に補充する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            type=int,
+            action="append",
+            dest="store_ids",
+            help="対象の店舗ID（複数指定可。省略時は全店舗）",
+        )
+        parser.add_argument(
+            "--low-water",
+            type=int,
+            default=settings.COUPON_CODE_POOL_LOW_WATER,
+            help="未使用件数がこの値を下回った店舗を補充する",
+        )
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=settings.COUPON_CODE_POOL_SIZE,
+            help="補充後の未使用件数",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="補充せずに店舗ごとの未使用件数（プールの深さ）のみ表示する",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="常駐して --interval 秒ごとに補充する",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="--loop 指定時の補充間隔（秒）",
+        )
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.show_stats(options["store_ids"])
+            return
+
+        while True:
+            self.refill(options["store_ids"], options["low_water"], options["size"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def target_store_ids(self, store_ids):
+        if store_ids:
+            return store_ids
+        return list(Store.objects.values_list("id", flat=True))
+
+    def depth(self, store_ids):
+        depth = {}
+        for _ in sharding.each_shard():
+            depth.update(CouponCodePool.depth(store_ids))
+        return depth
+
+    def show_stats(self, store_ids):
+        store_ids = self.target_store_ids(store_ids)
+        depth = self.depth(store_ids)
+        for store_id in store_ids:
+            self.stdout.write(f"store_id={store_id} depth={depth.get(store_id, 0)}")
+        self.stdout.write(f"total={sum(depth.values())}")
+
+    def refill(self, store_ids, low_water, size):
+        purged = 0
+        for _ in sharding.each_shard():
+            purged += CouponCodePool.purge_claimed()
+        store_ids = self.target_store_ids(store_ids)
+        depth = self.depth(store_ids)
+        refilled = 0
+        for store_id in store_ids:
+            if depth.get(store_id, 0) >= low_water:
+                continue
+            try:
+                with sharding.use_store(store_id):
+                    added = CouponCodePool.refill(store_id, size)
+            except sharding.ShardMovingError:
+                self.stderr.write(f"store_id={store_id} は移動中のため補充しませんでした")
+                continue
+            refilled += added
+            self.stdout.write(
+                f"store_id={store_id} depth={depth.get(store_id, 0)} -> {depth.get(store_id, 0) + added}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"{refilled}件補充しました（使用済み {purged}件を削除）")
+        )
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from coupon import sharding
+from coupon.models import Coupon
+
+
+class Command(BaseCommand):
+    help = (
+        "有効期限が切れたクーポンの status を expired に更新する。"
+        "日付が変わった直後（Asia/Tokyo の 0 時過ぎ）に cron などで実行する"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="1回の UPDATE で更新する件数",
+        )
+        parser.add_argument(
+            "--date",
+            help="基準日（YYYY-MM-DD。省略時は TIME_ZONE の今日）",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size には1以上を指定してください")
+        today = timezone.localdate()
+        if options["date"]:
+            try:
+                today = date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date は YYYY-MM-DD 形式で指定してください")
+
+        swept = 0
+        for _ in sharding.each_shard():
+            swept += Coupon.sweep_expired(today=today, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"{swept}件のクーポンを期限切れにしました（基準日: {today}）"))
@@ -1,4 +1,28 @@
-from django.urls import resolve, Resolver404
+from collections import namedtuple
+
+from django.conf import settings
+
+# settings.FLOW_GUARDS の1件を起動時に変換したもの
+# - allow は (namespace, url_name) の frozenset
+FlowGuard = namedtuple("FlowGuard", ["session_key", "ignore_prefixes", "allow"])
+
+
+def compile_flow_guards(flow_guards):
+    """
+    settings.FLOW_GUARDS をリクエストごとの判定に使う形に変換する
+    Args:
+        flow_guards (list[dict]): {"session_key", "ignore_prefixes", "allow"} のリスト
+    Returns:
+        tuple[FlowGuard, ...]: 変換後のフロー
+    """
+    return tuple(
+        FlowGuard(
+            session_key=flow["session_key"],
+            ignore_prefixes=tuple(flow.get("ignore_prefixes", ())),
+            allow=frozenset((ns, name) for (ns, name) in flow.get("allow", ())),
+        )
+        for flow in flow_guards
+    )
 
 
 class ClearFlowSessionOnLeaveMiddleware:
@@ -6,52 +30,46 @@ class ClearFlowSessionOnLeaveMiddleware:
     - HTMLページ遷移のGETだけを見る（XHR/静的ファイルを除外）
     - 現在のURLがフローのallowリスト外なら、該当セッションキーをpopする
     - 複数フローに対応
+    - FLOW_GUARDS は起動時に変換し、URLの判定は URL 解決の結果（request.resolver_match）を使う
+    - セッションCookieのないリクエストはセッションを読み込まない（フローの途中ではありえないため）
     """
     def __init__(self, get_response):
         self.get_response = get_response
+        self.flow_guards = compile_flow_guards(getattr(settings, "FLOW_GUARDS", []))
+        self.session_cookie_name = settings.SESSION_COOKIE_NAME
 
     def __call__(self, request):
+        response = self.get_response(request)
+        # ルーティング外（404）の場合は process_view が呼ばれないため、ここでフロー外として扱う
+        if request.resolver_match is None and self._is_target(request):
+            self._clear(request, None, None)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._is_target(request):
+            match = request.resolver_match
+            self._clear(request, ":".join(match.namespaces), match.url_name)
+        return None
+
+    def _is_target(self, request):
         # ---- 判定: ナビゲーションっぽいリクエストだけを対象 ----
-        is_get = request.method == "GET"
-        accept = request.headers.get("Accept", "")
-        is_page_nav = "text/html" in accept  # ページ遷移(HTML)に限定
-        is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest"
-        path = request.path_info or "/"
+        return (
+            self.flow_guards
+            and request.method == "GET"
+            and self.session_cookie_name in request.COOKIES
+            and "text/html" in request.headers.get("Accept", "")  # ページ遷移(HTML)に限定
+            and request.headers.get("X-Requested-With") != "XMLHttpRequest"
+        )
 
-        if is_get and is_page_nav and not is_ajax:
-            # 静的配信などは対象外
-            for cfg in getattr(request, "FLOW_GUARDS", None) or []:
-                pass  # (型ヒント対策用ダミー)
-
-            try:
-                match = resolve(path)
-                ns = ":".join(match.namespaces) if match.namespaces else ""
-                name = match.url_name
-            except Resolver404:
-                # ルーティング外 = フロー外とみなす（例えば404ページへ）
-                ns, name = None, None
-
-            from django.conf import settings
-            flow_guards = getattr(settings, "FLOW_GUARDS", [])
-
-            for flow in flow_guards:
-                key = flow["session_key"]
-                if key not in request.session:
-                    continue  # このフローの途中ではない
-
-                # 静的プレフィックスは常に無視
-                if any(path.startswith(pref) for pref in flow.get("ignore_prefixes", ())):
-                    continue
-
-                # 現在地がフロー内か？
-                allow = flow.get("allow", [])
-                in_flow = any(
-                    (ns == allowed_ns and name == allowed_name)
-                    for (allowed_ns, allowed_name) in allow
-                )
-
-                if not in_flow:
-                    # フロー外に出たのでセッションを掃除
-                    request.session.pop(key, None)
-
-        return self.get_response(request)
\ No newline at end of file
+    def _clear(self, request, ns, name):
+        path = request.path_info or "/"
+        for flow in self.flow_guards:
+            # 静的プレフィックスは常に無視
+            if path.startswith(flow.ignore_prefixes):
+                continue
+            # 現在地がフロー内か？
+            if (ns, name) in flow.allow:
+                continue
+            # フロー外に出たのでセッションを掃除（キーがなければ何もしない）
+            if flow.session_key in request.session:
+                request.session.pop(flow.session_key, None)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupon', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_id', models.BigIntegerField(unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Coupon code sequence',
+                'verbose_name_plural': 'Coupon code sequences',
+                'db_table': 'coupon_code_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupon', '0002_coupon_code_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponCodePool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_id', models.BigIntegerField()),
+                ('coupon_code', models.CharField(editable=False, max_length=6)),
+                ('claimed_at', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Coupon code pool',
+                'verbose_name_plural': 'Coupon code pool',
+                'db_table': 'coupon_code_pool',
+                'indexes': [models.Index(fields=['store_id', 'claimed_at'], name='pool_store_claimed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('store_id', 'coupon_code'), name='unique_store_poolcode')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupon', '0003_coupon_code_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('issued', models.IntegerField(default=0)),
+                ('redeemed', models.IntegerField(default=0)),
+                ('quota', models.IntegerField(null=True)),
+                ('coupon', models.ForeignKey(db_column='coupon_id', on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='coupon.coupon')),
+            ],
+            options={
+                'verbose_name': 'Coupon counter shard',
+                'verbose_name_plural': 'Coupon counter shards',
+                'db_table': 'coupon_counter_shards',
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'slot'), name='unique_coupon_counter_slot')],
+            },
+        ),
+    ]
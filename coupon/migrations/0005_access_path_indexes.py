@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_alter_store_user'),
+        ('coupon', '0004_coupon_counter_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['store', 'deleted_at', 'expiration_date'], name='coupon_store_active_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:22
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def backfill_status(apps, schema_editor):
+    """
+    既存のクーポンの status を削除日時・有効期限・発行数から設定する
+    """
+    Coupon = apps.get_model('coupon', 'Coupon')
+    today = timezone.localdate()
+    Coupon.objects.filter(
+        deleted_at__isnull=True,
+        max_issuance__isnull=False,
+        max_issuance__lte=F('issued_count'),
+    ).update(status='exhausted')
+    Coupon.objects.filter(
+        deleted_at__isnull=True,
+        expiration_date__lt=today,
+    ).update(status='expired')
+    Coupon.objects.filter(deleted_at__isnull=False).update(status='deleted')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_alter_store_user'),
+        ('coupon', '0005_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='coupon',
+            name='coupon_store_active_idx',
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='status',
+            field=models.CharField(choices=[('active', '有効'), ('exhausted', '発行上限到達'), ('expired', '期限切れ'), ('deleted', '削除済み')], default='active', editable=False, max_length=16),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['store', 'status'], name='coupon_store_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['status', 'expiration_date'], name='coupon_status_expiry_idx'),
+        ),
+    ]
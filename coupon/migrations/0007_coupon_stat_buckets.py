@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupon', '0006_coupon_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponStatBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_id', models.BigIntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('issued', models.IntegerField(default=0)),
+                ('redeemed', models.IntegerField(default=0)),
+                ('coupon', models.ForeignKey(db_column='coupon_id', on_delete=django.db.models.deletion.CASCADE, related_name='stat_buckets', to='coupon.coupon')),
+            ],
+            options={
+                'verbose_name': 'Coupon stat bucket',
+                'verbose_name_plural': 'Coupon stat buckets',
+                'db_table': 'coupon_stat_buckets',
+                'indexes': [models.Index(fields=['store_id', 'bucket_start'], name='stat_store_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('coupon', 'bucket_start'), name='unique_coupon_stat_bucket')],
+            },
+        ),
+    ]
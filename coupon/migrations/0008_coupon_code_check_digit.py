@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupon', '0007_coupon_stat_buckets'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='couponcode',
+            name='coupon_code',
+            field=models.CharField(editable=False, max_length=7),
+        ),
+        migrations.AlterField(
+            model_name='couponcodepool',
+            name='coupon_code',
+            field=models.CharField(editable=False, max_length=7),
+        ),
+    ]
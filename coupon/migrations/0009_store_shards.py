@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_alter_store_user'),
+        ('coupon', '0008_coupon_code_check_digit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreShard',
+            fields=[
+                ('store_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('alias', models.CharField(max_length=64)),
+                ('moving', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Store shard',
+                'verbose_name_plural': 'Store shards',
+                'db_table': 'coupon_store_shards',
+            },
+        ),
+    ]
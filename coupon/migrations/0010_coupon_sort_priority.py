@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_alter_store_user'),
+        ('coupon', '0009_store_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='sort_priority',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(status='deleted', then=models.Value(4)), models.When(status='expired', then=models.Value(3)), models.When(expiration_date__isnull=True, then=models.Value(1)), models.When(status='exhausted', then=models.Value(2)), default=models.Value(0)), output_field=models.SmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['store', 'sort_priority', '-expiration_date', '-id'], name='coupon_store_list_order_idx'),
+        ),
+    ]
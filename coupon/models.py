@@ -1,14 +1,172 @@
 import logging
-import string
 import random
+import time
 import uuid
-from django.db.models import F
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour
 from django.utils import timezone
 
-from django.db import models, DatabaseError, IntegrityError, transaction
+from django.db import models, DatabaseError, IntegrityError, OperationalError
+
+from account.models import Store
+
+
+from . import code_filter, page_cache, sharding
+from .codes import CODE_CHARS, check_digit_enabled, code_space, permute_code, with_check_char
 
 logger = logging.getLogger(__name__)
 
+# クーポンコードの使用（redeem）を、ロックの競合（デッドロック・ロック待ちのタイムアウト）でやり直す回数
+REDEEM_LOCK_RETRIES = 5
+
+
+def is_lock_contention(error):
+    """
+    ロックの競合によるエラーか（MySQL: 1205 ロック待ちのタイムアウト / 1213 デッドロック、
+    SQLite: database is locked / database table is locked）
+    """
+    code = error.args[0] if error.args else None
+    return code in (1205, 1213) or "is locked" in str(error)
+
+
+class RedeemStatus(models.TextChoices):
+    SUCCESS = "success", "使用済みにしました"
+    NOT_FOUND = "not_found", "無効なクーポンコードです"
+    ALREADY_REDEEMED = "already_redeemed", "このクーポンは既に使用されています"
+    DELETED = "deleted", "このクーポンは終了しています"
+    EXPIRED = "expired", "このクーポンは有効期限切れです"
+
+
+class CouponStatus(models.TextChoices):
+    """
+    クーポンの状態（Coupon.status に保存する）
+    - 発行・使用・論理削除の各処理と sweep_coupon_status コマンドで更新する
+    """
+    ACTIVE = "active", "有効"
+    EXHAUSTED = "exhausted", "発行上限到達"
+    EXPIRED = "expired", "期限切れ"
+    DELETED = "deleted", "削除済み"
+
+    @classmethod
+    def listed(cls):
+        """一覧に表示する（論理削除されていない）状態"""
+        return [cls.ACTIVE, cls.EXHAUSTED, cls.EXPIRED]
+
+    @classmethod
+    def derive(cls, deleted_at, expiration_date, max_issuance, issued_count, today=None):
+        """
+        削除日時・有効期限・発行数から状態を求める
+        """
+        today = today or timezone.localdate()
+        if deleted_at is not None:
+            return cls.DELETED
+        if expiration_date is not None and expiration_date < today:
+            return cls.EXPIRED
+        if max_issuance is not None and max_issuance <= issued_count:
+            return cls.EXHAUSTED
+        return cls.ACTIVE
+
+
+@dataclass(frozen=True)
+class RedeemResult:
+    """
+    CouponCode.redeem の処理結果
+    Attributes:
+        status(RedeemStatus): 処理結果の種別
+        coupon_code(CouponCode | None): 対象のクーポンコード（見つからない場合は None）
+        coupon(Coupon | None): 対象のクーポン（見つからない場合は None）
+    """
+    status: str
+    coupon_code: "CouponCode | None" = None
+    coupon: "Coupon | None" = None
+
+    @property
+    def success(self):
+        return self.status == RedeemStatus.SUCCESS
+
+
+@dataclass(frozen=True)
+class CouponState:
+    """
+    クーポンの発行・詳細表示・削除の可否判定に必要な情報（Coupon.get_state の戻り値）
+    Attributes:
+        coupon_id(int): クーポンID
+        store_id(int): 店舗ID
+        store_user_id(UUID): クーポンを所有する店舗ユーザーのID
+        store_name(str): 店舗名
+        deleted_at(datetime | None): 削除日時
+        expiration_date(date | None): 有効期限
+        max_issuance(int | None): 発行数の上限
+        issued_count(int): 発行数
+        status(CouponStatus): 保存されているクーポンの状態
+    """
+    coupon_id: int
+    store_id: int
+    store_user_id: uuid.UUID
+    store_name: str
+    deleted_at: datetime | None
+    expiration_date: date | None
+    max_issuance: int | None
+    issued_count: int
+    status: str = CouponStatus.ACTIVE
+
+    @classmethod
+    def from_coupon(cls, coupon):
+        """
+        store を取得済みの Coupon インスタンスから CouponState を作成する
+        """
+        return cls(
+            coupon_id=coupon.id,
+            store_id=coupon.store_id,
+            store_user_id=coupon.store.user_id,
+            store_name=coupon.store.store_name,
+            deleted_at=coupon.deleted_at,
+            expiration_date=coupon.expiration_date,
+            max_issuance=coupon.max_issuance,
+            issued_count=coupon.issued_count,
+            status=coupon.status,
+        )
+
+    def is_owned_by(self, user_id):
+        """ログインユーザーがクーポンを所有する店舗ユーザーか"""
+        return self.store_user_id == user_id
+
+    @property
+    def is_deleted(self):
+        """削除済みか"""
+        return self.status == CouponStatus.DELETED or self.deleted_at is not None
+
+    def is_expired(self, today=None):
+        """
+        有効期限切れか
+        - 日付が変わってから sweep_coupon_status が実行されるまでの間は有効期限でも判定する
+        """
+        if self.status == CouponStatus.EXPIRED:
+            return True
+        today = today or timezone.localdate()
+        return self.expiration_date is not None and self.expiration_date < today
+
+    @property
+    def is_exhausted(self):
+        """
+        発行数の上限に達しているか
+        - 分散カウンタの集約前は status に反映されないため発行数でも判定する
+        """
+        if self.status == CouponStatus.EXHAUSTED:
+            return True
+        return self.max_issuance is not None and self.max_issuance <= self.issued_count
+
+    def can_issue(self, today=None):
+        """発行可能か（削除済み・有効期限切れ・発行数上限のいずれにも該当しない）"""
+        return not (self.is_deleted or self.is_expired(today) or self.is_exhausted)
+
+    def can_delete(self, today=None):
+        """削除可能か（未削除 かつ 未発行または有効期限切れ）"""
+        return not self.is_deleted and (self.issued_count == 0 or self.is_expired(today))
+
 
 class Coupon(models.Model):
     store = models.ForeignKey(
@@ -16,6 +174,8 @@ class Coupon(models.Model):
         on_delete=models.CASCADE,
         related_name='coupons',
         db_column='store_id',
+        # シャーディング（coupon.sharding）が有効な場合、店舗はディレクトリの別のDBにあるため、
+        # ディレクトリ以外のシャードでは外部キー制約を検査しない（coupon.sharding.disable_shard_fk_checks）
     )
     title = models.CharField(max_length=255)
     discount = models.CharField(max_length=255)
@@ -26,6 +186,26 @@ class Coupon(models.Model):
     redeemed_count = models.IntegerField(default=0, editable=False)
     issued_count = models.IntegerField(default=0, editable=False)
     deleted_at = models.DateTimeField(null=True)
+    status = models.CharField(
+        max_length=16,
+        choices=CouponStatus.choices,
+        default=CouponStatus.ACTIVE,
+        editable=False,
+    )
+    # 一覧の並び順（CouponListView）。status・有効期限から計算した値をDBに保存し、インデックスで並び替える
+    # 0: 期限内・上限未達 / 1: 無期限 / 2: 期限内・上限到達 / 3: 期限切れ / 4: 削除済み（一覧に表示しない）
+    # （期限切れ・上限到達は sweep_coupon_status・分散カウンタの集約で status が更新された時点で反映される）
+    sort_priority = models.GeneratedField(
+        expression=models.Case(
+            models.When(status=CouponStatus.DELETED, then=Value(4)),
+            models.When(status=CouponStatus.EXPIRED, then=Value(3)),
+            models.When(expiration_date__isnull=True, then=Value(1)),
+            models.When(status=CouponStatus.EXHAUSTED, then=Value(2)),
+            default=Value(0),
+        ),
+        output_field=models.SmallIntegerField(),
+        db_persist=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
@@ -33,6 +213,23 @@ class Coupon(models.Model):
         db_table = "coupons"
         verbose_name = "Coupon"
         verbose_name_plural = "Coupons"
+        indexes = [
+            # 店舗ごとの未削除クーポン一覧（get_coupon_list）
+            models.Index(
+                fields=['store', 'status'],
+                name='coupon_store_status_idx'
+            ),
+            # 有効期限切れの掃き出し（sweep_expired）
+            models.Index(
+                fields=['status', 'expiration_date'],
+                name='coupon_status_expiry_idx'
+            ),
+            # 店舗ごとのクーポン一覧の並び順・キーセットによるページング（CouponListView）
+            models.Index(
+                fields=['store', 'sort_priority', '-expiration_date', '-id'],
+                name='coupon_store_list_order_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.store.store_name})"
@@ -54,7 +251,7 @@ class Coupon(models.Model):
             raise: 作成に失敗した場合（DBエラー、例外発生など）
         """
         try:
-            with transaction.atomic():
+            with sharding.atomic():
                 coupon = cls.objects.create(
                     store_id=store_id,
                     title=title,
@@ -63,6 +260,7 @@ class Coupon(models.Model):
                     message=message,
                     expiration_date=expiration_date,
                     max_issuance=max_issuance,
+                    status=CouponStatus.derive(None, expiration_date, max_issuance, 0),
                 )
             return coupon
         except DatabaseError as e:
@@ -87,12 +285,16 @@ class Coupon(models.Model):
             raise: 作成に失敗した場合（DBエラー、例外発生など）
         """
         try:
-            with transaction.atomic():
+            with sharding.atomic():
+                now = timezone.now()
                 deleted = (
                     cls.objects
                     .filter(id=coupon_id, deleted_at__isnull=True)
-                    .update(deleted_at=timezone.now())
+                    .update(deleted_at=now, status=CouponStatus.DELETED, updated_at=now)
                 )
+                if deleted:
+                    # お客様向けページのキャッシュを無効化する
+                    sharding.on_commit(lambda: page_cache.invalidate_coupon(coupon_id))
             return deleted
         except DatabaseError as e:
             logger.error(
@@ -119,6 +321,10 @@ class Coupon(models.Model):
             Exception: その他の予期しないエラーが発生した場合
         """
         try:
+            if sharding.enabled():
+                # 店舗はディレクトリのDBにあるため結合しない
+                store_id = cls.objects.values_list('store_id', flat=True).get(id=coupon_id)
+                return Store.objects.values_list('user_id', flat=True).filter(id=store_id).first()
             user_id = (
                 cls.objects
                 .values_list('store__user_id', flat=True)
@@ -141,6 +347,171 @@ class Coupon(models.Model):
             )
             raise
 
+    @classmethod
+    def increment_issued(cls, coupon_id):
+        """
+        発行数を +1 する（有効な状態でない場合・発行数の上限を超える場合は更新しない）
+        - 上限に達した場合は status を exhausted にする
+        - COUPON_COUNTER_SHARDS が有効な場合は分散カウンタを更新する
+        Args:
+            coupon_id (int): クーポンID
+        Returns:
+            bool: 更新した場合 True、発行数の上限に達している場合 False
+        """
+        if CouponCounterShard.enabled():
+            return CouponCounterShard.increment(coupon_id, "issued")
+        updated = (
+            cls.objects
+            .filter(id=coupon_id, status=CouponStatus.ACTIVE)
+            .filter(Q(max_issuance__isnull=True) | Q(max_issuance__gt=F("issued_count")))
+            .update(**cls.issued_count_update(1))
+        )
+        return updated > 0
+
+    @staticmethod
+    def issued_count_update(delta):
+        """
+        発行数を delta 件加算し、加算後の発行数に合わせて status を更新する UPDATE の値
+        - MySQL は SET 句を左から順に評価する（更新後の値を参照する）ため、
+          status を issued_count より先に置き、どのDBでも更新前の発行数で判定させる
+        Args:
+            delta (int): 加算する件数（負の場合は確保した発行数を戻す）
+        Returns:
+            dict: QuerySet.update に渡す値
+        """
+        exhausted = Q(max_issuance__isnull=False, max_issuance__lte=F("issued_count") + delta)
+        return {
+            "status": models.Case(
+                models.When(
+                    Q(status__in=[CouponStatus.ACTIVE, CouponStatus.EXHAUSTED]) & exhausted,
+                    then=Value(CouponStatus.EXHAUSTED),
+                ),
+                models.When(
+                    status=CouponStatus.EXHAUSTED,
+                    then=Value(CouponStatus.ACTIVE),
+                ),
+                default=F("status"),
+            ),
+            "issued_count": F("issued_count") + delta,
+        }
+
+    @classmethod
+    def sweep_expired(cls, today=None, chunk_size=1000):
+        """
+        有効期限が切れたクーポンの status を expired にする（sweep_coupon_status コマンド用）
+        - (status, expiration_date) のインデックスで対象を id 順に chunk_size 件ずつ取得し、
+          チャンクごとに1回の UPDATE で更新する
+        Args:
+            today (date): 基準日（省略時は TIME_ZONE の今日）
+            chunk_size (int): 1回の UPDATE で更新する件数
+        Returns:
+            int: 更新した件数
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        today = today or timezone.localdate()
+        live = [CouponStatus.ACTIVE, CouponStatus.EXHAUSTED]
+        swept = 0
+        last_id = 0
+        try:
+            while True:
+                ids = list(
+                    cls.objects
+                    .filter(status__in=live, expiration_date__lt=today, id__gt=last_id)
+                    .order_by("id")
+                    .values_list("id", flat=True)[:chunk_size]
+                )
+                if not ids:
+                    break
+                swept += (
+                    cls.objects
+                    .filter(id__in=ids, status__in=live, expiration_date__lt=today)
+                    .update(status=CouponStatus.EXPIRED)
+                )
+                last_id = ids[-1]
+            return swept
+        except DatabaseError as e:
+            logger.error(
+                f"[Coupon][SweepExpired] Database error: swept={swept}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[Coupon][SweepExpired] Unexpected error: swept={swept}, error={e}"
+            )
+            raise
+
+    @classmethod
+    def with_live_counts(cls, queryset):
+        """
+        分散カウンタの未集約分を含めた発行数・使用数を
+        live_issued_count, live_redeemed_count として付与する
+        Args:
+            queryset (QuerySet): Coupon のクエリセット
+        Returns:
+            QuerySet: live_issued_count, live_redeemed_count を付与したクエリセット
+        """
+        if not CouponCounterShard.enabled():
+            return queryset.annotate(
+                live_issued_count=F("issued_count"),
+                live_redeemed_count=F("redeemed_count"),
+            )
+        return queryset.annotate(
+            live_issued_count=F("issued_count") + CouponCounterShard.pending("issued"),
+            live_redeemed_count=F("redeemed_count") + CouponCounterShard.pending("redeemed"),
+        )
+
+    @classmethod
+    def get_state(cls, coupon_id):
+        """
+        指定されたクーポンIDに対応するクーポンの状態（店舗・所有者・削除日時・有効期限・発行数・状態・店舗名）を
+        店舗と結合した1クエリで取得する
+        Args:
+            coupon_id (int): 取得対象のクーポンID
+        Returns:
+            CouponState: 存在する場合、クーポンの状態
+            None: 存在しない場合
+        Raises:
+            DatabaseError: データベース操作中にエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        try:
+            fields = ["store_id", "deleted_at", "expiration_date", "max_issuance", "live_issued_count", "status"]
+            if sharding.enabled():
+                # 店舗はディレクトリのDBにあるため結合せず、店舗IDから取得する
+                row = cls.with_live_counts(cls.objects.all()).values(*fields).get(id=coupon_id)
+                store = Store.objects.values("user_id", "store_name").get(id=row["store_id"])
+                row["store_user_id"] = store["user_id"]
+                row["store_name"] = store["store_name"]
+            else:
+                row = (
+                    cls.with_live_counts(cls.objects.all())
+                    .values(
+                        *fields,
+                        store_user_id=F("store__user_id"),
+                        store_name=F("store__store_name"),
+                    )
+                    .get(id=coupon_id)
+                )
+            row["issued_count"] = row.pop("live_issued_count")
+            return CouponState(coupon_id=coupon_id, **row)
+        except cls.DoesNotExist:
+            logger.warning(
+                f"[Coupon][StateFetch] Not found: coupon_id={coupon_id}"
+            )
+            return None
+        except DatabaseError as e:
+            logger.error(
+                f"[Coupon][StateFetch] Database error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[Coupon][StateFetch] Unexpected error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+
     @classmethod
     def get_for_delete_check(cls, coupon_id):
         """
@@ -266,11 +637,13 @@ class Coupon(models.Model):
             Exception: 上記以外の予期しないエラーが発生した場合
         """
         try:
-            coupon = (
-                cls.objects
-                .select_related("store")
-                .get(id=coupon_id)
-            )
+            queryset = cls.objects.using(sharding.read_alias())
+            if not sharding.enabled():
+                # シャーディングが有効な場合、店舗は参照時にディレクトリから取得する
+                queryset = queryset.select_related("store")
+            coupon = cls.with_live_counts(queryset).get(id=coupon_id)
+            coupon.issued_count = coupon.live_issued_count
+            coupon.redeemed_count = coupon.live_redeemed_count
             return coupon
         except cls.DoesNotExist:
             logger.warning(
@@ -303,8 +676,8 @@ class Coupon(models.Model):
         """
         try:
             coupon = (
-                cls.objects
-                .filter(store=store_id, deleted_at__isnull=True)
+                cls.objects.using(sharding.read_alias())
+                .filter(store=store_id, status__in=CouponStatus.listed())
             )
             return coupon
         except cls.DoesNotExist:
@@ -332,7 +705,8 @@ class CouponCode(models.Model):
         related_name='coupon_codes',
         db_column='coupon_id',
     )
-    coupon_code = models.CharField(max_length=6, editable=False)
+    # チェック文字付きのコード（本体6文字 + 1文字）を格納できるよう7文字
+    coupon_code = models.CharField(max_length=7, editable=False)
     coupon_uuid = models.UUIDField(
         default=uuid.uuid4,
         editable=False,
@@ -357,23 +731,54 @@ class CouponCode(models.Model):
         return f"{self.coupon_code} ({self.coupon.title})"
 
     @staticmethod
-    def generate_code(length=6):
+    def generate_code(length=6, check_digit=None):
         """
         指定された長さのランダムなクーポンコードを生成する
         Args:
             length (int): 生成するクーポンコードの文字数（デフォルト: 6）
+            check_digit (bool): 末尾にチェック文字を付ける場合は True（None の場合は COUPON_CODE_CHECK_DIGIT に従う）
+        Returns:
+            str: 英大文字と数字からなるランダムなクーポンコード（チェック文字付きの場合は length + 1 文字）
+        """
+        code = ''.join(random.choices(CODE_CHARS, k=length))
+        if check_digit is None:
+            check_digit = check_digit_enabled()
+        return with_check_char(code) if check_digit else code
+
+    @classmethod
+    def next_codes(cls, store_id, count=1, length=6):
+        """
+        設定（COUPON_CODE_GENERATOR）に応じた方式でクーポンコードの候補を生成する
+        - "random": ランダムに生成する（重複は一意制約とリトライで解決する）
+        - "permutation": 店舗ごとの連番を鍵付きの置換で並べ替えて生成する
+          （同じ店舗内では構造上重複しないため、1回の INSERT で発行できる）
+        COUPON_CODE_CHECK_DIGIT = True の場合は、いずれの方式でも末尾にチェック文字を付ける
+        Args:
+            store_id (int): 店舗ID
+            count (int): 生成する件数
+            length (int): クーポンコードの文字数
         Returns:
-            str: 英大文字と数字からなるランダムなクーポンコード
+            list[str]: クーポンコードの候補（連番を使い切った場合は count 件未満）
         """
-        chars = string.ascii_uppercase + string.digits
-        return ''.join(random.choices(chars, k=length))
+        mode = getattr(settings, "COUPON_CODE_GENERATOR", "random")
+        if mode == "permutation":
+            start, allocated = CouponCodeSequence.allocate(store_id, count, length)
+            codes = [
+                permute_code(store_id, counter, length)
+                for counter in range(start, start + allocated)
+            ]
+            return [with_check_char(code) for code in codes] if check_digit_enabled() else codes
+        return [cls.generate_code(length) for _ in range(count)]
 
     @classmethod
-    def issue(cls, coupon_id, length=6, max_retries=10):
+    def issue(cls, coupon_id, length=6, max_retries=10, state=None):
         """
         指定されたクーポンIDに対応するクーポンコードを発行する
+        - 発行できる状態か（削除済み・有効期限切れ・発行数の上限）は、発行数の条件付きUPDATE（increment_issued）で
+          発行と同じトランザクション内で判定する
         Args:
             coupon_id(int): 発行対象のクーポンID
+            state(CouponState): 呼び出し元で取得済みのクーポンの状態（指定した場合はクーポンを取得しない）
         Returns:
             coupon_code: 存在すれば CouponCode インスタンス（store情報付き）
             None: クーポンが存在しない場合、リトライ上限に達した場合、その他のDBエラー
@@ -381,29 +786,62 @@ class CouponCode(models.Model):
             DatabaseError: データベース操作に失敗した場合
             Exception: 予期しないエラーが発生した場合
         """
-        try:
-            coupon = Coupon.objects.get(id=coupon_id)
-        except Coupon.DoesNotExist:
+        if state is not None:
+            store_id = state.store_id
+        else:
+            store_id = Coupon.objects.filter(id=coupon_id).values_list("store_id", flat=True).first()
+        if store_id is None:
             logger.warning(
                 f"[CouponCode][Issue] Not found: coupon_id={coupon_id}"
             )
             return None
+
+        # 事前生成済みのコードがあれば使用し、なければ従来どおり生成する
+        pooled_code = None
+        if getattr(settings, "COUPON_CODE_POOL_ENABLED", False) and length == CouponCodePool.CODE_LENGTH:
+            pooled_code = CouponCodePool.claim(store_id)
+
         for _ in range(max_retries):
-            code = cls.generate_code(length)
+            from_pool = pooled_code is not None
+            if from_pool:
+                code, pooled_code = pooled_code, None
+            else:
+                codes = cls.next_codes(store_id, 1, length)
+                if not codes:
+                    break
+                code = codes[0]
             try:
-                with transaction.atomic():
+                with sharding.atomic():
                     # クーポンコード発行
                     coupon_code = cls.objects.create(
-                        coupon=coupon,
-                        store_id=coupon.store_id,
-                        coupon_code=code
+                        coupon_id=coupon_id,
+                        store_id=store_id,
+                        coupon_code=code,
+                        coupon_uuid=sharding.new_code_uuid(store_id),
                     )
-                    # 発行数を +1
-                    Coupon.objects.filter(id=coupon_id).update(
-                        issued_count=F('issued_count') + 1
+                    # 発行数を +1（発行数の上限に達している場合は発行を取り消す）
+                    if Coupon.increment_issued(coupon_id):
+                        CouponStatBucket.record(coupon_id, store_id, issued=1)
+                        sharding.on_commit(lambda: code_filter.add(
+                            store_id, [(coupon_code.coupon_code, coupon_code.coupon_uuid)]
+                        ))
+                    else:
+                        sharding.set_rollback(True)
+                        coupon_code = None
+                if coupon_code is None:
+                    # 確保した事前生成済みのコードは使用していないため未使用に戻す
+                    if from_pool:
+                        CouponCodePool.release(store_id, code)
+                    logger.warning(
+                        f"[CouponCode][Issue] Issuance limit reached: coupon_id={coupon_id}"
                     )
-                    return coupon_code
+                    return None
+                return coupon_code
             except IntegrityError:
+                # 事前生成済みのコードが発行済みのコードと重複した場合は確保したまま（使用済み）にし、
+                # それ以外の重複（クーポンコードUUID）の場合は未使用に戻す
+                if from_pool and not cls.objects.filter(store_id=store_id, coupon_code=code).exists():
+                    CouponCodePool.release(store_id, code)
                 continue
             except DatabaseError as e:
                 logger.error(
@@ -421,6 +859,253 @@ class CouponCode(models.Model):
         )
         return None
 
+    @classmethod
+    def _generate_unique_codes(cls, store_id, count, length, exclude=()):
+        """
+        店舗内で未使用のクーポンコードを指定件数分生成する
+        - メモリ上で重複を除いた候補を作成し、既存の (store_id, coupon_code) と集合演算で突き合わせる
+        Args:
+            store_id (int): 店舗ID
+            count (int): 生成する件数
+            length (int): クーポンコードの文字数
+            exclude (Iterable[str]): 既存コードとは別に除外するコード
+        Returns:
+            set[str]: 生成したクーポンコード（件数が count に満たない場合あり）
+        """
+        codes = set()
+        exclude = set(exclude)
+        # コード空間が埋まっている場合に無限ループしないよう試行回数を制限する
+        for _ in range(10):
+            shortage = count - len(codes)
+            if shortage <= 0:
+                break
+            candidates = set(cls.next_codes(store_id, shortage, length))
+            if not candidates:
+                break
+            candidates -= codes | exclude
+            existing = set(
+                cls.objects
+                .filter(store_id=store_id, coupon_code__in=candidates)
+                .values_list("coupon_code", flat=True)
+            )
+            codes |= candidates - existing
+        return codes
+
+    @classmethod
+    def issue_batch(cls, coupon_id, n, length=6, chunk_size=1000, max_retries=10):
+        """
+        指定されたクーポンIDに対応するクーポンコードを一括発行する
+        - チャンクごとに1トランザクションで発行数の確保・bulk_create を行う
+        - 発行数（issued_count）の更新はチャンクごとに1回
+        - 同時発行などで一意制約に衝突したコードのみ再生成して再登録する
+        - 発行数の上限（max_issuance）を超えて発行しない
+        Args:
+            coupon_id(int): 発行対象のクーポンID
+            n(int): 発行する件数
+            length(int): クーポンコードの文字数
+            chunk_size(int): 1トランザクションで登録する件数
+            max_retries(int): 衝突したコードを再登録する上限回数
+        Returns:
+            int: 発行した件数（削除済み・有効期限切れ・上限到達の場合は 0）
+            None: クーポンが存在しない場合
+        Raises:
+            DatabaseError: データベース操作に失敗した場合
+            Exception: 予期しないエラーが発生した場合
+        """
+        try:
+            coupon = (
+                Coupon.objects
+                .only("store_id", "status", "expiration_date")
+                .get(id=coupon_id)
+            )
+        except Coupon.DoesNotExist:
+            logger.warning(
+                f"[CouponCode][IssueBatch] Not found: coupon_id={coupon_id}"
+            )
+            return None
+
+        if coupon.status == CouponStatus.DELETED:
+            logger.warning(
+                f"[CouponCode][IssueBatch] Deleted: coupon_id={coupon_id}"
+            )
+            return 0
+        if (
+            coupon.status == CouponStatus.EXPIRED
+            or coupon.expiration_date is not None and coupon.expiration_date < timezone.localdate()
+        ):
+            logger.warning(
+                f"[CouponCode][IssueBatch] Expired: coupon_id={coupon_id}"
+            )
+            return 0
+
+        issued = 0
+        try:
+            while issued < n:
+                with sharding.atomic():
+                    reserved = cls._reserve_issuance(coupon_id, min(chunk_size, n - issued))
+                    if reserved == 0:
+                        break
+
+                    inserted = set()
+                    inserted_rows = []
+                    pending = cls._generate_unique_codes(coupon.store_id, reserved, length)
+                    for _ in range(max_retries):
+                        if not pending:
+                            break
+                        objs = [
+                            cls(
+                                coupon_id=coupon_id,
+                                store_id=coupon.store_id,
+                                coupon_code=code,
+                                coupon_uuid=sharding.new_code_uuid(coupon.store_id),
+                            )
+                            for code in pending
+                        ]
+                        cls.objects.bulk_create(objs, ignore_conflicts=True)
+                        # 実際に登録されたコードを確認し、衝突した分だけ再生成する
+                        rows = list(
+                            cls.objects
+                            .filter(coupon_uuid__in=[obj.coupon_uuid for obj in objs])
+                            .values_list("coupon_code", "coupon_uuid")
+                        )
+                        inserted |= {code for code, _ in rows}
+                        inserted_rows.extend(rows)
+                        shortage = reserved - len(inserted)
+                        pending = cls._generate_unique_codes(
+                            coupon.store_id, shortage, length, exclude=inserted | pending
+                        ) if shortage > 0 else set()
+
+                    # 登録できなかった分は確保した発行数を戻す
+                    shortage = reserved - len(inserted)
+                    if shortage > 0:
+                        Coupon.objects.filter(id=coupon_id).update(
+                            **Coupon.issued_count_update(-shortage)
+                        )
+                    CouponStatBucket.record(coupon_id, coupon.store_id, issued=len(inserted))
+                    sharding.on_commit(
+                        lambda rows=inserted_rows: code_filter.add(coupon.store_id, rows)
+                    )
+                issued += len(inserted)
+                if shortage > 0:
+                    logger.error(
+                        f"[CouponCode][IssueBatch] Failed to issue after {max_retries} retries: "
+                        f"coupon_id={coupon_id}, issued={issued}, requested={n}"
+                    )
+                    break
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCode][IssueBatch] DatabaseError: coupon_id={coupon_id}, issued={issued}. Error: {e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCode][IssueBatch] Unexpected error: coupon_id={coupon_id}, issued={issued}. Error: {e}"
+            )
+            raise
+
+        if issued < n:
+            logger.warning(
+                f"[CouponCode][IssueBatch] Partially issued: coupon_id={coupon_id}, issued={issued}, requested={n}"
+            )
+        return issued
+
+    @classmethod
+    def _reserve_issuance(cls, coupon_id, count):
+        """
+        発行数の上限を超えない範囲で、発行数（issued_count）を count 件分確保する
+        - 上限まで残りが count 件未満の場合は残り件数分だけ確保する
+        Args:
+            coupon_id (int): クーポンID
+            count (int): 確保したい件数
+        Returns:
+            int: 確保した件数（上限到達・削除済み・期限切れの場合は 0）
+        """
+        if CouponCounterShard.enabled():
+            # 分散カウンタの発行数を集約したうえで、残りの発行可能数から確保する
+            return CouponCounterShard.compact(coupon_id, reserve=count)
+        while count > 0:
+            reserved = (
+                Coupon.objects
+                .filter(id=coupon_id, status=CouponStatus.ACTIVE)
+                .filter(
+                    Q(max_issuance__isnull=True)
+                    | Q(max_issuance__gte=F("issued_count") + count)
+                )
+                .update(**Coupon.issued_count_update(count))
+            )
+            if reserved:
+                return count
+            remaining = (
+                Coupon.objects
+                .filter(id=coupon_id, status=CouponStatus.ACTIVE)
+                .values_list(F("max_issuance") - F("issued_count"), flat=True)
+                .first()
+            )
+            if remaining is None:
+                return 0
+            count = min(count, remaining)
+        return 0
+
+    @classmethod
+    def get_with_coupon(cls, id=None, uuid=None):
+        """
+        指定されたクーポンコードIDまたはUUIDに対応するクーポンコードを、
+        クーポン・店舗情報付きで1クエリで取得する
+        Args:
+            id (int): 取得対象のクーポンコードID
+            uuid (uuid): 取得対象のクーポンコードのUUID
+        Returns:
+            coupon_code: 存在する場合、CouponCodeインスタンス（coupon, coupon.store 取得済み）
+            None: 存在しない場合
+        Raises:
+            ValueError: id,uuidのいずれも指定されていない場合
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        if id is None and uuid is None:
+            raise ValueError("idまたはuuidのいずれかを指定してください")
+
+        filters = {}
+        if id is not None:
+            filters["id"] = id
+        if uuid is not None:
+            filters["coupon_uuid"] = uuid
+
+        try:
+            queryset = cls.objects.using(sharding.read_alias()).select_related(
+                "coupon" if sharding.enabled() else "coupon__store"
+            )
+            if not CouponCounterShard.enabled():
+                return queryset.get(**filters)
+
+            # 分散カウンタの未集約分をクーポンの発行数・使用数に加算する
+            coupon_code = (
+                queryset
+                .annotate(
+                    pending_issued=CouponCounterShard.pending("issued", "coupon_id"),
+                    pending_redeemed=CouponCounterShard.pending("redeemed", "coupon_id"),
+                )
+                .get(**filters)
+            )
+            coupon_code.coupon.issued_count += coupon_code.pending_issued
+            coupon_code.coupon.redeemed_count += coupon_code.pending_redeemed
+            return coupon_code
+        except cls.DoesNotExist:
+            logger.warning(
+                f"[CouponCode][DetailWithCouponFetch] Not found: id={id}, uuid={uuid}"
+            )
+            return None
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCode][DetailWithCouponFetch] Database error: id={id}, uuid={uuid}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCode][DetailWithCouponFetch] Unexpected error: id={id}, uuid={uuid}, error={e}"
+            )
+            raise
+
     @classmethod
     def get_coupon_id_by_id(cls, coupon_code_id):
         """
@@ -436,7 +1121,7 @@ class CouponCode(models.Model):
         """
         try:
             coupon_id = (
-                cls.objects
+                cls.objects.using(sharding.read_alias())
                 .values_list("coupon", flat=True)
                 .get(id=coupon_code_id)
             )
@@ -472,7 +1157,7 @@ class CouponCode(models.Model):
         """
         try:
             coupon_id = (
-                cls.objects
+                cls.objects.using(sharding.read_alias())
                 .values_list("coupon", flat=True)
                 .get(coupon_uuid=coupon_code_uuid)
             )
@@ -507,7 +1192,7 @@ class CouponCode(models.Model):
             Exception: その他の予期しないエラーが発生した場合
         """
         try:
-            coupon_code = cls.objects.get(id=coupon_code_id)
+            coupon_code = cls.objects.using(sharding.read_alias()).get(id=coupon_code_id)
             return coupon_code
         except cls.DoesNotExist:
             logger.warning(
@@ -539,7 +1224,7 @@ class CouponCode(models.Model):
             Exception: その他の予期しないエラーが発生した場合
         """
         try:
-            coupon_code = cls.objects.get(coupon_uuid=coupon_code_uuid)
+            coupon_code = cls.objects.using(sharding.read_alias()).get(coupon_uuid=coupon_code_uuid)
             return coupon_code
         except cls.DoesNotExist:
             logger.warning(
@@ -580,7 +1265,7 @@ class CouponCode(models.Model):
             filters["coupon_code"] = code
 
         try:
-            return cls.objects.get(**filters)
+            return cls.objects.using(sharding.read_alias()).get(**filters)
         except cls.DoesNotExist:
             logger.warning(
                 f"[CouponCode][GetByCode] not found: store_id={store_id}, code={code}, uuid={uuid}"
@@ -596,3 +1281,1019 @@ class CouponCode(models.Model):
                 f"[CouponCode][GetByCode] Unexpected error: store_id={store_id}, error={e}"
             )
             raise
+
+    @classmethod
+    def _ineligible_status(cls, coupon_id, today):
+        """
+        使用数の加算対象外になったクーポンの状態から、認証結果（削除済み・有効期限切れ）を返す
+        Args:
+            coupon_id (int): クーポンID
+            today (date): 判定に使用した日付
+        Returns:
+            RedeemStatus: EXPIRED または DELETED
+        """
+        row = (
+            Coupon.objects
+            .filter(id=coupon_id)
+            .values_list("status", "expiration_date")
+            .first()
+        )
+        if row is None or row[0] == CouponStatus.DELETED:
+            return RedeemStatus.DELETED
+        status, expiration_date = row
+        if status == CouponStatus.EXPIRED or (expiration_date is not None and expiration_date < today):
+            return RedeemStatus.EXPIRED
+        return RedeemStatus.DELETED
+
+    @classmethod
+    def redeem(cls, store_id, code=None, uuid=None):
+        """
+        指定されたstore_id,coupon_codeまたはuuidに対応するクーポンコードを使用済みにする
+
+        使用可否の判定と状態の更新は、1トランザクション内の条件付きUPDATEで行う。
+        - coupon_codes: redeemed_at IS NULL の場合のみ redeemed_at を更新
+        - coupons: 削除されておらず有効期限内の場合のみ redeemed_count を +1
+        いずれかの更新件数が0件の場合はロールバックし、同時に認証された場合でも
+        1件のクーポンコードが使用済みになるのは1回だけとなる。
+        ロックの競合（デッドロック・ロック待ちのタイムアウト）でエラーになった場合は、
+        外側のトランザクションがなければ REDEEM_LOCK_RETRIES 回までトランザクションをやり直す。
+        Args:
+            store_id(int): 認証を行う店舗ID
+            code(str): クーポンコード
+            uuid(uuid): クーポンコードのUUID
+        Returns:
+            RedeemResult: 処理結果（status, coupon_code, coupon）
+        Raises:
+            ValueError: code,uuidのいずれも指定されていない場合
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        if not uuid and not code:
+            raise ValueError("uuidまたはcodeのいずれかを指定してください")
+
+        filters = {"store_id": store_id}
+        if uuid:
+            filters["coupon_uuid"] = uuid
+        if code:
+            filters["coupon_code"] = code
+
+        try:
+            for attempt in range(1, REDEEM_LOCK_RETRIES + 1):
+                try:
+                    return cls._redeem_once(store_id, filters, code, uuid)
+                except OperationalError as e:
+                    # 外側のトランザクション内ではやり直せないため、そのまま呼び出し元に返す
+                    if attempt == REDEEM_LOCK_RETRIES or not is_lock_contention(e) or sharding.in_atomic_block():
+                        raise
+                    logger.warning(
+                        f"[CouponCode][Redeem] Lock contention, retrying: store_id={store_id}, code={code}, "
+                        f"uuid={uuid}, attempt={attempt}, error={e}"
+                    )
+                    time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCode][Redeem] Database error: store_id={store_id}, code={code}, uuid={uuid}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCode][Redeem] Unexpected error: store_id={store_id}, code={code}, uuid={uuid}, error={e}"
+            )
+            raise
+
+    @classmethod
+    def _redeem_once(cls, store_id, filters, code, uuid):
+        """
+        redeem の1回分のトランザクション（ロックの競合でエラーになった場合は redeem がやり直す）
+        """
+        with sharding.atomic():
+            try:
+                coupon_code = (
+                    cls.objects
+                    .select_related("coupon")
+                    .get(**filters)
+                )
+            except cls.DoesNotExist:
+                logger.warning(
+                    f"[CouponCode][Redeem] Not found: store_id={store_id}, code={code}, uuid={uuid}"
+                )
+                return RedeemResult(RedeemStatus.NOT_FOUND)
+
+            coupon = coupon_code.coupon
+            if coupon_code.redeemed_at is not None:
+                return RedeemResult(RedeemStatus.ALREADY_REDEEMED, coupon_code, coupon)
+            if coupon.status == CouponStatus.DELETED:
+                return RedeemResult(RedeemStatus.DELETED, coupon_code, coupon)
+            if coupon.status == CouponStatus.EXPIRED:
+                return RedeemResult(RedeemStatus.EXPIRED, coupon_code, coupon)
+            today = timezone.localdate()
+            if coupon.expiration_date is not None and coupon.expiration_date < today:
+                # sweep_coupon_status の実行前に期限切れになった場合はここで状態を更新する
+                Coupon.objects.filter(
+                    id=coupon.id, status__in=[CouponStatus.ACTIVE, CouponStatus.EXHAUSTED]
+                ).update(status=CouponStatus.EXPIRED)
+                return RedeemResult(RedeemStatus.EXPIRED, coupon_code, coupon)
+
+            now = timezone.now()
+            # 未使用の場合のみ使用済みにする
+            redeemed = (
+                cls.objects
+                .filter(id=coupon_code.id, redeemed_at__isnull=True)
+                .update(redeemed_at=now, updated_at=now)
+            )
+            if redeemed == 0:
+                return RedeemResult(RedeemStatus.ALREADY_REDEEMED, coupon_code, coupon)
+
+            # 削除されておらず有効期限内の場合のみ使用数を +1
+            eligible = (
+                Coupon.objects
+                .filter(id=coupon.id, status__in=[CouponStatus.ACTIVE, CouponStatus.EXHAUSTED])
+                .filter(Q(expiration_date__isnull=True) | Q(expiration_date__gte=today))
+            )
+            if CouponCounterShard.enabled():
+                # 分散カウンタの場合は Coupon の行を更新しない
+                counted = eligible.exists() and CouponCounterShard.increment(coupon.id, "redeemed")
+            else:
+                counted = eligible.update(redeemed_count=F("redeemed_count") + 1, updated_at=now)
+            if not counted:
+                # 判定後にクーポンが削除・期限切れになった場合は使用済みにしない
+                # （ロールバックを指定すると以降のクエリは実行できないため、先に現在の状態を取得する）
+                status = cls._ineligible_status(coupon.id, today)
+                sharding.set_rollback(True)
+                return RedeemResult(status, coupon_code, coupon)
+            CouponStatBucket.record(coupon.id, store_id, redeemed=1, at=now)
+
+        coupon_code.redeemed_at = now
+        coupon.redeemed_count += 1
+        # 呼び出し元のトランザクション内の場合はコミット後に削除する（ロールバックされた場合は削除しない）
+        sharding.on_commit(lambda: page_cache.invalidate_code(coupon_code.coupon_uuid))
+        return RedeemResult(RedeemStatus.SUCCESS, coupon_code, coupon)
+
+    @classmethod
+    def redeem_batch(cls, store_id, items):
+        """
+        複数のクーポンコードをまとめて使用済みにする（POSスキャナーなどの一括認証用）
+
+        1トランザクション内で次のクエリを発行する。
+        - 対象のクーポンコードを coupon_uuid IN / coupon_code IN でそれぞれ1クエリで取得（行ロック）
+        - 使用可能なクーポンコードの redeemed_at を1回の条件付きUPDATEで更新
+        - クーポンごとの使用数を CASE 式の1回の条件付きUPDATEで加算
+        条件付きUPDATEの更新件数が判定結果と一致しない場合はロールバックし、
+        1件ずつ redeem で処理する。
+        Args:
+            store_id(int): 認証を行う店舗ID
+            items(list[dict]): {"code": str} または {"uuid": uuid} のリスト
+        Returns:
+            list[RedeemResult]: items と同じ順序の処理結果
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        uuids = {item["uuid"] for item in items if item.get("uuid")}
+        codes = {item["code"] for item in items if item.get("code")}
+        try:
+            with sharding.atomic():
+                # UUID と コードはそれぞれの一意インデックスで引けるよう別のクエリにする
+                queryset = cls.objects.select_related("coupon").select_for_update().filter(store_id=store_id)
+                found = []
+                if uuids:
+                    found += queryset.filter(coupon_uuid__in=uuids)
+                if codes:
+                    found += queryset.filter(coupon_code__in=codes)
+                by_uuid = {str(coupon_code.coupon_uuid): coupon_code for coupon_code in found}
+                by_code = {coupon_code.coupon_code: coupon_code for coupon_code in found}
+
+                today = timezone.localdate()
+                now = timezone.now()
+                results = []
+                redeeming = {}
+                expired_coupon_ids = set()
+                for item in items:
+                    if item.get("uuid"):
+                        coupon_code = by_uuid.get(str(item["uuid"]))
+                    else:
+                        coupon_code = by_code.get(item.get("code"))
+                    if coupon_code is None:
+                        results.append(RedeemResult(RedeemStatus.NOT_FOUND))
+                        continue
+                    coupon = coupon_code.coupon
+                    if coupon_code.redeemed_at is not None or coupon_code.id in redeeming:
+                        # 同じリクエスト内で重複して指定された場合も使用済みとする
+                        results.append(RedeemResult(RedeemStatus.ALREADY_REDEEMED, coupon_code, coupon))
+                    elif coupon.status == CouponStatus.DELETED:
+                        results.append(RedeemResult(RedeemStatus.DELETED, coupon_code, coupon))
+                    elif coupon.status == CouponStatus.EXPIRED:
+                        results.append(RedeemResult(RedeemStatus.EXPIRED, coupon_code, coupon))
+                    elif coupon.expiration_date is not None and coupon.expiration_date < today:
+                        expired_coupon_ids.add(coupon.id)
+                        results.append(RedeemResult(RedeemStatus.EXPIRED, coupon_code, coupon))
+                    else:
+                        redeeming[coupon_code.id] = coupon_code
+                        results.append(RedeemResult(RedeemStatus.SUCCESS, coupon_code, coupon))
+
+                if expired_coupon_ids:
+                    # sweep_coupon_status の実行前に期限切れになったクーポンの状態を更新する
+                    Coupon.objects.filter(
+                        id__in=expired_coupon_ids,
+                        status__in=[CouponStatus.ACTIVE, CouponStatus.EXHAUSTED],
+                    ).update(status=CouponStatus.EXPIRED)
+
+                counts = {}
+                for coupon_code in redeeming.values():
+                    counts[coupon_code.coupon_id] = counts.get(coupon_code.coupon_id, 0) + 1
+                if redeeming and not cls._apply_batch_redemption(redeeming.values(), today, now):
+                    sharding.set_rollback(True)
+                    redeeming = None
+                else:
+                    for coupon_id, count in counts.items():
+                        CouponStatBucket.record(coupon_id, store_id, redeemed=count, at=now)
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCode][RedeemBatch] Database error: store_id={store_id}, count={len(items)}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCode][RedeemBatch] Unexpected error: store_id={store_id}, count={len(items)}, error={e}"
+            )
+            raise
+
+        if redeeming is None:
+            logger.warning(
+                f"[CouponCode][RedeemBatch] Conflict, falling back to single redeem: store_id={store_id}"
+            )
+            return [
+                cls.redeem(store_id, code=item.get("code"), uuid=item.get("uuid"))
+                if item.get("code") or item.get("uuid") else RedeemResult(RedeemStatus.NOT_FOUND)
+                for item in items
+            ]
+
+        for coupon_code in redeeming.values():
+            coupon_code.redeemed_at = now
+        for result in results:
+            if result.success:
+                result.coupon.redeemed_count += counts[result.coupon.id]
+        redeemed_uuids = [coupon_code.coupon_uuid for coupon_code in redeeming.values()]
+        # 呼び出し元のトランザクション内の場合はコミット後に削除する（ロールバックされた場合は削除しない）
+        sharding.on_commit(lambda: page_cache.invalidate_codes(redeemed_uuids))
+        return results
+
+    @classmethod
+    def _apply_batch_redemption(cls, coupon_codes, today, now):
+        """
+        redeem_batch で使用可能と判定したクーポンコードを使用済みにし、クーポンの使用数を加算する
+        Args:
+            coupon_codes (Iterable[CouponCode]): 使用済みにするクーポンコード
+            today (date): 有効期限の判定日
+            now (datetime): 使用日時
+        Returns:
+            bool: 判定どおりに更新できた場合 True（呼び出し元でロールバックが必要な場合 False）
+        """
+        coupon_codes = list(coupon_codes)
+        redeemed = (
+            cls.objects
+            .filter(id__in=[coupon_code.id for coupon_code in coupon_codes], redeemed_at__isnull=True)
+            .update(redeemed_at=now, updated_at=now)
+        )
+        if redeemed != len(coupon_codes):
+            return False
+
+        counts = {}
+        for coupon_code in coupon_codes:
+            counts[coupon_code.coupon_id] = counts.get(coupon_code.coupon_id, 0) + 1
+        eligible = (
+            Coupon.objects
+            .filter(id__in=counts, status__in=[CouponStatus.ACTIVE, CouponStatus.EXHAUSTED])
+            .filter(Q(expiration_date__isnull=True) | Q(expiration_date__gte=today))
+        )
+        if CouponCounterShard.enabled():
+            # 分散カウンタの場合は Coupon の行を更新しない
+            if eligible.count() != len(counts):
+                return False
+            for coupon_id, count in counts.items():
+                CouponCounterShard.increment(coupon_id, "redeemed", count)
+            return True
+
+        counted = eligible.update(
+            redeemed_count=F("redeemed_count") + models.Case(
+                *[models.When(id=coupon_id, then=Value(count)) for coupon_id, count in counts.items()],
+                default=Value(0),
+            ),
+            updated_at=now,
+        )
+        return counted == len(counts)
+
+
+class CouponCodeSequence(models.Model):
+    """
+    店舗ごとのクーポンコード連番（COUPON_CODE_GENERATOR = "permutation" の場合に使用）
+    """
+    store_id = models.BigIntegerField(unique=True)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        db_table = "coupon_code_sequences"
+        verbose_name = "Coupon code sequence"
+        verbose_name_plural = "Coupon code sequences"
+
+    def __str__(self):
+        return f"{self.store_id}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, store_id, count=1, length=6):
+        """
+        指定された店舗の連番を count 件分確保する
+        Args:
+            store_id (int): 店舗ID
+            count (int): 確保する件数
+            length (int): クーポンコードの文字数（連番の上限の算出に使用）
+        Returns:
+            tuple[int, int]: (確保した連番の先頭, 確保した件数)
+                連番を使い切った場合、確保した件数は count 未満（0 を含む）
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        try:
+            with sharding.atomic():
+                sequence, _ = (
+                    cls.objects
+                    .select_for_update()
+                    .get_or_create(store_id=store_id)
+                )
+                start = sequence.last_value
+                allocated = max(0, min(count, code_space(length) - start))
+                if allocated:
+                    cls.objects.filter(id=sequence.id).update(
+                        last_value=F("last_value") + allocated,
+                        updated_at=timezone.now(),
+                    )
+            if allocated < count:
+                logger.error(
+                    f"[CouponCodeSequence][Allocate] Code space exhausted: store_id={store_id}, "
+                    f"requested={count}, allocated={allocated}"
+                )
+            return start, allocated
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCodeSequence][Allocate] Database error: store_id={store_id}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCodeSequence][Allocate] Unexpected error: store_id={store_id}, error={e}"
+            )
+            raise
+
+
+class CouponCodePool(models.Model):
+    """
+    店舗ごとの事前生成済みクーポンコード（COUPON_CODE_POOL_ENABLED = True の場合に使用）
+    - refill_code_pool コマンドで低水位（low-water mark）を下回った店舗に補充する
+    - 発行時は未使用の1件を条件付きUPDATEで確保する
+    """
+    CODE_LENGTH = 6
+
+    store_id = models.BigIntegerField()
+    # チェック文字付きのコードを格納できるよう本体の文字数 + 1
+    coupon_code = models.CharField(max_length=CODE_LENGTH + 1, editable=False)
+    claimed_at = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        db_table = "coupon_code_pool"
+        verbose_name = "Coupon code pool"
+        verbose_name_plural = "Coupon code pool"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['store_id', 'coupon_code'],
+                name='unique_store_poolcode'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['store_id', 'claimed_at'], name='pool_store_claimed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon_code} ({self.store_id})"
+
+    @classmethod
+    def claim(cls, store_id, candidates=8):
+        """
+        指定された店舗の事前生成済みクーポンコードを1件確保する
+        - 未使用の先頭数件から無作為に選び、claimed_at IS NULL の条件付きUPDATEで確保する
+          （同時発行時に同じ行を取り合わないようにするため）
+        Args:
+            store_id (int): 店舗ID
+            candidates (int): 確保を試みる候補の件数
+        Returns:
+            str: 確保したクーポンコード
+            None: 事前生成済みのコードがない場合、またはDBエラーの場合
+        """
+        try:
+            rows = list(
+                cls.objects
+                .filter(store_id=store_id, claimed_at__isnull=True)
+                .order_by("id")
+                .values_list("id", "coupon_code")[:candidates]
+            )
+            random.shuffle(rows)
+            for pool_id, code in rows:
+                claimed = (
+                    cls.objects
+                    .filter(id=pool_id, claimed_at__isnull=True)
+                    .update(claimed_at=timezone.now())
+                )
+                if claimed:
+                    return code
+        except sharding.ShardMovingError:
+            raise
+        except DatabaseError as e:
+            # 事前生成済みのコードが使えない場合は通常の発行処理にフォールバックする
+            logger.error(
+                f"[CouponCodePool][Claim] Database error: store_id={store_id}, error={e}"
+            )
+            return None
+
+        logger.info(
+            f"[CouponCodePool][Claim] Pool empty: store_id={store_id}"
+        )
+        return None
+
+    @classmethod
+    def release(cls, store_id, coupon_code):
+        """
+        claim で確保した事前生成済みクーポンコードを未使用に戻す（発行を取り消した場合に使用する）
+        Args:
+            store_id (int): 店舗ID
+            coupon_code (str): claim で確保したクーポンコード
+        Returns:
+            bool: 未使用に戻した場合は True（DBエラーの場合は False。確保したままとなり、purge_claimed で削除される）
+        """
+        try:
+            released = (
+                cls.objects
+                .filter(store_id=store_id, coupon_code=coupon_code, claimed_at__isnull=False)
+                .update(claimed_at=None)
+            )
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCodePool][Release] Database error: store_id={store_id}, error={e}"
+            )
+            return False
+        return bool(released)
+
+    @classmethod
+    def depth(cls, store_ids=None):
+        """
+        店舗ごとの未使用の事前生成済みクーポンコード数を取得する（監視用）
+        Args:
+            store_ids (Iterable[int] | None): 対象の店舗ID（None の場合は全店舗）
+        Returns:
+            dict[int, int]: {store_id: 未使用件数}（0件の店舗は含まない）
+        """
+        queryset = cls.objects.filter(claimed_at__isnull=True)
+        if store_ids is not None:
+            queryset = queryset.filter(store_id__in=store_ids)
+        return dict(
+            queryset
+            .values("store_id")
+            .annotate(depth=models.Count("id"))
+            .values_list("store_id", "depth")
+        )
+
+    @classmethod
+    def refill(cls, store_id, target):
+        """
+        指定された店舗の未使用コード数が target になるまで補充する
+        Args:
+            store_id (int): 店舗ID
+            target (int): 補充後の未使用件数
+        Returns:
+            int: 補充した件数
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        try:
+            pooled = set(
+                cls.objects
+                .filter(store_id=store_id, claimed_at__isnull=True)
+                .values_list("coupon_code", flat=True)
+            )
+            shortage = target - len(pooled)
+            if shortage <= 0:
+                return 0
+            codes = CouponCode._generate_unique_codes(
+                store_id, shortage, cls.CODE_LENGTH, exclude=pooled
+            )
+            started = timezone.now()
+            cls.objects.bulk_create(
+                [cls(store_id=store_id, coupon_code=code) for code in codes],
+                ignore_conflicts=True,
+            )
+            # 一意制約に衝突した行は登録されないため、実際に登録された件数を確認する
+            return (
+                cls.objects
+                .filter(store_id=store_id, coupon_code__in=codes, created_at__gte=started)
+                .count()
+            )
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCodePool][Refill] Database error: store_id={store_id}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCodePool][Refill] Unexpected error: store_id={store_id}, error={e}"
+            )
+            raise
+
+    @classmethod
+    def purge_claimed(cls, chunk_size=1000, pause=0.0):
+        """
+        確保済み（発行に使用済み）の行を削除する
+        - 対象を id 順に chunk_size 件ずつ取得し、チャンクごとに1回の DELETE で削除する
+          （全店舗の行を1回の DELETE で削除してロックを長時間保持しないようにするため）
+        Args:
+            chunk_size (int): 1回の DELETE で削除する件数
+            pause (float): チャンクごとの待機秒数
+        Returns:
+            int: 削除した件数
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        purged = 0
+        last_id = 0
+        try:
+            while True:
+                ids = list(
+                    cls.objects
+                    .filter(claimed_at__isnull=False, id__gt=last_id)
+                    .order_by("id")
+                    .values_list("id", flat=True)[:chunk_size]
+                )
+                if not ids:
+                    return purged
+                deleted, _ = cls.objects.filter(id__in=ids, claimed_at__isnull=False).delete()
+                purged += deleted
+                if len(ids) < chunk_size:
+                    return purged
+                last_id = ids[-1]
+                if pause:
+                    time.sleep(pause)
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCodePool][PurgeClaimed] Database error: purged={purged}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCodePool][PurgeClaimed] Unexpected error: purged={purged}, error={e}"
+            )
+            raise
+
+
+class CouponCounterShard(models.Model):
+    """
+    クーポンの発行数・使用数の分散カウンタ（COUPON_COUNTER_SHARDS > 0 の場合に使用）
+    - 1クーポンあたり COUPON_COUNTER_SHARDS 個のスロットを持ち、書き込みは無作為なスロットに行う
+      （人気クーポンの発行・使用が Coupon の1行のロックで直列化されないようにするため）
+    - 発行数の上限は、残りの発行可能数を各スロットに割り当てた quota で守る
+    - compact_coupon_counters コマンドでスロットの値を Coupon.issued_count / redeemed_count に集約し、
+      quota を再配分する
+    """
+    coupon = models.ForeignKey(
+        'Coupon',
+        on_delete=models.CASCADE,
+        related_name='counter_shards',
+        db_column='coupon_id',
+    )
+    slot = models.IntegerField()
+    issued = models.IntegerField(default=0)
+    redeemed = models.IntegerField(default=0)
+    # このスロットで発行できる件数（None の場合は上限なし）
+    quota = models.IntegerField(null=True)
+
+    class Meta:
+        db_table = "coupon_counter_shards"
+        verbose_name = "Coupon counter shard"
+        verbose_name_plural = "Coupon counter shards"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['coupon', 'slot'],
+                name='unique_coupon_counter_slot'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.coupon_id}[{self.slot}]: issued={self.issued}, redeemed={self.redeemed}"
+
+    @staticmethod
+    def slots():
+        return getattr(settings, "COUPON_COUNTER_SHARDS", 0)
+
+    @classmethod
+    def enabled(cls):
+        return cls.slots() > 0
+
+    @classmethod
+    def pending(cls, field, outer_ref="pk"):
+        """
+        未集約のスロットの合計値を返すサブクエリ（Coupon へのアノテーション用）
+        Args:
+            field (str): "issued" または "redeemed"
+            outer_ref (str): 外側のクエリのクーポンIDを参照するフィールド名
+        """
+        total = (
+            cls.objects
+            .filter(coupon_id=OuterRef(outer_ref))
+            .values("coupon_id")
+            .annotate(total=Sum(field))
+            .values("total")
+        )
+        return Coalesce(Subquery(total), Value(0))
+
+    @classmethod
+    def increment(cls, coupon_id, field, amount=1):
+        """
+        無作為なスロットの発行数または使用数を amount 件加算する（既定は +1）
+        - 発行数の場合、Coupon.increment_issued と同じく有効な状態（active）のクーポンのみ加算する
+          （削除済み・期限切れのクーポンには発行しない）
+        - 発行数の場合、スロットの quota に達していれば他のスロットを試し、
+          全スロットが quota に達している場合は集約・再配分してから再試行する
+        Args:
+            coupon_id (int): クーポンID
+            field (str): "issued" または "redeemed"
+            amount (int): 加算する件数
+        Returns:
+            bool: 更新した場合 True、発行数の上限に達している場合 False
+        """
+        slots = list(range(cls.slots()))
+        random.shuffle(slots)
+        for attempt in range(2):
+            for index, slot in enumerate(slots):
+                queryset = cls.objects.filter(coupon_id=coupon_id, slot=slot)
+                if field == "issued":
+                    queryset = queryset.filter(
+                        Q(quota__isnull=True) | Q(quota__gte=F("issued") + amount),
+                        Exists(Coupon.objects.filter(id=OuterRef("coupon_id"), status=CouponStatus.ACTIVE)),
+                    )
+                if queryset.update(**{field: F(field) + amount}):
+                    return True
+                if field != "issued":
+                    # 使用数には上限がないため、更新できないのはスロットが未作成の場合のみ
+                    break
+                if index == 0 and not cls.objects.filter(coupon_id=coupon_id).exists():
+                    # スロットが未作成の場合は作成してから再試行する
+                    break
+            if attempt == 0:
+                cls.compact(coupon_id)
+        return False
+
+    @classmethod
+    def compact(cls, coupon_id, reserve=0):
+        """
+        スロットの発行数・使用数を Coupon.issued_count / redeemed_count に集約し、
+        残りの発行可能数を各スロットの quota に再配分する（スロットが未作成の場合は作成する）
+        Args:
+            coupon_id (int): クーポンID
+            reserve (int): 集約時に Coupon 側で確保する発行数（一括発行用）
+        Returns:
+            int: 確保した発行数（発行数の上限・削除済み・期限切れの場合は reserve 未満）
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        try:
+            with sharding.atomic():
+                coupon = (
+                    Coupon.objects
+                    .select_for_update()
+                    .only("max_issuance", "issued_count", "redeemed_count", "deleted_at", "expiration_date", "status")
+                    .filter(id=coupon_id)
+                    .first()
+                )
+                if coupon is None:
+                    return 0
+                shards = {
+                    shard.slot: shard
+                    for shard in cls.objects.select_for_update().filter(coupon_id=coupon_id)
+                }
+                issued_count = coupon.issued_count + sum(s.issued for s in shards.values())
+                redeemed_count = coupon.redeemed_count + sum(s.redeemed for s in shards.values())
+
+                # 削除済み・期限切れのクーポンは確保せず、全スロットの quota を 0 にする
+                closed = coupon.deleted_at is not None or coupon.status in (
+                    CouponStatus.DELETED, CouponStatus.EXPIRED
+                )
+                if closed:
+                    reserved = 0
+                elif coupon.max_issuance is None:
+                    reserved = reserve
+                else:
+                    reserved = max(0, min(reserve, coupon.max_issuance - issued_count))
+                issued_count += reserved
+
+                # 期限切れ・削除済みの状態は sweep_coupon_status・論理削除で更新するためここでは変えない
+                status = coupon.status
+                if status in (CouponStatus.ACTIVE, CouponStatus.EXHAUSTED):
+                    status = CouponStatus.derive(
+                        None, None, coupon.max_issuance, issued_count
+                    )
+                Coupon.objects.filter(id=coupon_id).update(
+                    issued_count=issued_count,
+                    redeemed_count=redeemed_count,
+                    status=status,
+                )
+
+                # 残りの発行可能数を有効なスロットに均等に割り当てる
+                slot_count = cls.slots()
+                quotas = {}
+                for slot in set(shards) | set(range(slot_count)):
+                    if closed:
+                        quotas[slot] = 0
+                    elif coupon.max_issuance is None:
+                        quotas[slot] = None if slot < slot_count else 0
+                    elif slot < slot_count:
+                        remaining = max(0, coupon.max_issuance - issued_count)
+                        quotas[slot] = remaining // slot_count + (1 if slot < remaining % slot_count else 0)
+                    else:
+                        quotas[slot] = 0
+
+                for slot, quota in quotas.items():
+                    shard = shards.get(slot)
+                    if shard is None:
+                        cls.objects.create(coupon_id=coupon_id, slot=slot, quota=quota)
+                    else:
+                        shard.issued = 0
+                        shard.redeemed = 0
+                        shard.quota = quota
+                cls.objects.bulk_update(shards.values(), ["issued", "redeemed", "quota"])
+            return reserved
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponCounterShard][Compact] Database error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponCounterShard][Compact] Unexpected error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+
+
+class CouponStatBucket(models.Model):
+    """
+    クーポンごと・1時間ごとの発行数・使用数の集計（統計APIはこのテーブルのみを参照する）
+    - 発行・使用の各処理のコミット後に該当する時間帯の行を加算する
+      （集計行のロックを発行・使用のトランザクションに含めないため）
+    - backfill_coupon_stats コマンドで coupon_codes から再集計できる
+    - 日ごとの集計は表示時に1時間ごとの行を TIME_ZONE の日付でまとめる
+    """
+    coupon = models.ForeignKey(
+        'Coupon',
+        on_delete=models.CASCADE,
+        related_name='stat_buckets',
+        db_column='coupon_id',
+    )
+    store_id = models.BigIntegerField()
+    bucket_start = models.DateTimeField()
+    issued = models.IntegerField(default=0)
+    redeemed = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "coupon_stat_buckets"
+        verbose_name = "Coupon stat bucket"
+        verbose_name_plural = "Coupon stat buckets"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['coupon', 'bucket_start'],
+                name='unique_coupon_stat_bucket'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['store_id', 'bucket_start'], name='stat_store_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon_id} {self.bucket_start}: issued={self.issued}, redeemed={self.redeemed}"
+
+    @staticmethod
+    def bucket_of(moment):
+        """
+        日時が属する時間帯の開始時刻（1時間単位に切り捨て）を返す
+        """
+        return moment.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def record(cls, coupon_id, store_id, issued=0, redeemed=0, at=None):
+        """
+        現在のトランザクションのコミット後に、該当する時間帯の発行数・使用数を加算する
+        Args:
+            coupon_id (int): クーポンID
+            store_id (int): 店舗ID
+            issued (int): 加算する発行数
+            redeemed (int): 加算する使用数
+            at (datetime): 発行・使用の日時（省略時は現在時刻）
+        """
+        if not issued and not redeemed:
+            return
+        bucket_start = cls.bucket_of(at or timezone.now())
+        sharding.on_commit(
+            lambda: cls._add(coupon_id, store_id, bucket_start, issued, redeemed)
+        )
+
+    @classmethod
+    def _add(cls, coupon_id, store_id, bucket_start, issued, redeemed):
+        """
+        時間帯の行に加算する（行がなければ作成する）
+        - 集計の失敗で発行・使用の処理を失敗させないため、DBエラーはログのみ出力する
+          （backfill_coupon_stats で再集計できる）
+        """
+        try:
+            for _ in range(2):
+                updated = (
+                    cls.objects
+                    .filter(coupon_id=coupon_id, bucket_start=bucket_start)
+                    .update(issued=F("issued") + issued, redeemed=F("redeemed") + redeemed)
+                )
+                if updated:
+                    return
+                try:
+                    with sharding.atomic():
+                        cls.objects.create(
+                            coupon_id=coupon_id,
+                            store_id=store_id,
+                            bucket_start=bucket_start,
+                            issued=issued,
+                            redeemed=redeemed,
+                        )
+                    return
+                except IntegrityError:
+                    # 同時に作成された場合は加算をやり直す
+                    continue
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponStatBucket][Record] Database error: coupon_id={coupon_id}, "
+                f"bucket_start={bucket_start}, issued={issued}, redeemed={redeemed}, error={e}"
+            )
+
+    @classmethod
+    def series(cls, start, end, coupon_id=None, store_id=None, granularity="day"):
+        """
+        指定期間の発行数・使用数の推移を取得する
+        - データがない時間帯・日も発行数・使用数 0 として含め、期間内のすべての時間帯・日を順に返す
+        Args:
+            start (datetime): 期間の開始（含む）
+            end (datetime): 期間の終了（含まない）
+            coupon_id (int): 対象のクーポンID（クーポン単位の場合）
+            store_id (int): 対象の店舗ID（店舗単位の場合）
+            granularity (str): "hour" または "day"
+        Returns:
+            list[dict]: [{"start": datetime | date, "issued": int, "redeemed": int}, ...]
+        Raises:
+            ValueError: coupon_id, store_id のいずれも指定されていない場合
+            DatabaseError: データベース操作でエラーが発生した場合
+        """
+        if coupon_id is None and store_id is None:
+            raise ValueError("coupon_idまたはstore_idのいずれかを指定してください")
+
+        queryset = cls.objects.filter(bucket_start__gte=start, bucket_start__lt=end)
+        if coupon_id is not None:
+            queryset = queryset.filter(coupon_id=coupon_id)
+        else:
+            queryset = queryset.filter(store_id=store_id)
+        rows = (
+            queryset
+            .values("bucket_start")
+            .annotate(total_issued=Sum("issued"), total_redeemed=Sum("redeemed"))
+            .order_by("bucket_start")
+        )
+
+        def key_of(moment):
+            key = timezone.localtime(moment)
+            return key.date() if granularity == "day" else key
+
+        # 期間内の時間帯（1時間単位）を順にたどり、データがない時間帯・日も 0 で作成しておく
+        buckets = {}
+        moment = cls.bucket_of(start.astimezone(dt_timezone.utc))
+        if moment < start:
+            moment += timedelta(hours=1)
+        while moment < end:
+            key = key_of(moment)
+            buckets.setdefault(key, {"start": key, "issued": 0, "redeemed": 0})
+            moment += timedelta(hours=1)
+        for row in rows:
+            key = key_of(row["bucket_start"])
+            bucket = buckets.setdefault(key, {"start": key, "issued": 0, "redeemed": 0})
+            bucket["issued"] += row["total_issued"]
+            bucket["redeemed"] += row["total_redeemed"]
+        return list(buckets.values())
+
+    @classmethod
+    def rebuild(cls, coupon_id, start=None, end=None):
+        """
+        coupon_codes の作成日時・使用日時から指定クーポンの集計を作り直す（backfill_coupon_stats 用）
+        Args:
+            coupon_id (int): クーポンID
+            start (datetime): 再集計する期間の開始（含む。省略時は最初から）
+            end (datetime): 再集計する期間の終了（含まない。省略時は現在の時間帯の開始）
+        Returns:
+            int: 作成した行数
+        Raises:
+            DatabaseError: データベース操作でエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        end = end or cls.bucket_of(timezone.now())
+        try:
+            store_id = Coupon.objects.values_list("store_id", flat=True).get(id=coupon_id)
+            codes = CouponCode.objects.filter(coupon_id=coupon_id)
+
+            # 1時間単位の集計はDB側で行う（UTCで切り捨てるため MySQL のタイムゾーン表は不要）
+            buckets = {}
+            for field, moment_field in (("issued", "created_at"), ("redeemed", "redeemed_at")):
+                filters = {f"{moment_field}__lt": end}
+                if start is not None:
+                    filters[f"{moment_field}__gte"] = start
+                rows = (
+                    codes
+                    .filter(**filters)
+                    .annotate(bucket=TruncHour(moment_field, tzinfo=dt_timezone.utc))
+                    .values("bucket")
+                    .annotate(total=models.Count("id"))
+                    .values_list("bucket", "total")
+                )
+                for bucket_start, total in rows:
+                    buckets.setdefault(bucket_start, {"issued": 0, "redeemed": 0})[field] = total
+
+            with sharding.atomic():
+                existing = cls.objects.filter(coupon_id=coupon_id, bucket_start__lt=end)
+                if start is not None:
+                    existing = existing.filter(bucket_start__gte=start)
+                existing.delete()
+                cls.objects.bulk_create([
+                    cls(coupon_id=coupon_id, store_id=store_id, bucket_start=bucket_start, **counts)
+                    for bucket_start, counts in buckets.items()
+                ])
+            return len(buckets)
+        except DatabaseError as e:
+            logger.error(
+                f"[CouponStatBucket][Rebuild] Database error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[CouponStatBucket][Rebuild] Unexpected error: coupon_id={coupon_id}, error={e}"
+            )
+            raise
+
+
+class StoreShard(models.Model):
+    """
+    店舗ごとのクーポンデータの保存先のシャード（coupon.sharding のディレクトリ。default に保存する）
+    - 未登録の店舗は初回の参照時に登録する
+    - moving が True の間は、その店舗のクーポンデータへの書き込みを拒否する（rebalance_coupon_shards）
+    """
+    store_id = models.BigIntegerField(primary_key=True)
+    alias = models.CharField(max_length=64)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        db_table = "coupon_store_shards"
+        verbose_name = "Store shard"
+        verbose_name_plural = "Store shards"
+
+    @classmethod
+    def assign(cls, store_id, alias=None, moving=None):
+        """
+        店舗の保存先・移動中かどうかを更新し、キャッシュを無効化する
+        Args:
+            store_id (int): 店舗ID
+            alias (str): 保存先のシャード（省略時は変更しない）
+            moving (bool): 移動中かどうか（省略時は変更しない）
+        Raises:
+            DatabaseError: データベース操作中にエラーが発生した場合
+            Exception: その他の予期しないエラーが発生した場合
+        """
+        fields = {}
+        if alias is not None:
+            fields["alias"] = alias
+        if moving is not None:
+            fields["moving"] = moving
+        try:
+            cls.objects.using(sharding.DIRECTORY_ALIAS).update_or_create(store_id=store_id, defaults=fields)
+            sharding.invalidate_placement(store_id)
+        except DatabaseError as e:
+            logger.error(
+                f"[StoreShard][Assign] Database error: store_id={store_id}, fields={fields}, error={e}"
+            )
+            raise
+        except Exception as e:
+            logger.exception(
+                f"[StoreShard][Assign] Unexpected error: store_id={store_id}, fields={fields}, error={e}"
+            )
+            raise
@@ -0,0 +1,175 @@
+"""
+お客様向けクーポンページ（CouponCodeCustomerView）の表示結果のキャッシュ
+
+- キャッシュキーはクーポンコードのUUIDと日付（有効期限切れ表示が日付で変わるため）
+- クーポンコードごと・クーポンごとのバージョンを持ち、ページはバージョンが一致する場合のみ使用する
+  - クーポンコードの使用時はそのコードのバージョンを、クーポンの削除時はクーポンのバージョンを更新する
+  - バージョンはDBから取得する前に読み込んでおき（begin_fill）、そのバージョンでページを保存する。
+    取得中に使用・削除された場合は、保存したページが古いバージョンになるため使用されない
+  - バージョンのキーがない（期限切れ・カリングで削除された）場合もページは使用しない
+- クーポンのバージョンの確認にはクーポンIDが必要なため、クーポンコードごとのクーポンIDを保存する。
+  クーポンIDが未保存の初回の表示ではページを保存しない
+キャッシュの保存先は settings.CACHES の COUPON_PAGE_CACHE_ALIAS（ローカルは locmem/file、
+本番は Redis 等の共有バックエンドに差し替え可能）。
+"""
+import hashlib
+import uuid
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+KEY_PREFIX = "coupon_page"
+# バージョン・クーポンIDのキーを保持する秒数（ページのキャッシュの TIMEOUT より長くする）
+VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def _cache():
+    return caches[getattr(settings, "COUPON_PAGE_CACHE_ALIAS", "default")]
+
+
+def page_key(coupon_code_uuid, today=None):
+    today = today or timezone.localdate()
+    return f"{KEY_PREFIX}:{coupon_code_uuid}:{today.isoformat()}"
+
+
+def coupon_version_key(coupon_id):
+    return f"{KEY_PREFIX}:coupon:{coupon_id}:version"
+
+
+def code_version_key(coupon_code_uuid):
+    return f"{KEY_PREFIX}:code:{coupon_code_uuid}:version"
+
+
+def code_coupon_key(coupon_code_uuid):
+    return f"{KEY_PREFIX}:code:{coupon_code_uuid}:coupon_id"
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _current_version(key):
+    """
+    現在のバージョンを返す（ない場合は作成する）
+    """
+    version = _cache().get(key)
+    if version is None:
+        _cache().add(key, _new_version(), VERSION_TIMEOUT)
+        version = _cache().get(key)
+    return version
+
+
+def build_etag(coupon_code, coupon, today=None):
+    """
+    クーポンコード・クーポンの更新日時と有効期限からETagを作成する
+    """
+    today = today or timezone.localdate()
+    expired = coupon.expiration_date is not None and coupon.expiration_date < today
+    basis = ":".join([
+        str(coupon_code.coupon_uuid),
+        coupon_code.updated_at.isoformat(),
+        coupon.updated_at.isoformat(),
+        str(coupon.expiration_date),
+        "expired" if expired else "valid",
+    ])
+    return quote_etag(hashlib.sha1(basis.encode()).hexdigest())
+
+
+def max_age(expiration_date, now=None):
+    """
+    ブラウザにキャッシュさせる秒数を返す
+    - 有効期限切れの表示に切り替わる時刻（有効期限の翌日0時）を超えないようにする
+    """
+    limit = getattr(settings, "COUPON_PAGE_MAX_AGE", 60)
+    if expiration_date is None:
+        return limit
+    now = now or timezone.localtime()
+    switch_at = timezone.make_aware(
+        datetime.combine(expiration_date + timedelta(days=1), time.min),
+        timezone.get_current_timezone(),
+    )
+    remaining = int((switch_at - now).total_seconds())
+    if remaining <= 0:
+        return limit
+    return min(limit, remaining)
+
+
+def get_page(coupon_code_uuid):
+    """
+    キャッシュ済みのページを取得する
+    Returns:
+        dict: キャッシュ済みのページ（content, etag, last_modified, expiration_date など）
+        None: キャッシュがない、またはクーポンコード・クーポンのバージョンが一致しない場合
+    """
+    entry = _cache().get(page_key(coupon_code_uuid))
+    if entry is None:
+        return None
+    code_key = code_version_key(coupon_code_uuid)
+    coupon_key = coupon_version_key(entry["coupon_id"])
+    versions = _cache().get_many([code_key, coupon_key])
+    if versions.get(code_key) != entry["code_version"] or versions.get(coupon_key) != entry["coupon_version"]:
+        return None
+    return entry
+
+
+def begin_fill(coupon_code_uuid):
+    """
+    DBからページの内容を取得する前に、保存に使用するバージョンを読み込む
+    Returns:
+        dict: set_page に渡すバージョン（code_version, coupon_id, coupon_version）
+    """
+    coupon_id = _cache().get(code_coupon_key(coupon_code_uuid))
+    return {
+        "code_version": _current_version(code_version_key(coupon_code_uuid)),
+        "coupon_id": coupon_id,
+        "coupon_version": _current_version(coupon_version_key(coupon_id)) if coupon_id is not None else None,
+    }
+
+
+def set_page(coupon_code, coupon, content, fill):
+    """
+    表示結果を begin_fill で読み込んだバージョンでキャッシュに保存する
+    - クーポンIDが未保存の場合（初回の表示）はクーポンIDのみ保存し、ページは保存しない
+    Returns:
+        dict: 作成したページ
+    """
+    entry = {
+        "coupon_id": coupon.id,
+        "code_version": fill["code_version"],
+        "coupon_version": fill["coupon_version"],
+        "content": content,
+        "etag": build_etag(coupon_code, coupon),
+        "last_modified": max(coupon_code.updated_at, coupon.updated_at),
+        "expiration_date": coupon.expiration_date,
+    }
+    if fill["coupon_id"] != coupon.id:
+        _cache().set(code_coupon_key(coupon_code.coupon_uuid), coupon.id, VERSION_TIMEOUT)
+        return entry
+    _cache().set(page_key(coupon_code.coupon_uuid), entry)
+    return entry
+
+
+def invalidate_code(coupon_code_uuid):
+    """
+    指定されたクーポンコードのページのキャッシュを無効化する（クーポンコードの使用時）
+    """
+    _cache().set(code_version_key(coupon_code_uuid), _new_version(), VERSION_TIMEOUT)
+
+
+def invalidate_codes(coupon_code_uuids):
+    """
+    指定された複数のクーポンコードのページのキャッシュを無効化する（一括認証時）
+    """
+    versions = {code_version_key(coupon_code_uuid): _new_version() for coupon_code_uuid in coupon_code_uuids}
+    if versions:
+        _cache().set_many(versions, VERSION_TIMEOUT)
+
+
+def invalidate_coupon(coupon_id):
+    """
+    指定されたクーポンに属する全クーポンコードのページのキャッシュを無効化する（クーポンの削除時）
+    """
+    _cache().set(coupon_version_key(coupon_id), _new_version(), VERSION_TIMEOUT)
@@ -0,0 +1,534 @@
+"""
+QRコードのエンコーダーと SVG / PNG への描画（外部ライブラリを使わない純Python実装）
+
+- JIS X 0510（ISO/IEC 18004）の英数字モードとバイトモードに対応（クーポンのURL・UUIDの表示用）
+  英数字（0-9 A-Z と空白 $%*+-./:）のみの文字列は英数字モード（1文字あたり 5.5ビット）で格納する
+- 型番（バージョン 1〜40）はデータ量から自動で選び、マスクは失点が最小のものを選ぶ
+- エンコード結果（モジュールの行列）は LRU キャッシュに保持する（COUPON_QR_CACHE_SIZE 件）
+  同じ内容からは常に同じ行列になるため、キャッシュの無効化は不要
+"""
+import base64
+import functools
+import struct
+import uuid
+import zlib
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.urls import Resolver404, resolve, reverse
+
+# エンコード結果が変わる変更をした場合に上げる（QR画像の ETag に含める）
+ENCODER_VERSION = 2
+
+# 誤り訂正レベル: (表のインデックス, 形式情報のビット)
+ECC_LEVELS = {"L": (0, 1), "M": (1, 0), "Q": (2, 3), "H": (3, 2)}
+
+# 1ブロックあたりの誤り訂正コード語数 [レベル][型番]
+_ECC_CODEWORDS_PER_BLOCK = (
+    (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+     28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+     26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+     28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+     30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+)
+
+# 誤り訂正ブロック数 [レベル][型番]
+_NUM_ERROR_CORRECTION_BLOCKS = (
+    (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+     8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+     17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+     23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+     25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+)
+
+_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+# 英数字モードで格納できる文字（並び順が値になる）
+_ALPHANUMERIC = {char: index for index, char in enumerate("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")}
+
+# 失点計算で検出する 1:1:3:1:1 のパターン（前後に4モジュールの明）
+_FINDER_LIKE = ("10111010000", "00001011101")
+
+
+def _build_gf_tables():
+    exp = [0] * 512
+    log = [0] * 256
+    value = 1
+    for i in range(255):
+        exp[i] = value
+        log[value] = i
+        value <<= 1
+        if value & 0x100:
+            value ^= 0x11D
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+
+_GF_EXP, _GF_LOG = _build_gf_tables()
+
+
+def _gf_mul(x, y):
+    if x == 0 or y == 0:
+        return 0
+    return _GF_EXP[_GF_LOG[x] + _GF_LOG[y]]
+
+
+@functools.lru_cache(maxsize=None)
+def _rs_divisor(degree):
+    """
+    リード・ソロモン符号の生成多項式（最高次の係数を除く）
+    """
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_mul(root, 0x02)
+    return tuple(result)
+
+
+def _rs_remainder(data, divisor):
+    result = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ result.pop(0)
+        result.append(0)
+        if factor:
+            for i, coefficient in enumerate(divisor):
+                result[i] ^= _gf_mul(coefficient, factor)
+    return result
+
+
+def _num_raw_data_modules(version):
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _num_data_codewords(version, ecc_index):
+    return (
+        _num_raw_data_modules(version) // 8
+        - _ECC_CODEWORDS_PER_BLOCK[ecc_index][version] * _NUM_ERROR_CORRECTION_BLOCKS[ecc_index][version]
+    )
+
+
+def _alignment_positions(version):
+    if version == 1:
+        return []
+    size = version * 4 + 17
+    num_align = version // 7 + 2
+    step = 26 if version == 32 else (version * 4 + num_align * 2 + 1) // (num_align * 2 - 2) * 2
+    result = [size - 7 - i * step for i in range(num_align - 1)] + [6]
+    return list(reversed(result))
+
+
+class _Builder:
+    """
+    1つのQRコードの行列を組み立てる（encode からのみ使用する）
+    """
+
+    def __init__(self, version, ecc_bits):
+        self.version = version
+        self.ecc_bits = ecc_bits
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def draw_function_patterns(self):
+        size = self.size
+        # タイミングパターン
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+        # 位置検出パターン（分離パターンを含む）
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self.set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+        # 位置合わせパターン（位置検出パターンと重なる3隅を除く）
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self.draw_format_bits(0)
+        self.draw_version()
+
+    def draw_format_bits(self, mask):
+        data = self.ecc_bits << 3 | mask
+        remainder = data
+        for _ in range(10):
+            remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+        bits = (data << 10 | remainder) ^ 0x5412
+        bit = lambda i: (bits >> i) & 1 != 0
+        size = self.size
+
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)
+
+    def draw_version(self):
+        if self.version < 7:
+            return
+        remainder = self.version
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+        bits = self.version << 12 | remainder
+        for i in range(18):
+            dark = (bits >> i) & 1 != 0
+            a = self.size - 11 + i % 3
+            b = i // 3
+            self.set_function(a, b, dark)
+            self.set_function(b, a, dark)
+
+    def draw_codewords(self, codewords):
+        size = self.size
+        index = 0
+        total = len(codewords) * 8
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = ((right + 1) & 2) == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for j in range(2):
+                    x = right - j
+                    if not self.is_function[y][x] and index < total:
+                        self.modules[y][x] = (codewords[index >> 3] >> (7 - (index & 7))) & 1 != 0
+                        index += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        pattern = _MASKS[mask]
+        for y in range(self.size):
+            row = self.modules[y]
+            function_row = self.is_function[y]
+            for x in range(self.size):
+                if not function_row[x] and pattern(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self):
+        size = self.size
+        rows = ["".join("1" if dark else "0" for dark in row) for row in self.modules]
+        columns = ["".join(row[x] for row in rows) for x in range(size)]
+        score = 0
+        for line in rows + columns:
+            # 同色のモジュールが5個以上連続
+            run_color, run_length = None, 0
+            for char in line:
+                if char == run_color:
+                    run_length += 1
+                else:
+                    if run_length >= 5:
+                        score += 3 + run_length - 5
+                    run_color, run_length = char, 1
+            if run_length >= 5:
+                score += 3 + run_length - 5
+            # 位置検出パターンに似た並び（両端の外側は明として扱う）
+            padded = "0000" + line + "0000"
+            for pattern in _FINDER_LIKE:
+                start = padded.find(pattern)
+                while start != -1:
+                    score += 40
+                    start = padded.find(pattern, start + 1)
+        # 2x2 の同色のブロック
+        for y in range(size - 1):
+            upper, lower = rows[y], rows[y + 1]
+            for x in range(size - 1):
+                color = upper[x]
+                if color == upper[x + 1] == lower[x] == lower[x + 1]:
+                    score += 3
+        # 暗モジュールの比率の偏り
+        dark = sum(row.count("1") for row in rows)
+        total = size * size
+        score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+        return score
+
+
+def _append_bits(bits, value, length):
+    bits.extend((value >> i) & 1 for i in reversed(range(length)))
+
+
+def _segment(text):
+    """
+    文字列をデータのビット列にする（英数字のみの場合は英数字モード、それ以外はバイトモード）
+    Returns:
+        tuple: (モード指示子, 文字数, データのビット列, 文字数指示子のビット数（型番 1-9 / 10-26 / 27-40）)
+    """
+    bits = []
+    if text and all(char in _ALPHANUMERIC for char in text):
+        for i in range(0, len(text) - 1, 2):
+            _append_bits(bits, _ALPHANUMERIC[text[i]] * 45 + _ALPHANUMERIC[text[i + 1]], 11)
+        if len(text) % 2:
+            _append_bits(bits, _ALPHANUMERIC[text[-1]], 6)
+        return 0b0010, len(text), bits, (9, 11, 13)
+    data = text.encode("utf-8")
+    for byte in data:
+        _append_bits(bits, byte, 8)
+    return 0b0100, len(data), bits, (8, 16, 16)
+
+
+def _count_bits(version, widths):
+    return widths[0] if version <= 9 else widths[1] if version <= 26 else widths[2]
+
+
+def _codewords(segment, version, ecc_index):
+    """
+    データにモード・文字数・終端・埋め草を付けてコード語にし、誤り訂正コード語を付けて配置順に並べる
+    """
+    mode, length, data_bits, widths = segment
+    bits = []
+    append = functools.partial(_append_bits, bits)
+    append(mode, 4)
+    append(length, _count_bits(version, widths))
+    bits.extend(data_bits)
+    capacity = _num_data_codewords(version, ecc_index) * 8
+    append(0, min(4, capacity - len(bits)))
+    append(0, -len(bits) % 8)
+    words = [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(words) < capacity // 8:
+        words.append(pad)
+        pad ^= 0xEC ^ 0x11
+
+    num_blocks = _NUM_ERROR_CORRECTION_BLOCKS[ecc_index][version]
+    block_ecc_len = _ECC_CODEWORDS_PER_BLOCK[ecc_index][version]
+    raw_codewords = _num_raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks
+    divisor = _rs_divisor(block_ecc_len)
+
+    blocks = []
+    offset = 0
+    for i in range(num_blocks):
+        length = short_block_len - block_ecc_len + (0 if i < num_short_blocks else 1)
+        block = words[offset:offset + length]
+        offset += length
+        ecc = _rs_remainder(block, divisor)
+        if i < num_short_blocks:
+            block.append(0)
+        blocks.append(block + ecc)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            if i != short_block_len - block_ecc_len or j >= num_short_blocks:
+                result.append(block[i])
+    return result
+
+
+def _encode(text, ecc="M"):
+    segment = _segment(text)
+    ecc_index, ecc_bits = ECC_LEVELS[ecc]
+    for version in range(1, 41):
+        required = 4 + _count_bits(version, segment[3]) + len(segment[2])
+        if required <= _num_data_codewords(version, ecc_index) * 8:
+            break
+    else:
+        raise ValueError("QRコードに格納できるデータ量を超えています")
+
+    builder = _Builder(version, ecc_bits)
+    builder.draw_function_patterns()
+    builder.draw_codewords(_codewords(segment, version, ecc_index))
+
+    best_mask, best_score = 0, None
+    for mask in range(8):
+        builder.apply_mask(mask)
+        builder.draw_format_bits(mask)
+        score = builder.penalty()
+        if best_score is None or score < best_score:
+            best_mask, best_score = mask, score
+        builder.apply_mask(mask)
+    builder.apply_mask(best_mask)
+    builder.draw_format_bits(best_mask)
+    return tuple(tuple(row) for row in builder.modules)
+
+
+# エンコード結果の LRU キャッシュ（cache_info() でヒット率を確認できる）
+encode = functools.lru_cache(maxsize=getattr(settings, "COUPON_QR_CACHE_SIZE", 1024))(_encode)
+encode.__doc__ = """
+    文字列をQRコードにエンコードする（結果は LRU キャッシュに保持する）
+    Args:
+        text (str): 格納する文字列（英数字のみの場合は英数字モード、それ以外は UTF-8 のバイトモードで格納する）
+        ecc (str): 誤り訂正レベル（L / M / Q / H）
+    Returns:
+        tuple[tuple[bool, ...], ...]: モジュールの行列（True が暗モジュール）
+    Raises:
+        ValueError: データ量が型番40の容量を超える場合
+    """
+
+
+def to_svg(matrix, border=4):
+    """
+    モジュールの行列を SVG にする（1モジュール = 1単位の viewBox。表示サイズは img 側で指定する）
+    Returns:
+        bytes: SVG
+    """
+    size = len(matrix) + border * 2
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                path.append(f"M{start + border},{y + border}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="#000"/>'
+        "</svg>"
+    ).encode()
+
+
+def to_png(matrix, scale=8, border=4):
+    """
+    モジュールの行列を PNG（1ビットグレースケール）にする
+    Args:
+        scale (int): 1モジュールあたりのピクセル数
+        border (int): 余白（クワイエットゾーン）のモジュール数
+    Returns:
+        bytes: PNG
+    """
+    modules = len(matrix) + border * 2
+    width = modules * scale
+    # 1ビットグレースケールは 1 が白
+    blank = [True] * modules
+    raw = bytearray()
+    for y in range(modules):
+        matrix_y = y - border
+        if 0 <= matrix_y < len(matrix):
+            row = [True] * border + [not dark for dark in matrix[matrix_y]] + [True] * border
+        else:
+            row = blank
+        bits = "".join(("1" if white else "0") * scale for white in row)
+        bits += "0" * (-len(bits) % 8)
+        line = b"\x00" + int(bits, 2).to_bytes(len(bits) // 8, "big")
+        raw += line * scale
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, 1, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(bytes(raw), 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+# クーポンコードUUIDのコンパクト形式（"VZ1" + UUID 16バイトの base32。英数字モードで格納できる）
+COMPACT_PREFIX = "VZ1"
+COMPACT_LENGTH = len(COMPACT_PREFIX) + 26
+
+
+def compact_token(coupon_code_uuid):
+    """
+    クーポンコードUUIDを base32（大文字・パディングなしの26文字）にする
+    """
+    return base64.b32encode(coupon_code_uuid.bytes).decode().rstrip("=")
+
+
+def decode_token(token):
+    """
+    compact_token の文字列をクーポンコードUUIDに戻す（大文字・小文字は区別しない）
+    Returns:
+        uuid.UUID: クーポンコードUUID
+        None: 形式が不正な場合
+    """
+    if len(token) != 26:
+        return None
+    try:
+        return uuid.UUID(bytes=base64.b32decode(token.upper() + "======"))
+    except (ValueError, TypeError):
+        return None
+
+
+def compact_payload(coupon_code_uuid):
+    """
+    店舗で読み取るQRコードの内容（"VZ1" + base32。UUID 36文字のバイトモードより小さい型番になる）
+    """
+    return COMPACT_PREFIX + compact_token(coupon_code_uuid)
+
+
+def short_url(coupon_code_uuid):
+    """
+    お客様向けページの短縮URL（/C/<base32>/）
+    英数字モードで格納できるよう、スキーム・ホストも大文字にする（大文字・小文字は区別されない）
+    """
+    path = reverse("coupon_short_view", args=[compact_token(coupon_code_uuid)])
+    return settings.COUPON_PUBLIC_BASE_URL.rstrip("/").upper() + path
+
+
+def parse_payload(payload):
+    """
+    QRコードから読み取った内容をクーポンコードUUIDにする
+    - コンパクト形式（VZ1...）、UUID、短縮URL（/C/<base32>/）、お客様向けページのURL（/coupon/view/<uuid>/）に対応
+    Returns:
+        uuid.UUID: クーポンコードUUID
+        None: いずれの形式にも該当しない場合
+    """
+    payload = (payload or "").strip()
+    if len(payload) == COMPACT_LENGTH and payload.upper().startswith(COMPACT_PREFIX):
+        return decode_token(payload[len(COMPACT_PREFIX):])
+    if "/" not in payload:
+        try:
+            return uuid.UUID(payload)
+        except ValueError:
+            return None
+
+    try:
+        match = resolve(urlsplit(payload).path)
+    except Resolver404:
+        return None
+    if match.view_name == "coupon_short_view":
+        return decode_token(match.kwargs["token"])
+    if match.view_name == "coupon:coupon_customer_view":
+        return match.kwargs["coupon_code_uuid"]
+    return None
@@ -0,0 +1,171 @@
+"""
+Coupon / CouponCode のクラスメソッドが発行するクエリの実行計画の確認
+
+- access_paths: 確認対象のクラスメソッド呼び出しの一覧（更新系も含むため、呼び出し側でロールバックする）
+- capture / explain / full_scans: 発行されたクエリの実行計画を取得し、フルスキャンを抽出する
+- sorts: インデックスの順に読み込めず、取得後に並び替えている箇所を抽出する
+- coupon/tests.py（テスト用DB）と check_query_plans コマンド（既存のデータ）で使用する
+"""
+import json
+import re
+from datetime import timedelta
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account.models import Store
+
+from . import code_filter
+from .models import Coupon, CouponCode, CouponCodePool, CouponStatBucket, CouponStatus
+from .views.list_views import CouponListView, encode_cursor
+
+
+def find_sample():
+    """
+    確認に使用する未使用の有効なクーポンコード（ない場合は None）
+    """
+    return (
+        CouponCode.objects
+        .filter(coupon__status=CouponStatus.ACTIVE, redeemed_at__isnull=True)
+        .select_related("coupon__store")
+        .order_by("-id")
+        .first()
+    )
+
+
+def access_paths(sample):
+    """
+    確認対象のクラスメソッド呼び出し（名前, 呼び出し関数）の一覧
+    Args:
+        sample (CouponCode): 未使用の有効なクーポンコード（クーポン・店舗を取得済みのもの）
+    """
+    coupon = sample.coupon
+    store_id = sample.store_id
+    list_view = CouponListView()
+    list_view.store_id = store_id
+    # 2ページ目以降（キーセットによる絞り込み）
+    page_view = CouponListView()
+    page_view.store_id = store_id
+    page_view.request = RequestFactory().get("/", {"cursor": encode_cursor(coupon)})
+    return [
+        ("Store._fetch_store_id_for_user", lambda: Store._fetch_store_id_for_user(coupon.store.user_id)),
+        ("Store._fetch_store_name", lambda: Store._fetch_store_name(store_id)),
+        ("Coupon.get_state", lambda: Coupon.get_state(coupon.id)),
+        ("Coupon.get_coupon", lambda: Coupon.get_coupon(coupon.id)),
+        ("Coupon.get_store_user_id", lambda: Coupon.get_store_user_id(coupon.id)),
+        ("Coupon.get_for_delete_check", lambda: Coupon.get_for_delete_check(coupon.id)),
+        ("Coupon.get_for_expiration_check", lambda: Coupon.get_for_expiration_check(coupon.id)),
+        ("Coupon.get_for_issuance_check", lambda: Coupon.get_for_issuance_check(coupon.id)),
+        ("Coupon.get_coupon_list", lambda: list(Coupon.get_coupon_list(store_id))),
+        ("CouponListView.get_base_queryset", lambda: list(list_view.get_base_queryset()[:30])),
+        ("CouponListView.get_queryset(cursor)", page_view.get_queryset),
+        ("Coupon.sweep_expired", lambda: Coupon.sweep_expired(chunk_size=100)),
+        ("Coupon.increment_issued", lambda: Coupon.increment_issued(coupon.id)),
+        ("CouponCode.get_with_coupon(id)", lambda: CouponCode.get_with_coupon(id=sample.id)),
+        ("CouponCode.get_with_coupon(uuid)", lambda: CouponCode.get_with_coupon(uuid=sample.coupon_uuid)),
+        ("CouponCode.get_coupon_id_by_id", lambda: CouponCode.get_coupon_id_by_id(sample.id)),
+        ("CouponCode.get_coupon_id_by_code_uuid", lambda: CouponCode.get_coupon_id_by_code_uuid(sample.coupon_uuid)),
+        ("CouponCode.get_coupon_code_by_id", lambda: CouponCode.get_coupon_code_by_id(sample.id)),
+        ("CouponCode.get_coupon_code_by_code_uuid", lambda: CouponCode.get_coupon_code_by_code_uuid(sample.coupon_uuid)),
+        ("CouponCode.get_coupon_code(code)", lambda: CouponCode.get_coupon_code(store_id, code=sample.coupon_code)),
+        ("CouponCode.get_coupon_code(uuid)", lambda: CouponCode.get_coupon_code(store_id, uuid=sample.coupon_uuid)),
+        ("CouponCode.issue", lambda: CouponCode.issue(coupon.id)),
+        ("CouponCode.issue_batch", lambda: CouponCode.issue_batch(coupon.id, 10)),
+        ("CouponCode.redeem", lambda: CouponCode.redeem(store_id, code=sample.coupon_code)),
+        ("CouponCode.redeem_batch", lambda: CouponCode.redeem_batch(
+            store_id, [{"code": sample.coupon_code}, {"uuid": sample.coupon_uuid}]
+        )),
+        ("CouponStatBucket.series(coupon)", lambda: CouponStatBucket.series(
+            timezone.now() - timedelta(days=30), timezone.now(), coupon_id=coupon.id
+        )),
+        ("CouponStatBucket.series(store)", lambda: CouponStatBucket.series(
+            timezone.now() - timedelta(days=30), timezone.now(), store_id=store_id
+        )),
+        ("code_filter._load_store", lambda: code_filter._load_store(store_id)),
+        ("code_filter._refresh_tail", lambda: (code_filter._refresh_tail(force=True), code_filter._refresh_tail(force=True))),
+        ("CouponCodePool.claim", lambda: CouponCodePool.claim(store_id)),
+        ("CouponCodePool.depth", lambda: CouponCodePool.depth([store_id])),
+        ("Coupon.logical_delete", lambda: Coupon.logical_delete(coupon.id)),
+    ]
+
+
+def capture(call):
+    """
+    呼び出し中に発行された SELECT / UPDATE / DELETE 文を返す
+    """
+    with CaptureQueriesContext(connection) as context:
+        call()
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if re.match(r"\s*(SELECT|UPDATE|DELETE)\b", query["sql"], re.IGNORECASE)
+    ]
+
+
+def explain(sql):
+    """
+    実行計画を取得する（SQLite: EXPLAIN QUERY PLAN / MySQL: EXPLAIN FORMAT=JSON）
+    Returns:
+        list[str]: 実行計画の各行
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "mysql":
+            cursor.execute(f"EXPLAIN FORMAT=JSON {sql}")
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}")
+        return [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """
+    実行計画からテーブルのフルスキャン（インデックスを使わない全件走査）を抽出する
+    """
+    if connection.vendor == "mysql":
+        scans = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get("access_type") in ("ALL", "index"):
+                    scans.append(f"{node.get('table_name')}: {node.get('access_type')}")
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        for line in plan:
+            walk(json.loads(line))
+        return scans
+    if connection.vendor == "sqlite":
+        return [
+            line for line in plan
+            if re.match(r"SCAN (?!CONSTANT ROW)", line) and "USING" not in line
+        ]
+    return [line for line in plan if "Seq Scan" in line]
+
+
+def sorts(plan):
+    """
+    実行計画から取得後の並び替え（インデックスの順に読み込めない ORDER BY）を抽出する
+    """
+    if connection.vendor == "mysql":
+        return [line for line in plan if '"using_filesort": true' in line]
+    if connection.vendor == "sqlite":
+        return [line for line in plan if "USE TEMP B-TREE FOR ORDER BY" in line]
+    return [line for line in plan if line.lstrip().startswith("Sort")]
+
+
+def analyze():
+    """
+    テーブルの統計情報を更新する（オプティマイザがデータ量に応じた実行計画を選ぶため）
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute("ANALYZE TABLE coupons, coupon_codes, stores")
+        elif connection.vendor == "sqlite":
+            cursor.execute("ANALYZE")
@@ -0,0 +1,381 @@
+"""
+クーポンデータの店舗単位のシャーディング（COUPON_SHARDS にDBのエイリアスを指定した場合のみ有効）
+
+- Coupon / CouponCode など店舗ごとのデータ（SHARDED_MODELS）は、店舗ごとに COUPON_SHARDS の
+  いずれかのDBに保存する。ユーザー・店舗・セッションなどはディレクトリ（default）に保存する
+- 店舗の保存先は StoreShard（ディレクトリ）に記録する。未登録の店舗は初回の参照時に
+  store_id を COUPON_SHARDS の数で割った余りで決めて登録する（シャードを追加しても既存の店舗は移動しない）
+- 保存先は「現在の店舗」（use_store）で決まり、ShardRouter がその店舗のDBに振り分ける
+  - ログイン中の店舗ユーザーのリクエスト: ShardMiddleware
+  - お客様向けページ（クーポンコードUUID）: use_code_uuid
+  - 管理コマンド: each_shard / use_store / use_coupon
+- 新しく発行するクーポンコードUUIDには店舗IDを鍵付きで埋め込み（UUID version 8）、DBを参照せずに店舗を求める
+  （シャードの番号ではなく店舗を埋め込むため、rebalance_coupon_shards で店舗を移動しても変わらない）。
+  埋め込みのないUUID（version 4）は全シャードを検索する
+- rebalance_coupon_shards で店舗を移動している間（StoreShard.moving）は、その店舗への書き込みを
+  ShardMovingError で拒否する
+- トランザクションは atomic() / on_commit() / set_rollback() で現在の店舗のDBに対して使用する
+- クーポンから店舗への外部キー制約はスキーマに残し、ディレクトリ以外のシャードへの接続でのみ検査しない
+  （disable_shard_fk_checks）
+"""
+import contextlib
+import contextvars
+import hashlib
+import hmac
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from config.db.router import read_alias as replica_read_alias
+
+from .codes import feistel, feistel_inverse
+
+logger = logging.getLogger(__name__)
+
+# ディレクトリ（ユーザー・店舗・StoreShard）のDB
+DIRECTORY_ALIAS = DEFAULT_DB_ALIAS
+# 店舗ごとにシャードに保存するモデル（model_name）
+SHARDED_MODELS = frozenset({
+    "coupon",
+    "couponcode",
+    "couponcodesequence",
+    "couponcodepool",
+    "couponcountershard",
+    "couponstatbucket",
+})
+KEY_PREFIX = "coupon_shard"
+# クーポンコードUUIDに埋め込む店舗IDのビット数
+STORE_TOKEN_BITS = 32
+UUID_VERSION = 8
+
+
+class ShardMovingError(DatabaseError):
+    """
+    店舗の移動中（rebalance_coupon_shards）に、その店舗のデータを書き込もうとした場合のエラー
+    """
+
+
+class _Context:
+    def __init__(self, alias, store_id=None, moving=False):
+        self.alias = alias
+        self.store_id = store_id
+        self.moving = moving
+
+
+_context = contextvars.ContextVar("coupon_shard_context", default=None)
+
+
+def shard_aliases():
+    return list(getattr(settings, "COUPON_SHARDS", None) or [])
+
+
+def enabled():
+    return bool(shard_aliases())
+
+
+def is_sharded(model):
+    return model._meta.app_label == "coupon" and model._meta.model_name in SHARDED_MODELS
+
+
+def current_alias():
+    """
+    現在の店舗（シャード）のDBのエイリアス（シャーディングが無効な場合・店舗が未設定の場合は default）
+    """
+    context = _context.get()
+    return context.alias if context is not None else DEFAULT_DB_ALIAS
+
+
+def read_alias():
+    """
+    読み取り専用の取得処理で使用するDBのエイリアス
+    - シャーディングが有効な場合は現在の店舗のシャード（レプリカは使用しない）
+    - 無効な場合は config.db.router.read_alias（レプリカまたは default）
+    """
+    return current_alias() if enabled() else replica_read_alias()
+
+
+# ---- ディレクトリ（店舗 → シャード） ----
+
+def _cache():
+    return caches[getattr(settings, "STORE_CACHE_ALIAS", "stores")]
+
+
+def placement_key(store_id):
+    return f"{KEY_PREFIX}:store:{store_id}"
+
+
+def default_shard(store_id):
+    aliases = shard_aliases()
+    return aliases[int(store_id) % len(aliases)]
+
+
+def get_placement(store_id):
+    """
+    店舗の保存先のシャードと移動中かどうかを返す（未登録の場合は登録する）
+    - COUPON_SHARD_CACHE_TIMEOUT 秒キャッシュする（存在しない店舗の場合も含む）
+    Args:
+        store_id (int): 店舗ID
+    Returns:
+        tuple[str, bool] | None: (シャードのエイリアス, 移動中か)。店舗が存在しない場合は None
+    """
+    from account.models import Store
+    from .models import StoreShard
+
+    key = placement_key(store_id)
+    placement = _cache().get(key)
+    if placement is None:
+        row = (
+            StoreShard.objects.using(DIRECTORY_ALIAS)
+            .filter(store_id=store_id)
+            .values_list("alias", "moving")
+            .first()
+        )
+        if row is None and Store.objects.using(DIRECTORY_ALIAS).filter(id=store_id).exists():
+            shard, _ = StoreShard.objects.using(DIRECTORY_ALIAS).get_or_create(
+                store_id=store_id, defaults={"alias": default_shard(store_id)}
+            )
+            row = (shard.alias, shard.moving)
+        # 存在しない店舗（UUIDに埋め込まれた不正な店舗IDなど）は ("", False) としてキャッシュする
+        placement = row or ("", False)
+        _cache().set(key, placement, getattr(settings, "COUPON_SHARD_CACHE_TIMEOUT", 30))
+    alias, moving = placement
+    return (alias, moving) if alias else None
+
+
+def invalidate_placement(store_id):
+    _cache().delete(placement_key(store_id))
+
+
+def shard_for_store(store_id):
+    placement = get_placement(store_id) if enabled() else None
+    return placement[0] if placement else DEFAULT_DB_ALIAS
+
+
+@contextlib.contextmanager
+def use_store(store_id):
+    """
+    with の中で、指定された店舗のデータを店舗の保存先のシャードで読み書きする
+    Yields:
+        str: シャードのエイリアス
+    """
+    placement = get_placement(store_id) if enabled() and store_id is not None else None
+    if placement is None:
+        yield current_alias()
+        return
+    alias, moving = placement
+    token = _context.set(_Context(alias, store_id=int(store_id), moving=moving))
+    try:
+        yield alias
+    finally:
+        _context.reset(token)
+
+
+@contextlib.contextmanager
+def use_shard(alias):
+    """
+    with の中で、指定されたシャードのデータを読み書きする（全シャードを処理する管理コマンド用）
+    """
+    token = _context.set(_Context(alias))
+    try:
+        yield alias
+    finally:
+        _context.reset(token)
+
+
+def each_shard():
+    """
+    シャードごとに、そのシャードを現在のシャードにして返す（シャーディングが無効な場合は default のみ）
+    Yields:
+        str: シャードのエイリアス
+    """
+    for alias in shard_aliases() or [DEFAULT_DB_ALIAS]:
+        with use_shard(alias):
+            yield alias
+
+
+def _locate(model, **filters):
+    """
+    全シャードから条件に一致する行の store_id を探す
+    - 移動の途中で残った行を除くため、ディレクトリ上の保存先と一致するシャードの行だけを返す
+    """
+    for alias in shard_aliases():
+        store_ids = model.objects.using(alias).filter(**filters).values_list("store_id", flat=True)
+        for store_id in store_ids:
+            placement = get_placement(store_id)
+            if placement is not None and placement[0] == alias:
+                return store_id
+    return None
+
+
+@contextlib.contextmanager
+def use_coupon(coupon_id):
+    """
+    with の中で、指定されたクーポンの店舗のシャードで読み書きする（クーポンIDを指定する管理コマンド用）
+    """
+    from .models import Coupon
+
+    store_id = _locate(Coupon, id=coupon_id) if enabled() else None
+    with use_store(store_id) as alias:
+        yield alias
+
+
+@contextlib.contextmanager
+def use_code_uuid(coupon_code_uuid):
+    """
+    with の中で、指定されたクーポンコードUUIDの店舗のシャードで読み書きする（お客様向けページ用）
+    - UUIDに埋め込んだ店舗IDを使用し、埋め込みのないUUIDは全シャードを検索する
+    """
+    from .models import CouponCode
+
+    store_id = None
+    if enabled():
+        # ログイン中の店舗ユーザーが他の店舗のページを開く場合もあるため、現在の店舗によらずUUIDから求める
+        store_id = store_id_from_uuid(coupon_code_uuid)
+        if store_id is None:
+            store_id = _locate(CouponCode, coupon_uuid=coupon_code_uuid)
+    with use_store(store_id) as alias:
+        yield alias
+
+
+# ---- クーポンコードUUIDへの店舗IDの埋め込み ----
+
+def _uuid_key():
+    secret = getattr(settings, "COUPON_CODE_SECRET", None) or settings.SECRET_KEY
+    return hmac.new(secret.encode(), b"coupon-shard-uuid", hashlib.sha256).digest()
+
+
+def new_code_uuid(store_id):
+    """
+    新しく発行するクーポンコードのUUID
+    - シャーディングが有効な場合、先頭32ビットに店舗IDを鍵付きで並べ替えた値を埋め込む（UUID version 8）。
+      残りの90ビットはランダム
+    - シャーディングが無効な場合・店舗IDが32ビットを超える場合は uuid4
+    """
+    store_id = int(store_id)
+    if not enabled() or not 0 <= store_id < (1 << STORE_TOKEN_BITS):
+        return uuid.uuid4()
+    token = feistel(store_id, _uuid_key(), STORE_TOKEN_BITS // 2)
+    raw = bytearray(os.urandom(16))
+    raw[0:4] = token.to_bytes(4, "big")
+    raw[6] = (raw[6] & 0x0F) | (UUID_VERSION << 4)
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    return uuid.UUID(bytes=bytes(raw))
+
+
+def store_id_from_uuid(coupon_code_uuid):
+    """
+    new_code_uuid で埋め込んだ店舗IDを取り出す
+    Returns:
+        int | None: 店舗ID（埋め込みのないUUIDの場合は None）
+    """
+    try:
+        value = coupon_code_uuid if isinstance(coupon_code_uuid, uuid.UUID) else uuid.UUID(str(coupon_code_uuid))
+    except ValueError:
+        return None
+    if value.version != UUID_VERSION:
+        return None
+    token = int.from_bytes(value.bytes[:4], "big")
+    return feistel_inverse(token, _uuid_key(), STORE_TOKEN_BITS // 2)
+
+
+# ---- トランザクション ----
+
+def atomic():
+    return transaction.atomic(using=current_alias())
+
+
+def in_atomic_block():
+    return transaction.get_connection(current_alias()).in_atomic_block
+
+
+def on_commit(func):
+    transaction.on_commit(func, using=current_alias())
+
+
+def set_rollback(rollback):
+    transaction.set_rollback(rollback, using=current_alias())
+
+
+@receiver(connection_created)
+def disable_shard_fk_checks(sender, connection, **kwargs):
+    """
+    ディレクトリ以外のシャードへの接続では、外部キー制約を検査しない
+    - シャードには店舗のテーブルがないため、クーポンから店舗への外部キー制約（スキーマには残す）を検査できない
+    - MySQL: foreign_key_checks = 0 / SQLite: PRAGMA foreign_keys = OFF（migrate を含む接続ごと）
+    """
+    if connection.alias != DIRECTORY_ALIAS and connection.alias in shard_aliases():
+        connection.disable_constraint_checking()
+
+
+class ShardRouter:
+    """
+    SHARDED_MODELS を現在の店舗のシャードに、それ以外のモデルの読み込みをディレクトリに振り分ける
+    （シャーディングが無効な場合は何もしない）
+    """
+
+    def db_for_read(self, model, **hints):
+        if not enabled():
+            return None
+        if not is_sharded(model):
+            return DIRECTORY_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and is_sharded(type(instance)) and instance._state.db:
+            return instance._state.db
+        return current_alias()
+
+    def db_for_write(self, model, **hints):
+        if not enabled() or not is_sharded(model):
+            return None
+        context = _context.get()
+        if context is not None and context.moving:
+            raise ShardMovingError(f"店舗のデータを移動中です: store_id={context.store_id}")
+        instance = hints.get("instance")
+        if instance is not None and is_sharded(type(instance)) and instance._state.db:
+            return instance._state.db
+        return current_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Coupon（シャード）と Store（ディレクトリ）の関連を許可する
+        return True if enabled() else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not enabled():
+            return None
+        if app_label == "coupon" and model_name in SHARDED_MODELS:
+            return db in shard_aliases()
+        return db == DIRECTORY_ALIAS
+
+
+class ShardMiddleware:
+    """
+    ログイン中の店舗ユーザーのリクエストを、その店舗のシャードで処理する
+    - 店舗の移動中の書き込み（ShardMovingError）は 503 と Retry-After を返す
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled() or not request.user.is_authenticated:
+            return self.get_response(request)
+        from account.models import Store
+
+        with use_store(Store.get_store_id_for_user(request.user.id)):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, ShardMovingError):
+            return None
+        logger.warning(f"[Shard][Moving] Write rejected: path={request.path}, error={exception}")
+        return HttpResponse(
+            "店舗のデータを移動しています。しばらくしてからもう一度お試しください。",
+            status=503,
+            headers={"Retry-After": str(getattr(settings, "COUPON_SHARD_CACHE_TIMEOUT", 30))},
+            content_type="text/plain; charset=utf-8",
+        )
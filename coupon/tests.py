@@ -1,3 +1,1256 @@
-from django.test import TestCase
+import collections
+import io
+import threading
+import tracemalloc
+import uuid
+from datetime import datetime, time, timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from account.models import Store, User
+
+from . import code_filter, codes, exports, page_cache, qr, query_plans, sharding
+from .models import (
+    Coupon,
+    CouponCode,
+    CouponCodePool,
+    CouponCounterShard,
+    CouponStatBucket,
+    CouponStatus,
+    RedeemResult,
+    RedeemStatus,
+    StoreShard,
+)
+
+PASSWORD = "Test-Passw0rd!"
+
+# テストごとに内容を消去できるよう、キャッシュはすべてプロセス内のものにする
+TEST_CACHES = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"tests-{alias}"}
+    for alias in ("default", "coupon_pages", "stores", "sessions")
+}
+
+
+def create_store(email="store@example.com", store_name="テスト店舗"):
+    user = User.objects.create_user(email=email, password=PASSWORD)
+    return Store.objects.create(user=user, store_name=store_name)
+
+
+class RedeemConcurrencyTests(TransactionTestCase):
+    """
+    同じクーポンコードを複数のスレッドで同時に認証しても、使用済みになるのは1回だけであることを確認する
+    """
+    THREADS = 8
+
+    def test_redeem_exactly_once(self):
+        store = create_store()
+        coupon = Coupon.create(store.id, "同時認証", "10% OFF", "商品", None, None, None)
+        coupon_code = CouponCode.issue(coupon.id)
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        errors = []
+
+        def redeem():
+            try:
+                barrier.wait()
+                results.append(CouponCode.redeem(store.id, code=coupon_code.coupon_code).status)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count(RedeemStatus.SUCCESS), 1)
+        self.assertEqual(results.count(RedeemStatus.ALREADY_REDEEMED), self.THREADS - 1)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redeemed_count, 1)
+        coupon_code.refresh_from_db()
+        self.assertIsNotNone(coupon_code.redeemed_at)
+
+    def test_retry_on_lock_contention_only_outside_transaction(self):
+        locked = OperationalError("database is locked")
+        with mock.patch.object(
+            CouponCode, "_redeem_once", side_effect=[locked, RedeemResult(RedeemStatus.SUCCESS)]
+        ) as redeem_once:
+            self.assertEqual(CouponCode.redeem(1, code="AAAAAA").status, RedeemStatus.SUCCESS)
+        self.assertEqual(redeem_once.call_count, 2)
+
+        # 外側のトランザクション内ではやり直さない
+        with mock.patch.object(CouponCode, "_redeem_once", side_effect=locked) as redeem_once:
+            with self.assertRaises(OperationalError), transaction.atomic():
+                CouponCode.redeem(1, code="AAAAAA")
+        self.assertEqual(redeem_once.call_count, 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PageCacheTests(TestCase):
+    """
+    お客様向けページのキャッシュが、取得中の使用・バージョンのキーの削除で古いページを返さないことを確認する
+    """
+
+    def setUp(self):
+        caches["coupon_pages"].clear()
+        store = create_store()
+        self.coupon = Coupon.create(store.id, "キャッシュ", "10% OFF", "商品", None, None, None)
+        self.coupon_code = CouponCode.issue(self.coupon.id)
+        self.uuid = self.coupon_code.coupon_uuid
+        # 初回の表示ではクーポンIDのみ保存される
+        page_cache.set_page(self.coupon_code, self.coupon, b"first", page_cache.begin_fill(self.uuid))
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+    def test_cached_after_coupon_id_is_known(self):
+        page_cache.set_page(self.coupon_code, self.coupon, b"page", page_cache.begin_fill(self.uuid))
+        self.assertEqual(page_cache.get_page(self.uuid)["content"], b"page")
+
+    def test_fill_started_before_redeem_is_not_used(self):
+        fill = page_cache.begin_fill(self.uuid)
+        page_cache.invalidate_code(self.uuid)
+        page_cache.set_page(self.coupon_code, self.coupon, b"stale", fill)
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+    def test_fill_started_before_coupon_delete_is_not_used(self):
+        fill = page_cache.begin_fill(self.uuid)
+        page_cache.invalidate_coupon(self.coupon.id)
+        page_cache.set_page(self.coupon_code, self.coupon, b"stale", fill)
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+    def test_redeem_invalidates_after_commit(self):
+        page_cache.set_page(self.coupon_code, self.coupon, b"page", page_cache.begin_fill(self.uuid))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(CouponCode.redeem(self.coupon.store_id, uuid=self.uuid).success)
+            # コミット前は削除しない
+            self.assertEqual(page_cache.get_page(self.uuid)["content"], b"page")
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+    def test_rolled_back_redeem_batch_keeps_page(self):
+        page_cache.set_page(self.coupon_code, self.coupon, b"page", page_cache.begin_fill(self.uuid))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                results = CouponCode.redeem_batch(self.coupon.store_id, [{"uuid": str(self.uuid)}])
+                self.assertTrue(results[0].success)
+                transaction.set_rollback(True)
+        self.assertEqual(page_cache.get_page(self.uuid)["content"], b"page")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CouponCode.redeem_batch(self.coupon.store_id, [{"uuid": str(self.uuid)}])
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+    def test_missing_version_key_invalidates_page(self):
+        page_cache.set_page(self.coupon_code, self.coupon, b"page", page_cache.begin_fill(self.uuid))
+        caches["coupon_pages"].delete(page_cache.code_version_key(self.uuid))
+        self.assertIsNone(page_cache.get_page(self.uuid))
+
+
+class QueryPlanTests(TestCase):
+    """
+    Coupon / CouponCode のクラスメソッドが発行するクエリがフルスキャンにならないことを確認する
+    （テスト用DBに店舗・クーポン・クーポンコードを作成し、実行計画を取得する）
+    """
+    STORES = 3
+    COUPONS = 5
+    CODES = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(cls.STORES):
+            store = create_store(email=f"plan-{number}@example.com", store_name=f"店舗{number}")
+            for index in range(cls.COUPONS):
+                coupon = Coupon.create(store.id, f"クーポン{index}", "10% OFF", "商品", None, None, None)
+                CouponCode.issue_batch(coupon.id, cls.CODES)
+        query_plans.analyze()
+
+    def test_access_paths_use_indexes(self):
+        sample = query_plans.find_sample()
+        self.assertIsNotNone(sample)
+        for name, call in query_plans.access_paths(sample):
+            for sql in query_plans.capture(call):
+                with self.subTest(name=name, sql=sql[:100]):
+                    self.assertEqual(query_plans.full_scans(query_plans.explain(sql)), [])
+
+    def test_coupon_list_is_read_in_index_order(self):
+        sample = query_plans.find_sample()
+        paths = [(name, call) for name, call in query_plans.access_paths(sample) if name.startswith("CouponListView")]
+        self.assertEqual(len(paths), 2)
+        for name, call in paths:
+            for sql in query_plans.capture(call):
+                with self.subTest(name=name):
+                    self.assertEqual(query_plans.sorts(query_plans.explain(sql)), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CouponStateQueryCountTests(TestCase):
+    """
+    クーポンの詳細・発行・削除の判定がクーポンの状態の1クエリで行われることを確認する
+    - ビューのクエリ数は、ログイン済みのセッション（キャッシュ済み）のユーザーの取得1件を含む
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "クエリ数", "10% OFF", "商品", None, None, None)
+        self.client.force_login(self.store.user)
+
+    def test_get_state(self):
+        with self.assertNumQueries(1):
+            state = Coupon.get_state(self.coupon.id)
+        self.assertTrue(state.is_owned_by(self.store.user_id))
+        self.assertEqual(state.store_name, self.store.store_name)
+
+    def test_detail_view(self):
+        url = reverse("coupon:coupon_detail", kwargs={"coupon_id": self.coupon.id})
+        # ユーザー・クーポン（店舗と結合し、判定と表示に使用する）
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_issue_view(self):
+        url = reverse("coupon:coupon_issue", kwargs={"coupon_id": self.coupon.id})
+        # ユーザー・クーポンの状態・発行（SAVEPOINT・INSERT・UPDATE・RELEASE）
+        with self.assertNumQueries(6):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CouponCode.objects.filter(coupon_id=self.coupon.id).count(), 1)
+
+    def test_issue_rechecks_state(self):
+        # 状態の取得後に削除されたクーポンは、発行数の条件付きUPDATEで発行しない
+        state = Coupon.get_state(self.coupon.id)
+        Coupon.objects.filter(id=self.coupon.id).update(status=CouponStatus.DELETED, deleted_at=timezone.now())
+        self.assertIsNone(CouponCode.issue(self.coupon.id, state=state))
+        self.assertFalse(CouponCode.objects.filter(coupon_id=self.coupon.id).exists())
+
+    def test_delete_view(self):
+        url = reverse("coupon:coupon_delete", kwargs={"coupon_id": self.coupon.id})
+        # ユーザー・クーポンの状態・論理削除（SAVEPOINT・UPDATE・RELEASE）
+        with self.assertNumQueries(5):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 302)
+        self.coupon.refresh_from_db()
+        self.assertIsNotNone(self.coupon.deleted_at)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CouponCodeQueryCountTests(TestCase):
+    """
+    クーポンコードのページがクーポンコード・クーポン・店舗を結合した1クエリで表示されることを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "クエリ数", "10% OFF", "商品", None, None, None)
+        self.coupon_code = CouponCode.issue(self.coupon.id)
+
+    def test_get_with_coupon(self):
+        for lookup in ({"id": self.coupon_code.id}, {"uuid": self.coupon_code.coupon_uuid}):
+            with self.subTest(**lookup), self.assertNumQueries(1):
+                coupon_code = CouponCode.get_with_coupon(**lookup)
+                self.assertEqual(coupon_code.coupon.store.store_name, self.store.store_name)
+
+    def test_code_detail_view(self):
+        self.client.force_login(self.store.user)
+        url = reverse("coupon:coupon_code_detail", kwargs={"coupon_code_id": self.coupon_code.id})
+        # ユーザー・クーポンコード（クーポン・店舗と結合し、判定と表示に使用する）
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_customer_view(self):
+        url = reverse("coupon:coupon_customer_view", kwargs={"coupon_code_uuid": self.coupon_code.coupon_uuid})
+        # キャッシュがない場合はクーポンコード（クーポン・店舗と結合）のみ
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        # 2回目の表示でページが保存され、以降はDBを参照しない
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportMemoryTests(TestCase):
+    """
+    エクスポート（CSV / JSON Lines）のストリーミング中のメモリ使用量の最大値が、件数によらず一定であることを確認する
+    - 件数の異なる2つのクーポンで最大値を比較する（件数は10倍、1回のクエリで取得する件数は同じ）
+    """
+    SMALL = 2000
+    LARGE = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = create_store()
+        cls.small = Coupon.create(cls.store.id, "少量", "10% OFF", "商品", None, None, None)
+        cls.large = Coupon.create(cls.store.id, "大量", "10% OFF", "商品", None, None, None)
+        CouponCode.issue_batch(cls.small.id, cls.SMALL)
+        CouponCode.issue_batch(cls.large.id, cls.LARGE)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client.force_login(self.store.user)
+
+    def stream(self, coupon_id, export_format):
+        """
+        エクスポートAPIの応答を読み込み、行数と読み込み中のメモリ使用量の最大値（バイト）を返す
+        """
+        url = reverse("coupon:coupon_code_export", kwargs={"coupon_id": coupon_id})
+        response = self.client.get(url, {"format": export_format})
+        self.assertEqual(response.status_code, 200)
+        lines = 0
+        tracemalloc.start()
+        try:
+            # 行はこの読み込み中に取得される
+            for chunk in response.streaming_content:
+                lines += chunk.count(b"\n")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return lines, peak
+
+    def test_peak_memory_does_not_grow_with_rows(self):
+        for export_format in exports.FORMATS:
+            with self.subTest(export_format=export_format):
+                header = 1 if export_format == "csv" else 0
+                small_lines, small_peak = self.stream(self.small.id, export_format)
+                large_lines, large_peak = self.stream(self.large.id, export_format)
+                self.assertEqual(small_lines, self.SMALL + header)
+                self.assertEqual(large_lines, self.LARGE + header)
+                # 件数が10倍でも、最大値はチャンク1回分程度の差に収まる
+                self.assertLess(large_peak, small_peak * 1.5)
+
+
+@override_settings(CACHES=TEST_CACHES, COUPON_LIST_PAGE_SIZE=2)
+class CouponListPagingTests(TestCase):
+    """
+    クーポン一覧のキーセットによるページングで、並び順どおりに全件を重複なく返すことを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.client.force_login(self.store.user)
+        today = timezone.localdate()
+
+        def create(title, expiration_date=None, max_issuance=None):
+            return Coupon.create(self.store.id, title, "10% OFF", "商品", None, expiration_date, max_issuance)
+
+        later = create("期限内", today + timedelta(days=30))
+        sooner = create("期限内（近い）", today + timedelta(days=10))
+        same_day = create("期限内（同日）", today + timedelta(days=30))
+        unlimited = create("無期限")
+        exhausted = create("上限到達", today + timedelta(days=5), max_issuance=1)
+        CouponCode.issue(exhausted.id)
+        expired = create("期限切れ", today + timedelta(days=1))
+        Coupon.objects.filter(id=expired.id).update(expiration_date=today - timedelta(days=1))
+        Coupon.sweep_expired()
+        deleted = create("削除済み")
+        Coupon.logical_delete(deleted.id)
+        # sort_priority, expiration_date 降順, id 降順
+        self.expected = [same_day.id, later.id, sooner.id, unlimited.id, exhausted.id, expired.id]
+
+    def test_pages_follow_sort_order(self):
+        url = reverse("coupon:coupon_list_api")
+        ids = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {"cursor": cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["coupons"]), 2)
+            ids.extend(coupon["id"] for coupon in data["coupons"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected)
+
+
+@override_settings(CACHES=TEST_CACHES, COUPON_LIST_PAGE_SIZE=20)
+class SweepExpiredTests(TestCase):
+    """
+    sweep_expired が有効期限の過ぎた有効・上限到達のクーポンのみを期限切れにし、
+    一覧の並び順（sort_priority）に反映されることを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.today = timezone.localdate()
+        yesterday = self.today - timedelta(days=1)
+
+        def create(title, expiration_date=None, status=CouponStatus.ACTIVE):
+            coupon = Coupon.create(self.store.id, title, "10% OFF", "商品", None, None, None)
+            Coupon.objects.filter(id=coupon.id).update(expiration_date=expiration_date, status=status)
+            return coupon.id
+
+        self.past = [
+            create("期限切れ（有効）", yesterday),
+            create("期限切れ（上限到達）", yesterday, CouponStatus.EXHAUSTED),
+            create("期限切れ（有効・古い）", self.today - timedelta(days=30)),
+        ]
+        self.today_id = create("本日まで", self.today)
+        self.future_id = create("期限内", self.today + timedelta(days=1))
+        self.unlimited_id = create("無期限")
+        self.deleted_id = create("削除済み", yesterday, CouponStatus.DELETED)
+
+    def statuses(self):
+        return dict(Coupon.objects.values_list("id", "status"))
+
+    def test_flips_only_expired_rows(self):
+        before = self.statuses()
+        self.assertEqual(Coupon.sweep_expired(chunk_size=2), len(self.past))
+        after = self.statuses()
+        for coupon_id, status in after.items():
+            expected = CouponStatus.EXPIRED if coupon_id in self.past else before[coupon_id]
+            self.assertEqual(status, expected, coupon_id)
+        self.assertEqual(Coupon.sweep_expired(), 0)
+        # 翌日には本日までのクーポンも期限切れになる
+        self.assertEqual(Coupon.sweep_expired(today=self.today + timedelta(days=1)), 1)
+        self.assertEqual(self.statuses()[self.today_id], CouponStatus.EXPIRED)
+
+    def test_list_order_follows_sort_priority(self):
+        Coupon.sweep_expired()
+        priorities = dict(Coupon.objects.values_list("id", "sort_priority"))
+        self.assertEqual(
+            [priorities[coupon_id] for coupon_id in (self.future_id, self.unlimited_id, self.deleted_id)],
+            [0, 1, 4],
+        )
+        self.assertEqual({priorities[coupon_id] for coupon_id in self.past}, {3})
+
+        self.client.force_login(self.store.user)
+        response = self.client.get(reverse("coupon:coupon_list_api"))
+        self.assertEqual(response.status_code, 200)
+        ids = [coupon["id"] for coupon in response.json()["coupons"]]
+        # 期限内（有効期限の遅い順）・無期限・期限切れ（有効期限の遅い順、同日は id 降順）。削除済みは表示しない
+        expired = [*sorted(self.past[:2], reverse=True), self.past[2]]
+        expected = [self.future_id, self.today_id, self.unlimited_id, *expired]
+        self.assertEqual(ids, expected)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FlowGuardMiddlewareTests(TestCase):
+    """
+    ClearFlowSessionOnLeaveMiddleware が、セッションCookieのないリクエストではセッションを読み込まず、
+    クーポン作成のフローの外に出た場合は作成中のデータを消去する（確認画面がリダイレクトする）ことを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.confirm_url = reverse("coupon:coupon_create_confirm")
+
+    def start_flow(self):
+        self.client.force_login(self.store.user)
+        session = self.client.session
+        session["coupon_data"] = {
+            "coupon": {
+                "title": "作成中",
+                "discount": "10% OFF",
+                "target_product": "商品",
+                "message": "",
+                "expiration_date": None,
+                "max_issuance": None,
+            },
+            "store_id": self.store.id,
+        }
+        session.save()
+
+    def test_no_session_queries_without_cookie(self):
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        with mock.patch.object(session_store, "load", autospec=True, return_value={}) as load:
+            with self.assertNumQueries(0):
+                response = self.client.get("/no-such-page/", HTTP_ACCEPT="text/html")
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(load.call_count, 0)
+
+            # Cookie がある場合は、フローの外の判定のためにセッションを読み込む
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = "unknown-session-key"
+            self.client.get("/no-such-page/", HTTP_ACCEPT="text/html")
+            self.assertEqual(load.call_count, 1)
+
+    def test_leaving_flow_clears_session(self):
+        self.start_flow()
+        self.assertEqual(self.client.get(self.confirm_url, HTTP_ACCEPT="text/html").status_code, 200)
+        # XHR・静的ファイル・フロー内のページではデータを残す
+        self.client.get(reverse("coupon:coupon_list"), HTTP_ACCEPT="text/html", HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.client.get("/static/missing.css", HTTP_ACCEPT="text/html")
+        self.client.get(reverse("coupon:coupon_create"), HTTP_ACCEPT="text/html")
+        self.assertIn("coupon_data", self.client.session)
+
+        self.client.get(reverse("coupon:coupon_list"), HTTP_ACCEPT="text/html")
+        self.assertNotIn("coupon_data", self.client.session)
+        response = self.client.get(self.confirm_url, HTTP_ACCEPT="text/html")
+        self.assertRedirects(response, reverse("coupon:coupon_list"), fetch_redirect_response=False)
+
+    def test_unrouted_page_leaves_flow(self):
+        self.start_flow()
+        self.client.get("/no-such-page/", HTTP_ACCEPT="text/html")
+        self.assertNotIn("coupon_data", self.client.session)
+
+
+class CouponCodePoolTests(TestCase):
+    """
+    事前生成済みクーポンコードの補充件数・確保済みの行の削除を確認する
+    """
+    STORE_ID = 1
+
+    def test_refill_counts_only_inserted_rows(self):
+        # 確保済みの行と同じコードは一意制約に衝突して登録されない
+        CouponCodePool.objects.create(store_id=self.STORE_ID, coupon_code="AAAAAA", claimed_at=timezone.now())
+        with mock.patch.object(CouponCode, "_generate_unique_codes", return_value={"AAAAAA", "BBBBBB", "CCCCCC"}):
+            added = CouponCodePool.refill(self.STORE_ID, 3)
+        self.assertEqual(added, 2)
+        self.assertEqual(CouponCodePool.depth([self.STORE_ID]), {self.STORE_ID: 2})
+
+    def test_purge_claimed_in_chunks(self):
+        now = timezone.now()
+        CouponCodePool.objects.bulk_create(
+            [CouponCodePool(store_id=self.STORE_ID, coupon_code=f"C{number:05d}", claimed_at=now) for number in range(5)]
+            + [CouponCodePool(store_id=self.STORE_ID, coupon_code="UNUSED")]
+        )
+        # 2件ずつ3回（SELECT と DELETE）
+        with self.assertNumQueries(6):
+            purged = CouponCodePool.purge_claimed(chunk_size=2)
+        self.assertEqual(purged, 5)
+        self.assertEqual(list(CouponCodePool.objects.values_list("coupon_code", flat=True)), ["UNUSED"])
+
+    @override_settings(CACHES=TEST_CACHES, COUPON_CODE_POOL_ENABLED=True, COUPON_CODE_CHECK_DIGIT=False)
+    def test_issue_releases_unused_claim(self):
+        store = create_store()
+        coupon = Coupon.create(store.id, "上限", "10% OFF", "商品", None, None, 1)
+        CouponCodePool.objects.create(store_id=store.id, coupon_code="POOL01")
+
+        # 発行数の上限に達して発行を取り消した場合は未使用に戻る
+        Coupon.objects.filter(id=coupon.id).update(issued_count=1, status=CouponStatus.EXHAUSTED)
+        self.assertIsNone(CouponCode.issue(coupon.id))
+        self.assertEqual(CouponCodePool.depth([store.id]), {store.id: 1})
+
+        # クーポンコードUUIDの重複の場合は未使用に戻し、生成したコードで発行する
+        Coupon.objects.filter(id=coupon.id).update(issued_count=0, max_issuance=None, status=CouponStatus.ACTIVE)
+        existing = CouponCode.issue(coupon.id)
+        self.assertEqual(existing.coupon_code, "POOL01")
+        CouponCode.objects.filter(id=existing.id).update(coupon_code="OTHER1")
+        CouponCodePool.objects.filter(coupon_code="POOL01").update(claimed_at=None)
+        with mock.patch.object(sharding, "new_code_uuid", side_effect=[existing.coupon_uuid, uuid.uuid4()]):
+            issued = CouponCode.issue(coupon.id)
+        self.assertNotEqual(issued.coupon_code, "POOL01")
+        self.assertEqual(CouponCodePool.depth([store.id]), {store.id: 1})
+
+    @override_settings(CACHES=TEST_CACHES, COUPON_CODE_POOL_ENABLED=True, COUPON_CODE_CHECK_DIGIT=False)
+    def test_issue_keeps_claim_of_duplicate_code(self):
+        store = create_store()
+        coupon = Coupon.create(store.id, "重複", "10% OFF", "商品", None, None, None)
+        CouponCodePool.objects.create(store_id=store.id, coupon_code="POOL01")
+        issued = CouponCode.issue(coupon.id)
+        self.assertEqual(issued.coupon_code, "POOL01")
+
+        # 発行済みのコードと重複した行は使用済みのまま残し、生成したコードで発行する
+        CouponCodePool.objects.filter(coupon_code="POOL01").update(claimed_at=None)
+        self.assertNotEqual(CouponCode.issue(coupon.id).coupon_code, "POOL01")
+        self.assertEqual(CouponCodePool.depth([store.id]), {})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RedeemBatchTests(TestCase):
+    """
+    一括認証（CouponCode.redeem_batch）の処理結果の順序・重複の扱い・1件ずつの処理への切り替えと、
+    一括認証APIのレスポンスを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "一括認証", "10% OFF", "商品", None, None, None)
+        self.codes = [CouponCode.issue(self.coupon.id) for _ in range(3)]
+
+    def assertResults(self, results, expected):
+        self.assertEqual(
+            [(result.status, result.coupon_code.id if result.coupon_code else None) for result in results],
+            expected,
+        )
+
+    def test_results_follow_item_order(self):
+        first, second, third = self.codes
+        items = [
+            {"uuid": third.coupon_uuid},
+            {"code": "ZZZZZZ"},
+            {"code": first.coupon_code},
+            {"uuid": uuid.uuid4()},
+            {"code": second.coupon_code},
+        ]
+        results = CouponCode.redeem_batch(self.store.id, items)
+        self.assertResults(results, [
+            (RedeemStatus.SUCCESS, third.id),
+            (RedeemStatus.NOT_FOUND, None),
+            (RedeemStatus.SUCCESS, first.id),
+            (RedeemStatus.NOT_FOUND, None),
+            (RedeemStatus.SUCCESS, second.id),
+        ])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.redeemed_count, 3)
+        self.assertFalse(CouponCode.objects.filter(coupon=self.coupon, redeemed_at__isnull=True).exists())
+
+    def test_duplicate_items_redeem_once(self):
+        coupon_code = self.codes[0]
+        items = [
+            {"code": coupon_code.coupon_code},
+            {"uuid": coupon_code.coupon_uuid},
+            {"code": coupon_code.coupon_code},
+        ]
+        results = CouponCode.redeem_batch(self.store.id, items)
+        self.assertResults(results, [
+            (RedeemStatus.SUCCESS, coupon_code.id),
+            (RedeemStatus.ALREADY_REDEEMED, coupon_code.id),
+            (RedeemStatus.ALREADY_REDEEMED, coupon_code.id),
+        ])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.redeemed_count, 1)
+
+    def test_other_store_codes_are_not_found(self):
+        other = create_store(email="other@example.com", store_name="他の店舗")
+        results = CouponCode.redeem_batch(other.id, [{"code": self.codes[0].coupon_code}])
+        self.assertResults(results, [(RedeemStatus.NOT_FOUND, None)])
+
+    def test_conflict_falls_back_to_single_redeem(self):
+        first, second, _ = self.codes
+        items = [{"uuid": second.coupon_uuid}, {"code": first.coupon_code}, {"code": first.coupon_code}]
+        with mock.patch.object(CouponCode, "_apply_batch_redemption", return_value=False), \
+                mock.patch.object(CouponCode, "redeem", wraps=CouponCode.redeem) as redeem:
+            results = CouponCode.redeem_batch(self.store.id, items)
+        self.assertEqual(redeem.call_count, len(items))
+        self.assertResults(results, [
+            (RedeemStatus.SUCCESS, second.id),
+            (RedeemStatus.SUCCESS, first.id),
+            (RedeemStatus.ALREADY_REDEEMED, first.id),
+        ])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.redeemed_count, 2)
+
+    def test_batch_view_returns_redeem_status(self):
+        self.client.force_login(self.store.user)
+        session = self.client.session
+        session["store_id"] = self.store.id
+        session.save()
+        coupon_code = self.codes[0]
+        items = [{"code": coupon_code.coupon_code}, {"code": "!!"}, {"uuid": str(coupon_code.coupon_uuid)}]
+        response = self.client.post(
+            reverse("coupon:coupon_verify_batch"), {"items": items}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            [RedeemStatus.SUCCESS, RedeemStatus.NOT_FOUND, RedeemStatus.ALREADY_REDEEMED],
+        )
+        self.assertTrue(results[0]["success"])
+        self.assertEqual(results[2]["error"], RedeemStatus.ALREADY_REDEEMED.label)
+
+
+class IssueBatchTests(TestCase):
+    """
+    一括発行（CouponCode.issue_batch）が発行数の上限（max_issuance）でちょうど止まり、
+    他のプロセスの発行数の確保と重なっても上限を超えないことを確認する
+    """
+    MAX_ISSUANCE = 30
+
+    def setUp(self):
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "一括発行", "10% OFF", "商品", None, None, self.MAX_ISSUANCE)
+
+    def assertIssued(self, count):
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.issued_count, count)
+        self.assertEqual(CouponCode.objects.filter(coupon=self.coupon).count(), count)
+
+    def test_stops_at_max_issuance(self):
+        self.assertEqual(CouponCode.issue_batch(self.coupon.id, 100, chunk_size=7), self.MAX_ISSUANCE)
+        self.assertIssued(self.MAX_ISSUANCE)
+        self.assertEqual(self.coupon.status, CouponStatus.EXHAUSTED)
+        self.assertEqual(CouponCode.issue_batch(self.coupon.id, 1), 0)
+        self.assertIsNone(CouponCode.issue(self.coupon.id))
+        self.assertIssued(self.MAX_ISSUANCE)
+
+    @override_settings(COUPON_COUNTER_SHARDS=4)
+    def test_stops_at_max_issuance_with_counter_shards(self):
+        # 単体の発行で分散カウンタに加算した分も集約したうえで確保する
+        for _ in range(3):
+            self.assertIsNotNone(CouponCode.issue(self.coupon.id))
+        self.assertEqual(CouponCode.issue_batch(self.coupon.id, 100, chunk_size=7), self.MAX_ISSUANCE - 3)
+        self.assertIsNone(CouponCode.issue(self.coupon.id))
+        self.assertEqual(CouponCode.objects.filter(coupon=self.coupon).count(), self.MAX_ISSUANCE)
+        self.assertEqual(Coupon.get_state(self.coupon.id).issued_count, self.MAX_ISSUANCE)
+
+    def test_issues_only_remaining(self):
+        self.assertEqual(CouponCode.issue_batch(self.coupon.id, 25), 25)
+        self.assertEqual(CouponCode.issue_batch(self.coupon.id, 10, chunk_size=3), 5)
+        self.assertIssued(self.MAX_ISSUANCE)
+
+    def test_concurrent_reservation_does_not_over_issue(self):
+        reserve = CouponCode._reserve_issuance
+        others = []
+
+        def reserve_after_other_process(coupon_id, count):
+            # チャンクごとの確保の直前に、他のプロセスが4件ずつ確保する
+            others.append(reserve(coupon_id, 4))
+            self.coupon.refresh_from_db()
+            self.assertLessEqual(self.coupon.issued_count, self.MAX_ISSUANCE)
+            return reserve(coupon_id, count)
+
+        with mock.patch.object(CouponCode, "_reserve_issuance", side_effect=reserve_after_other_process):
+            issued = CouponCode.issue_batch(self.coupon.id, 100, chunk_size=10)
+
+        # 4 + 10 + 4 + 10 の後、他のプロセスは残りの2件のみ確保でき、一括発行は確保できない
+        self.assertEqual(others, [4, 4, 2])
+        self.assertEqual(issued, 20)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.issued_count, self.MAX_ISSUANCE)
+        self.assertEqual(CouponCode.objects.filter(coupon=self.coupon).count(), issued)
+
+
+@override_settings(CACHES=TEST_CACHES, COUPON_COUNTER_SHARDS=4)
+class CouponCounterShardTests(TestCase):
+    """
+    分散カウンタ（COUPON_COUNTER_SHARDS）のスロットの合計が集約後の発行数・使用数と一致し、
+    発行数の上限と削除済み・期限切れのクーポンへの発行の拒否が守られることを確認する
+    """
+    MAX_ISSUANCE = 10
+
+    def setUp(self):
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "分散カウンタ", "10% OFF", "商品", None, None, self.MAX_ISSUANCE)
+
+    def slot_totals(self):
+        shards = CouponCounterShard.objects.filter(coupon=self.coupon)
+        return sum(shard.issued for shard in shards), sum(shard.redeemed for shard in shards)
+
+    def test_slot_totals_match_compacted_counts(self):
+        coupon_codes = [CouponCode.issue(self.coupon.id) for _ in range(6)]
+        for coupon_code in coupon_codes[:2]:
+            self.assertTrue(CouponCode.redeem(self.store.id, code=coupon_code.coupon_code).success)
+        self.coupon.refresh_from_db()
+        issued, redeemed = self.slot_totals()
+        self.assertEqual((self.coupon.issued_count + issued, self.coupon.redeemed_count + redeemed), (6, 2))
+        self.assertEqual(Coupon.get_state(self.coupon.id).issued_count, 6)
+
+        CouponCounterShard.compact(self.coupon.id)
+        self.coupon.refresh_from_db()
+        self.assertEqual((self.coupon.issued_count, self.coupon.redeemed_count), (6, 2))
+        self.assertEqual(self.slot_totals(), (0, 0))
+        # 残りの発行可能数がスロットに割り当てられる
+        quotas = CouponCounterShard.objects.filter(coupon=self.coupon).values_list("quota", flat=True)
+        self.assertEqual(sum(quotas), self.MAX_ISSUANCE - 6)
+
+    def test_limit_holds(self):
+        issued = [CouponCode.issue(self.coupon.id) for _ in range(self.MAX_ISSUANCE + 3)]
+        self.assertEqual(sum(coupon_code is not None for coupon_code in issued), self.MAX_ISSUANCE)
+        self.assertFalse(CouponCounterShard.increment(self.coupon.id, "issued"))
+        CouponCounterShard.compact(self.coupon.id)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.issued_count, self.MAX_ISSUANCE)
+        self.assertEqual(self.coupon.status, CouponStatus.EXHAUSTED)
+        self.assertEqual(CouponCode.objects.filter(coupon=self.coupon).count(), self.MAX_ISSUANCE)
+
+    def test_deleted_or_expired_coupon_is_not_incremented(self):
+        for status in (CouponStatus.DELETED, CouponStatus.EXPIRED):
+            with self.subTest(status=status):
+                coupon = Coupon.create(self.store.id, status, "10% OFF", "商品", None, None, None)
+                self.assertIsNotNone(CouponCode.issue(coupon.id))
+                Coupon.objects.filter(id=coupon.id).update(status=status)
+                # 上限なしのクーポンの quota（None）が残っていても発行しない
+                self.assertFalse(CouponCounterShard.increment(coupon.id, "issued"))
+                self.assertIsNone(CouponCode.issue(coupon.id))
+                self.assertEqual(CouponCounterShard.compact(coupon.id, reserve=5), 0)
+                self.assertEqual(Coupon.get_state(coupon.id).issued_count, 1)
+                self.assertEqual(CouponCode.objects.filter(coupon=coupon).count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CouponStatBucketTests(TestCase):
+    """
+    発行数・使用数の集計が、コミットされた発行・使用のみを加算し、期間内のすべての時間帯を返し、
+    coupon_codes からの再集計と一致することを確認する
+    """
+
+    def setUp(self):
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "集計", "10% OFF", "商品", None, None, None)
+        self.hour = CouponStatBucket.bucket_of(timezone.now())
+
+    def totals(self):
+        buckets = CouponStatBucket.objects.filter(coupon=self.coupon)
+        return sum(bucket.issued for bucket in buckets), sum(bucket.redeemed for bucket in buckets)
+
+    def test_record_only_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                CouponCode.issue(self.coupon.id)
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.totals(), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon_code = CouponCode.issue(self.coupon.id)
+            CouponCode.redeem(self.store.id, code=coupon_code.coupon_code)
+        self.assertEqual(self.totals(), (1, 1))
+
+    def test_series_fills_empty_buckets(self):
+        CouponStatBucket.objects.create(
+            coupon=self.coupon, store_id=self.store.id, bucket_start=self.hour - timedelta(hours=2), issued=3
+        )
+        CouponStatBucket.objects.create(
+            coupon=self.coupon, store_id=self.store.id, bucket_start=self.hour, issued=1, redeemed=2
+        )
+        series = CouponStatBucket.series(
+            self.hour - timedelta(hours=2), self.hour + timedelta(hours=1), coupon_id=self.coupon.id, granularity="hour"
+        )
+        self.assertEqual(
+            [(bucket["start"], bucket["issued"], bucket["redeemed"]) for bucket in series],
+            [
+                (self.hour - timedelta(hours=2), 3, 0),
+                (self.hour - timedelta(hours=1), 0, 0),
+                (self.hour, 1, 2),
+            ],
+        )
+
+        today = timezone.localdate()
+        start = timezone.make_aware(datetime.combine(today - timedelta(days=2), time.min))
+        end = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+        series = CouponStatBucket.series(start, end, store_id=self.store.id)
+        self.assertEqual([bucket["start"] for bucket in series], [today - timedelta(days=days) for days in (2, 1, 0)])
+        self.assertEqual(sum(bucket["issued"] for bucket in series), 4)
+
+    def test_rebuild_matches_raw_counts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon_codes = [CouponCode.issue(self.coupon.id) for _ in range(5)]
+            for coupon_code in coupon_codes[:2]:
+                CouponCode.redeem(self.store.id, code=coupon_code.coupon_code)
+        # 3時間前に発行されたコード（記録済みの集計とは時間帯が異なる）
+        CouponCode.objects.filter(id__in=[coupon_code.id for coupon_code in coupon_codes[3:]]).update(
+            created_at=self.hour - timedelta(hours=3)
+        )
+
+        CouponStatBucket.rebuild(self.coupon.id, end=self.hour + timedelta(hours=1))
+        rows = dict(
+            CouponStatBucket.objects.filter(coupon=self.coupon).values_list("bucket_start", "issued")
+        )
+        self.assertEqual(rows, {self.hour - timedelta(hours=3): 2, self.hour: 3})
+        self.assertEqual(self.totals(), (5, 2))
+
+
+class PermuteTests(SimpleTestCase):
+    """
+    クーポンコードの並べ替え（codes.permute）が一対一で、店舗ごとの連番から重複のないコードを生成することを確認する
+    """
+
+    def test_permute_is_bijection(self):
+        key = codes.store_key(1)
+        for length in (1, 2):
+            domain = codes.code_space(length)
+            with self.subTest(length=length):
+                permuted = sorted(codes.permute(value, key, length) for value in range(domain))
+                self.assertEqual(permuted, list(range(domain)))
+
+    def test_feistel_inverse(self):
+        key = codes.store_key(1)
+        for value in (0, 1, 12345, (1 << 32) - 1):
+            self.assertEqual(codes.feistel_inverse(codes.feistel(value, key, 16), key, 16), value)
+
+    def test_out_of_range_is_rejected(self):
+        key = codes.store_key(1)
+        for value in (-1, codes.code_space(2)):
+            with self.assertRaises(ValueError):
+                codes.permute(value, key, 2)
+
+    def test_permute_code_never_repeats(self):
+        generated = [codes.permute_code(1, counter) for counter in range(20000)]
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertTrue(all(len(code) == 6 and set(code) <= set(codes.CODE_CHARS) for code in generated))
+        # 連番の順に並ばず、店舗ごとに異なる
+        self.assertNotEqual(generated[:100], sorted(generated[:100]))
+        self.assertNotEqual(generated[:100], [codes.permute_code(2, counter) for counter in range(100)])
+
+
+class CheckCharTests(SimpleTestCase):
+    """
+    チェック文字付きのクーポンコードで、1文字の誤りをすべて、隣接する2文字の入れ替えをほぼすべて検出できることを確認する
+    """
+    PAYLOADS = [codes.permute_code(1, counter) for counter in range(200)]
+
+    def test_valid_codes(self):
+        for payload in self.PAYLOADS:
+            code = codes.with_check_char(payload)
+            self.assertEqual(len(code), 7)
+            self.assertTrue(codes.is_plausible_code(code, accept_unchecked=False))
+            # 大文字・小文字は区別しない
+            self.assertTrue(codes.is_plausible_code(code.lower(), accept_unchecked=False))
+
+    def test_single_character_errors_are_detected(self):
+        for payload in self.PAYLOADS:
+            code = codes.with_check_char(payload)
+            for position, original in enumerate(code):
+                for char in codes.CODE_CHARS:
+                    if char != original:
+                        typo = code[:position] + char + code[position + 1:]
+                        self.assertFalse(codes.is_plausible_code(typo, accept_unchecked=False), typo)
+
+    def test_adjacent_transpositions_are_detected(self):
+        undetected = total = 0
+        for payload in self.PAYLOADS:
+            code = codes.with_check_char(payload)
+            for position in range(len(code) - 1):
+                if code[position] == code[position + 1]:
+                    continue
+                swapped = code[:position] + code[position + 1] + code[position] + code[position + 2:]
+                total += 1
+                undetected += codes.is_plausible_code(swapped, accept_unchecked=False)
+        # MOD 37,36 では一部の文字の組み合わせの入れ替えのみ検出できない（約0.2%）
+        self.assertLessEqual(undetected / total, 0.005)
+
+    def test_unchecked_and_invalid_codes(self):
+        payload = self.PAYLOADS[0]
+        self.assertTrue(codes.is_plausible_code(payload, accept_unchecked=True))
+        self.assertFalse(codes.is_plausible_code(payload, accept_unchecked=False))
+        # 1文字抜け・使用しない文字・文字数の誤り
+        code = codes.with_check_char(payload)
+        self.assertFalse(codes.is_plausible_code(code[1:], accept_unchecked=False))
+        self.assertFalse(codes.is_plausible_code(payload[:-1] + "-", accept_unchecked=True))
+        self.assertFalse(codes.is_plausible_code(code + "A", accept_unchecked=True))
+        with override_settings(COUPON_CODE_ACCEPT_UNCHECKED=False):
+            self.assertFalse(codes.is_plausible_code(payload))
+
+
+class QrEncoderTests(SimpleTestCase):
+    """
+    QRコードのエンコーダーの形式情報・型番情報が JIS X 0510 の表の値と一致することを確認する
+    """
+    # 誤り訂正レベル M のマスク 0〜7 の形式情報（マスク処理後の15ビット）
+    FORMAT_M = (
+        "101010000010010", "101000100100101", "101111001111100", "101101101001011",
+        "100010111111001", "100000011001110", "100111110010111", "100101010100000",
+    )
+    # レベル L / Q / H のマスク 0 の形式情報
+    FORMAT_MASK0 = {"L": "111011111000100", "Q": "011010101011111", "H": "001011010001001"}
+    # 型番情報（18ビット）
+    VERSION_INFO = {7: 0x07C94, 8: 0x085BC, 21: 0x15683, 40: 0x28C69}
+
+    @staticmethod
+    def read_format(modules):
+        # 左上の形式情報（下位ビットから）
+        positions = [(8, i) for i in range(6)] + [(8, 7), (8, 8), (7, 8)] + [(14 - i, 8) for i in range(9, 15)]
+        return sum(modules[y][x] << i for i, (x, y) in enumerate(positions))
+
+    @staticmethod
+    def read_format_copy(modules):
+        # 右上・左下の形式情報
+        size = len(modules)
+        positions = [(size - 1 - i, 8) for i in range(8)] + [(8, size - 15 + i) for i in range(8, 15)]
+        return sum(modules[y][x] << i for i, (x, y) in enumerate(positions))
+
+    @staticmethod
+    def read_version(modules):
+        size = len(modules)
+        return sum(modules[i // 3][size - 11 + i % 3] << i for i in range(18))
+
+    def test_format_bits(self):
+        for mask, expected in enumerate(self.FORMAT_M):
+            builder = qr._Builder(1, qr.ECC_LEVELS["M"][1])
+            builder.draw_format_bits(mask)
+            self.assertEqual(self.read_format(builder.modules), int(expected, 2), mask)
+            self.assertEqual(self.read_format_copy(builder.modules), int(expected, 2), mask)
+        for level, expected in self.FORMAT_MASK0.items():
+            builder = qr._Builder(1, qr.ECC_LEVELS[level][1])
+            builder.draw_format_bits(0)
+            self.assertEqual(self.read_format(builder.modules), int(expected, 2), level)
+
+    def test_version_bits(self):
+        for version, expected in self.VERSION_INFO.items():
+            builder = qr._Builder(version, qr.ECC_LEVELS["M"][1])
+            builder.draw_version()
+            self.assertEqual(self.read_version(builder.modules), expected, version)
+
+    def test_encoded_matrix(self):
+        # 型番7（45x45）になるデータ量の英数字（レベル M の型番6は 154 文字まで、型番7は 178 文字まで）
+        self.assertEqual(len(qr._encode("A" * 154)), 41)
+        matrix = qr._encode("A" * 155)
+        self.assertEqual(len(matrix), 45)
+        self.assertEqual(self.read_version(matrix), self.VERSION_INFO[7])
+        format_bits = self.read_format(matrix)
+        self.assertIn(format(format_bits, "015b"), self.FORMAT_M)
+        self.assertEqual(self.read_format_copy(matrix), format_bits)
+        # 短縮URL（英数字モード）は、UUIDを含むURL（バイトモード）より小さい型番になる
+        coupon_code_uuid = uuid.uuid4()
+        full_url = settings.COUPON_PUBLIC_BASE_URL + f"/coupon/view/{coupon_code_uuid}/"
+        self.assertLess(len(qr.encode(qr.short_url(coupon_code_uuid))), len(qr.encode(full_url)))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QrPayloadTests(TestCase):
+    """
+    QRコードの内容（コンパクト形式・UUID・短縮URL・お客様向けページのURL）からクーポンコードUUIDに戻せることと、
+    短縮URLがお客様向けページを返すことを確認する
+    """
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        store = create_store()
+        coupon = Coupon.create(store.id, "QR", "10% OFF", "商品", None, None, None)
+        self.coupon_code = CouponCode.issue(coupon.id)
+        self.uuid = self.coupon_code.coupon_uuid
+
+    def test_parse_payload_round_trip(self):
+        customer_url = "https://voucherz.jp" + reverse(
+            "coupon:coupon_customer_view", kwargs={"coupon_code_uuid": self.uuid}
+        )
+        payloads = [
+            qr.compact_payload(self.uuid),
+            qr.compact_payload(self.uuid).lower(),
+            qr.short_url(self.uuid),
+            str(self.uuid),
+            customer_url,
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertEqual(qr.parse_payload(payload), self.uuid)
+        self.assertEqual(len(qr.compact_payload(self.uuid)), qr.COMPACT_LENGTH)
+
+    def test_parse_invalid_payload(self):
+        invalid = ("", "VZ1ABC", qr.compact_payload(self.uuid)[:-1] + "!", "not-a-uuid", "https://voucherz.jp/coupon/")
+        for payload in invalid:
+            with self.subTest(payload=payload):
+                self.assertIsNone(qr.parse_payload(payload))
+
+    def test_short_url_shows_customer_page(self):
+        path = reverse("coupon_short_view", args=[qr.compact_token(self.uuid)])
+        self.assertTrue(qr.short_url(self.uuid).endswith(path))
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        customer = self.client.get(reverse("coupon:coupon_customer_view", kwargs={"coupon_code_uuid": self.uuid}))
+        self.assertEqual(response.content, customer.content)
+        self.assertEqual(self.client.get(path.lower()).status_code, 404)
+        self.assertEqual(self.client.get("/C/INVALID/").status_code, 404)
+
+
+class BloomFilterTests(TestCase):
+    """
+    Bloom フィルタが登録したキーを必ず含み、誤検知率が設定値の程度に収まることを確認する
+    """
+
+    def test_no_false_negatives_and_fp_rate(self):
+        bloom = code_filter.BloomFilter(10000, 0.01)
+        keys = [code_filter.code_key(f"K{number:05d}") for number in range(10000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(code_filter.code_key(f"X{number:05d}") in bloom for number in range(10000))
+        self.assertLess(false_positives / 10000, 0.02)
+
+    def test_duplicate_keys_are_counted_once(self):
+        bloom = code_filter.BloomFilter(100, 0.01)
+        bloom.add("c:AAAAAA")
+        bloom.add("c:AAAAAA")
+        self.assertEqual(bloom.count, 1)
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    COUPON_CODE_FILTER_ENABLED=True,
+    COUPON_CODE_FILTER_MAX_LAG=0,
+    COUPON_CODE_FILTER_COMMIT_WINDOW=60,
+)
+class CodeFilterTests(TestCase):
+    """
+    認証APIの事前判定（code_filter.might_exist）が発行済みのコードを「存在しない」と判定しないことを確認する
+    """
+
+    def setUp(self):
+        code_filter.clear()
+        self.addCleanup(code_filter.clear)
+        self.store = create_store()
+        self.coupon = Coupon.create(self.store.id, "フィルタ", "10% OFF", "商品", None, None, None)
+        self.coupon_code = CouponCode.issue(self.coupon.id)
+
+    def create_code(self, code, **kwargs):
+        # 他のプロセスでの発行（このプロセスのフィルタには追加されない）
+        return CouponCode.objects.create(
+            store_id=self.store.id, coupon=self.coupon, coupon_code=code, coupon_uuid=uuid.uuid4(), **kwargs
+        )
+
+    def test_issued_codes_might_exist(self):
+        self.assertTrue(code_filter.might_exist(self.store.id, code=self.coupon_code.coupon_code))
+        self.assertTrue(code_filter.might_exist(self.store.id, code=self.coupon_code.coupon_code.lower()))
+        self.assertTrue(code_filter.might_exist(self.store.id, uuid=self.coupon_code.coupon_uuid))
+        self.assertFalse(code_filter.might_exist(self.store.id, uuid=uuid.uuid4()))
+        # 同じプロセスで発行したコードはコミット後に追加される
+        with self.captureOnCommitCallbacks(execute=True):
+            issued = CouponCode.issue(self.coupon.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(code_filter.might_exist(self.store.id, code=issued.coupon_code))
+
+    def test_codes_from_other_processes_are_read_from_tail(self):
+        code_filter.might_exist(self.store.id, code="ZZZZZZ")
+        other = self.create_code("QQQQQQ")
+        self.assertTrue(code_filter.might_exist(self.store.id, code=other.coupon_code))
+
+    def test_late_commit_of_lower_id_is_not_missed(self):
+        code_filter.might_exist(self.store.id, code="ZZZZZZ")
+        # 採番の遅い行が先にコミットされ、末尾の読み込みで最大の id が進む
+        newer = self.create_code("NNNNNN", id=self.coupon_code.id + 5000)
+        self.assertTrue(code_filter.might_exist(self.store.id, code=newer.coupon_code))
+        # 先に採番された行が後からコミットされる
+        late = self.create_code("LLLLLL", id=self.coupon_code.id + 1)
+        self.assertTrue(code_filter.might_exist(self.store.id, code=late.coupon_code))
+
+    def test_tail_start_follows_commit_window(self):
+        tail = {"checked_at": 100.0, "history": collections.deque([(0.0, 10), (30.0, 20), (50.0, 30), (90.0, 40)])}
+        # 前回の読み込み（100秒）の60秒前の時点で確認済みだった id から読み直す
+        self.assertEqual(code_filter._tail_start(tail), 20)
+        self.assertEqual(list(tail["history"]), [(30.0, 20), (50.0, 30), (90.0, 40)])
+        # 記録が新しいものしかない場合は最も古い記録を使う
+        tail = {"checked_at": 100.0, "history": collections.deque([(70.0, 50), (90.0, 60)])}
+        self.assertEqual(code_filter._tail_start(tail), 50)
+
+    def test_database_error_fails_open(self):
+        with mock.patch.object(code_filter, "_load_store", side_effect=DatabaseError("down")):
+            self.assertTrue(code_filter.might_exist(self.store.id, code="ZZZZZZ"))
+        code_filter.might_exist(self.store.id, code="ZZZZZZ")
+        with mock.patch.object(code_filter, "_refresh_tail", side_effect=DatabaseError("down")):
+            self.assertTrue(code_filter.might_exist(self.store.id, code="YYYYYY"))
+
+    @override_settings(COUPON_CODE_FILTER_ENABLED=False)
+    def test_disabled(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(code_filter.might_exist(self.store.id, code="ZZZZZZ"))
+
+
+SHARDS = ["shard1", "shard2"]
+# シャードのエイリアスがない設定（開発用の MySQL など）ではシャーディングのテストを行わない
+HAS_SHARDS = set(SHARDS) <= set(settings.DATABASES)
+
+
+@skipUnless(HAS_SHARDS, "config.test_settings のシャードのエイリアスが必要です")
+@override_settings(CACHES=TEST_CACHES, COUPON_SHARDS=SHARDS)
+class ShardingTests(TestCase):
+    """
+    店舗ごとのシャードへの振り分け・クーポンコードUUIDからの店舗の特定・保存先のキャッシュ・
+    rebalance_coupon_shards による店舗の移動を確認する（python manage.py test --settings=config.test_settings）
+    """
+    databases = {"default", *SHARDS} if HAS_SHARDS else {"default"}
+
+    def setUp(self):
+        caches["stores"].clear()
+        self.store = create_store()
+        self.other_store = create_store(email="other@example.com", store_name="他の店舗")
+        # テスト用DBではシャードにも店舗のテーブルがあり外部キー制約を検査するため、店舗をシャードにも保存する
+        for alias in SHARDS:
+            for store in (self.store, self.other_store):
+                store.user.save(using=alias)
+                store.save(using=alias)
+
+    def create_coupon(self, store, title="シャード"):
+        with sharding.use_store(store.id):
+            coupon = Coupon.create(store.id, title, "10% OFF", "商品", None, None, None)
+            coupon_code = CouponCode.issue(coupon.id)
+        return coupon, coupon_code
+
+    def test_router_uses_store_shard(self):
+        alias = sharding.shard_for_store(self.store.id)
+        self.assertEqual(alias, SHARDS[self.store.id % len(SHARDS)])
+        coupon, coupon_code = self.create_coupon(self.store)
+        for other in ["default", *SHARDS]:
+            exists = Coupon.objects.using(other).filter(id=coupon.id, store_id=self.store.id).exists()
+            self.assertEqual(exists, other == alias)
+        self.assertTrue(CouponCode.objects.using(alias).filter(id=coupon_code.id).exists())
+        # 店舗・StoreShard はディレクトリに保存する
+        with sharding.use_store(self.store.id):
+            self.assertEqual(sharding.ShardRouter().db_for_read(Store), sharding.DIRECTORY_ALIAS)
+            self.assertEqual(sharding.ShardRouter().db_for_write(Coupon), alias)
+        self.assertTrue(StoreShard.objects.using("default").filter(store_id=self.store.id, alias=alias).exists())
+
+    def test_code_uuid_round_trip(self):
+        coupon, coupon_code = self.create_coupon(self.store)
+        alias = sharding.shard_for_store(self.store.id)
+        self.assertEqual(coupon_code.coupon_uuid.version, sharding.UUID_VERSION)
+        self.assertEqual(sharding.store_id_from_uuid(coupon_code.coupon_uuid), self.store.id)
+        with sharding.use_code_uuid(coupon_code.coupon_uuid) as found:
+            self.assertEqual(found, alias)
+            self.assertEqual(CouponCode.objects.get(coupon_uuid=coupon_code.coupon_uuid).id, coupon_code.id)
+
+        # 埋め込みのないUUID（version 4）は全シャードを検索する
+        legacy = uuid.uuid4()
+        CouponCode.objects.using(alias).filter(id=coupon_code.id).update(coupon_uuid=legacy)
+        self.assertIsNone(sharding.store_id_from_uuid(legacy))
+        with sharding.use_code_uuid(legacy) as found:
+            self.assertEqual(found, alias)
+
+    def test_placement_is_cached(self):
+        placement = sharding.get_placement(self.store.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(sharding.get_placement(self.store.id), placement)
+        # 存在しない店舗もキャッシュする
+        self.assertIsNone(sharding.get_placement(999999))
+        with self.assertNumQueries(0):
+            self.assertIsNone(sharding.get_placement(999999))
+        StoreShard.assign(self.store.id, moving=True)
+        self.assertEqual(sharding.get_placement(self.store.id), (placement[0], True))
+
+    def test_moving_store_rejects_writes(self):
+        coupon, _ = self.create_coupon(self.store)
+        StoreShard.assign(self.store.id, moving=True)
+        self.client.force_login(self.store.user)
+        response = self.client.post(reverse("coupon:coupon_issue", args=[coupon.id]), HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+    def test_rebalance_moves_store_data(self):
+        coupon, coupon_code = self.create_coupon(self.store)
+        source = sharding.shard_for_store(self.store.id)
+        target = next(alias for alias in SHARDS if alias != source)
+        sort_priority = Coupon.objects.using(source).get(id=coupon.id).sort_priority
+
+        call_command("rebalance_coupon_shards", store=self.store.id, to=target, wait=0, stdout=io.StringIO())
+
+        self.assertEqual(sharding.get_placement(self.store.id), (target, False))
+        self.assertFalse(Coupon.objects.using(source).filter(store_id=self.store.id).exists())
+        self.assertFalse(CouponCode.objects.using(source).filter(store_id=self.store.id).exists())
+        moved = Coupon.objects.using(target).get(id=coupon.id)
+        self.assertEqual(moved.sort_priority, sort_priority)
+        self.assertEqual(moved.issued_count, 1)
+        with sharding.use_code_uuid(coupon_code.coupon_uuid) as found:
+            self.assertEqual(found, target)
+            self.assertEqual(CouponCode.objects.get(coupon_uuid=coupon_code.coupon_uuid).id, coupon_code.id)
+
+    def test_rebalance_aborts_on_id_collision(self):
+        coupon, _ = self.create_coupon(self.store)
+        source = sharding.shard_for_store(self.store.id)
+        target = next(alias for alias in SHARDS if alias != source)
+        # 移動先に同じ id の別の店舗のクーポンがある
+        Coupon.objects.using(target).create(id=coupon.id, store_id=self.other_store.id, title="重複")
+
+        with self.assertRaisesMessage(CommandError, "id が重複しています"):
+            call_command("rebalance_coupon_shards", store=self.store.id, to=target, wait=0, stdout=io.StringIO())
+
+        self.assertEqual(sharding.get_placement(self.store.id), (source, False))
+        self.assertTrue(Coupon.objects.using(source).filter(id=coupon.id, store_id=self.store.id).exists())
+        self.assertEqual(Coupon.objects.using(target).get(id=coupon.id).store_id, self.other_store.id)
@@ -10,20 +10,33 @@ from .views import (
     CouponVerifyPageView,
     CouponManualVerifyView,
     CouponQrVerifyView,
-    CouponListView
+    CouponBatchVerifyView,
+    CouponStatsApiView,
+    StoreStatsApiView,
+    CouponCodeExportView,
+    CouponQrImageView,
+    CouponListView,
+    CouponListApiView,
 )
 app_name = "coupon"
 
 urlpatterns = [
     path('', CouponListView.as_view(), name='coupon_list'),
+    path('api/coupons/', CouponListApiView.as_view(), name='coupon_list_api'),
     path('delete/<int:coupon_id>/', CouponDeleteView.as_view(), name='coupon_delete'),
     path('view/<uuid:coupon_code_uuid>/', CouponCodeCustomerView.as_view(), name='coupon_customer_view'),
+    path('qr/<uuid:coupon_code_uuid>.<str:image_format>', CouponQrImageView.as_view(), name='coupon_qr'),
     path('create/', CouponCreateView.as_view(), name='coupon_create'),
     path('create/confirm/', CouponCreateConfirmView.as_view(), name='coupon_create_confirm'),
     path('<int:coupon_id>/', CouponDetailView.as_view(), name='coupon_detail'),
     path('<int:coupon_id>/issue/', CouponIssueView.as_view(), name='coupon_issue'),
+    path('<int:coupon_id>/export/', CouponCodeExportView.as_view(), name='coupon_code_export'),
     path('code/<int:coupon_code_id>/', CouponCodeDetailView.as_view(), name='coupon_code_detail'),
     path('verify/', CouponVerifyPageView.as_view(), name='coupon_verify'),
     path('api/verify/manual/<str:code>/', CouponManualVerifyView.as_view(), name='coupon_verify_manual'),
     path('api/verify/uuid/<uuid:coupon_uuid>/', CouponQrVerifyView.as_view(), name='coupon_verify_qr'),
+    path('api/verify/qr/', CouponQrVerifyView.as_view(), name='coupon_verify_qr_payload'),
+    path('api/verify/batch/', CouponBatchVerifyView.as_view(), name='coupon_verify_batch'),
+    path('api/stats/', StoreStatsApiView.as_view(), name='store_stats'),
+    path('api/stats/<int:coupon_id>/', CouponStatsApiView.as_view(), name='coupon_stats'),
 ]
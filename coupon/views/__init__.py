@@ -1,4 +1,4 @@
-from .customer_views import CouponCodeCustomerView
+from .customer_views import CouponCodeCustomerView, CouponCodeShortView
 from .delete_views import CouponDeleteView
 from .detail_views import CouponDetailView
 from .create_views import CouponCreateView, CouponCreateConfirmView
@@ -7,4 +7,9 @@ from .detail_code_views import CouponCodeDetailView
 from .verify_page_views import CouponVerifyPageView
 from .manual_verify_views import CouponManualVerifyView
 from .qr_verify_views import CouponQrVerifyView
+from .batch_verify_views import CouponBatchVerifyView
 from .list_views import CouponListView
+from .list_api_views import CouponListApiView
+from .stats_views import CouponStatsApiView, StoreStatsApiView
+from .export_views import CouponCodeExportView
+from .qr_views import CouponQrImageView
@@ -0,0 +1,100 @@
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import DatabaseError
+from django.http import JsonResponse
+from django.views.generic import View
+
+from account.models import Store
+from coupon import code_filter, sharding
+from coupon.codes import is_plausible_code
+from coupon.models import CouponCode, RedeemResult, RedeemStatus
+from .verify_base_views import CouponVerifyBaseView
+logger = logging.getLogger(__name__)
+
+
+class CouponBatchVerifyView(LoginRequiredMixin, View):
+    """
+    クーポン一括認証API（POSスキャナー用）
+    - リクエスト: {"items": [{"uuid": "..."}, {"code": "..."}, ...]}
+    - レスポンス: {"results": [...]}（items と同じ順序。各要素は単体の認証APIと同じ内容に、
+      処理結果の種別 status（RedeemStatus の値。"success", "not_found" など）を付与したもの）
+    """
+
+    def post(self, request, *args, **kwargs):
+        # 1. リクエストボディから認証対象を取得
+        try:
+            body = json.loads(request.body or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'error': 'リクエストの形式が正しくありません'}, status=400)
+        items = body.get("items") if isinstance(body, dict) else None
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'error': 'クーポンコードが指定されていません'}, status=400)
+        max_items = getattr(settings, "COUPON_VERIFY_BATCH_MAX", 50)
+        if len(items) > max_items:
+            return JsonResponse({'error': f'一度に認証できるのは{max_items}件までです'}, status=400)
+
+        # 2. sessionからstore_idを取得
+        store_id = request.session.get('store_id')
+        if not store_id:
+            return JsonResponse({'error': '店舗情報が取得できません'}, status=400)
+
+        # 3. 店舗の存在確認（店舗情報のキャッシュがあればDBを参照しない）
+        try:
+            if Store.get_store_name(store_id) is None:
+                return JsonResponse({'error': '該当する店舗が存在しません'}, status=400)
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        except Exception:
+            return JsonResponse({'error': '予期せぬエラー'}, status=500)
+
+        # 4. 形式が正しいものだけをまとめて判定・使用済みにする
+        parsed = [self.parse_item(item) for item in items]
+        # 発行されていないことが確実なコード・UUIDはDBを検索しない（総当たり対策）
+        parsed = [
+            item if item is not None and code_filter.might_exist(store_id, **item) else None
+            for item in parsed
+        ]
+        valid = [item for item in parsed if item is not None]
+        try:
+            redeemed = iter(CouponCode.redeem_batch(store_id, valid) if valid else [])
+        except sharding.ShardMovingError:
+            # 店舗のデータの移動中は ShardMiddleware が 503 を返す
+            raise
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        except Exception:
+            return JsonResponse({'error': '予期せぬエラー'}, status=500)
+
+        results = []
+        for raw, item in zip(items, parsed):
+            result = next(redeemed) if item is not None else RedeemResult(RedeemStatus.NOT_FOUND)
+            code = next(iter(item.values())) if item is not None else raw
+            payload, _ = CouponVerifyBaseView.build_result(result, code)
+            payload["status"] = RedeemStatus(result.status).value
+            results.append(payload)
+        return JsonResponse({'results': results})
+
+    @staticmethod
+    def parse_item(item):
+        """
+        認証対象1件を CouponCode.redeem_batch に渡す形式に変換する
+        Returns:
+            dict: {"uuid": UUID} または {"code": str}
+            None: 形式が正しくない場合
+        """
+        if not isinstance(item, dict):
+            return None
+        if item.get("uuid"):
+            try:
+                return {"uuid": uuid.UUID(str(item["uuid"]))}
+            except ValueError:
+                return None
+        if item.get("code") and isinstance(item["code"], str):
+            # 入力ミス（文字数・使用文字・チェック文字の誤り）はDBを検索しない
+            code = item["code"].strip()
+            return {"code": code} if is_plausible_code(code) else None
+        return None
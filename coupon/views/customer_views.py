@@ -1,36 +1,70 @@
 from django.views.generic import DetailView
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 import logging
 
-from ..models import Coupon, CouponCode
+from config.db.router import use_primary
+
+from .. import page_cache, qr, sharding
+from ..models import CouponCode
 logger = logging.getLogger(__name__)
 
 
 class CouponCodeCustomerView(DetailView):
     template_name = "coupon/detail-code-customer.html"
 
+    def get(self, request, *args, **kwargs):
+        """
+        お客様向けクーポンページ。
+        - 表示結果をクーポンコードUUIDごとにキャッシュし、キャッシュがあればDBを参照しない
+        - ETag / Last-Modified による条件付きリクエストには 304 を返す
+        """
+        coupon_code_uuid = self.kwargs.get("coupon_code_uuid")
+        entry = page_cache.get_page(coupon_code_uuid)
+        if entry is None:
+            # バージョンはDBから取得する前に読み込む（取得中に使用された場合は保存したページを使用しない）
+            fill = page_cache.begin_fill(coupon_code_uuid)
+            response = super().get(request, *args, **kwargs)
+            response.render()
+            entry = page_cache.set_page(
+                self.object["coupon_code"], self.object["coupon"], response.content, fill
+            )
+        return self.build_response(request, entry)
+
+    def build_response(self, request, entry):
+        """
+        キャッシュ済みのページからレスポンスを作成し、キャッシュ関連のヘッダーを付与する
+        """
+        last_modified = int(entry["last_modified"].timestamp())
+        response = get_conditional_response(
+            request, etag=entry["etag"], last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(entry["content"])
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(
+            response, private=True, max_age=page_cache.max_age(entry["expiration_date"])
+        )
+        return response
+
     def get_object(self):
         """
         URLパスからクーポンコードUUIDを取得し、対応するクーポン情報を返す
         Returns:
             dict: {"coupon_code": CouponCode, "coupon": Coupon}
         Raises:
-            Http404: 対応するcoupon_idやクーポンコードまたはクーポンが存在しない場合
+            Http404: 対応するクーポンコードが存在しない場合
         """
         coupon_code_uuid = self.kwargs.get("coupon_code_uuid")
-        coupon_id = CouponCode.get_coupon_id_by_code_uuid(coupon_code_uuid)
-        if coupon_id is None:
-            raise Http404()
-
-        coupon_code = CouponCode.get_coupon_code_by_code_uuid(coupon_code_uuid)
+        # 表示結果はページのキャッシュに保存するため、レプリカではなくプライマリから取得する
+        with sharding.use_code_uuid(coupon_code_uuid), use_primary():
+            coupon_code = CouponCode.get_with_coupon(uuid=coupon_code_uuid)
         if coupon_code is None:
             raise Http404()
-
-        coupon = Coupon.get_coupon(coupon_id)
-        if coupon is None:
-            raise Http404()
-        return {"coupon_code": coupon_code, "coupon": coupon}
+        return {"coupon_code": coupon_code, "coupon": coupon_code.coupon}
 
     def get_context_data(self, **kwargs):
         """
@@ -46,3 +80,17 @@ class CouponCodeCustomerView(DetailView):
         # 今日の日付を追加
         context["today"] = timezone.localdate()
         return context
+
+
+class CouponCodeShortView(CouponCodeCustomerView):
+    """
+    お客様向けクーポンページの短縮URL（/C/<base32>/、QRコードを小さくするため）
+    - base32 をクーポンコードUUIDに戻し、CouponCodeCustomerView と同じページを返す
+    """
+
+    def get(self, request, *args, **kwargs):
+        coupon_code_uuid = qr.decode_token(self.kwargs.get("token", ""))
+        if coupon_code_uuid is None:
+            raise Http404()
+        self.kwargs["coupon_code_uuid"] = coupon_code_uuid
+        return super().get(request, *args, **kwargs)
@@ -17,40 +17,31 @@ class CouponDeleteView(LoginRequiredMixin, DeleteView):
         """
         クーポン削除処理。
 
+        - 存在しない、または権限がない場合はホーム画面へリダイレクト。
         - 既に削除済みの場合はホーム画面へリダイレクト。
         - 有効期限内または無期限で、かつ発行済みがある場合は削除不可としホーム画面へリダイレクト。
         - 上記以外の場合は削除処理を実行。
         """
         coupon_id = self.kwargs.get("coupon_id")
 
-        # 削除済みの場合ホーム画面にリダイレクト
-        coupon_for_deleted_at = Coupon.get_for_delete_check(coupon_id)
-        if coupon_for_deleted_at is None:
+        state = Coupon.get_state(coupon_id)
+        if state is None:
             return redirect(reverse("coupon:coupon_list"))
 
-        deleted_at = coupon_for_deleted_at.deleted_at
-        if deleted_at is not None:
+        # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
+        if not state.is_owned_by(request.user.id):
+            logger.warning(
+                "Unauthorized access attempt",
+                extra={
+                    "user_id": request.user.id,
+                    "coupon_id": coupon_id,
+                    "ip": request.META.get("REMOTE_ADDR"),
+                },
+            )
             return redirect(reverse("coupon:coupon_list"))
 
-        # 有効期限内や無期限かつ1件以上発行数が存在する場合ホーム画面にリダイレクト
-        coupon_for_expiration_date = Coupon.get_for_expiration_check(coupon_id)
-        if coupon_for_expiration_date is None:
-            return redirect(reverse("coupon:coupon_list"))
-
-        coupon_for_issuance_check = Coupon.get_for_issuance_check(coupon_id)
-        if coupon_for_issuance_check is None:
-            return redirect(reverse("coupon:coupon_list"))
-
-        expiration_date = coupon_for_expiration_date.expiration_date
-        today = timezone.localdate()
-        issued_count = coupon_for_issuance_check.issued_count
-        if (
-            (
-                (expiration_date is not None and today <= expiration_date) or
-                (expiration_date is None)
-            ) and
-            (issued_count > 0)
-        ):
+        # 削除済み、または有効期限内や無期限かつ1件以上発行数が存在する場合ホーム画面にリダイレクト
+        if not state.can_delete(timezone.localdate()):
             return redirect(reverse("coupon:coupon_list"))
 
         return self.delete(request, *args, **kwargs)
@@ -7,7 +7,7 @@ from django.http import Http404
 from django.utils import timezone
 import logging
 
-from ..models import Coupon, CouponCode
+from ..models import CouponCode, CouponState
 logger = logging.getLogger(__name__)
 
 
@@ -17,25 +17,19 @@ class CouponCodeDetailView(LoginRequiredMixin, DetailView):
     def get_object(self):
         """
         URLパスからクーポンコードIDを取得し、対応するクーポン情報を返す
+        （get で取得済みの場合はそれを返す）
         Returns:
             dict: {"coupon_code": CouponCode, "coupon": Coupon}
         Raises:
-            Http404: 対応するクーポンコードまたはクーポンが存在しない場合
+            Http404: 対応するクーポンコードが存在しない場合
         """
-        coupon_code_id = self.kwargs.get("coupon_code_id")
-        coupon_id = self.coupon_id
-        if coupon_id is None:
-            coupon_id = CouponCode.get_coupon_id_by_id(coupon_code_id)
-
-        coupon_code = CouponCode.get_coupon_code_by_id(coupon_code_id)
+        coupon_code = getattr(self, "coupon_code", None)
+        if coupon_code is None:
+            coupon_code = CouponCode.get_with_coupon(id=self.kwargs.get("coupon_code_id"))
         if coupon_code is None:
             raise Http404()
 
-        coupon = Coupon.get_coupon(coupon_id)
-        if coupon is None:
-            raise Http404()
-
-        return {"coupon_code": coupon_code, "coupon": coupon}
+        return {"coupon_code": coupon_code, "coupon": coupon_code.coupon}
 
     def get(self, request, *args, **kwargs):
         """
@@ -45,29 +39,21 @@ class CouponCodeDetailView(LoginRequiredMixin, DetailView):
             HttpResponse: 404/ホーム画面にリダイレクト/詳細ページのいずれか。
         """
         coupon_code_id = self.kwargs.get("coupon_code_id")
-        coupon_id = CouponCode.get_coupon_id_by_id(coupon_code_id)
-        if coupon_id is None:
+        # クーポンコード・クーポン・店舗を1クエリで取得し、判定と表示の両方に使用する
+        self.coupon_code = CouponCode.get_with_coupon(id=coupon_code_id)
+        if self.coupon_code is None:
             raise Http404()
 
         try:
+            state = CouponState.from_coupon(self.coupon_code.coupon)
             # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
-            store_user_id = Coupon.get_store_user_id(coupon_id)
-            if store_user_id is None:
-                raise Http404()
-            if store_user_id != request.user.id:
+            if not state.is_owned_by(request.user.id):
                 raise PermissionDenied()
 
             # 有効期限切れの場合はホーム画面へリダイレクト
-            coupon_for_expiration_date = Coupon.get_for_expiration_check(coupon_id)
-            if coupon_for_expiration_date is None:
-                raise Http404()
-
-            expiration_date = coupon_for_expiration_date.expiration_date
-            today = timezone.localdate()
-            if expiration_date is not None and expiration_date < today:
+            if state.is_expired(timezone.localdate()):
                 return redirect(reverse("coupon:coupon_list"))
 
-            self.coupon_id = coupon_id
             return super().get(request, *args, **kwargs)
         except PermissionDenied:
             logger.warning(
@@ -7,7 +7,7 @@ from django.http import Http404
 from django.utils import timezone
 import logging
 
-from ..models import Coupon
+from ..models import Coupon, CouponState
 logger = logging.getLogger(__name__)
 
 
@@ -18,13 +18,15 @@ class CouponDetailView(LoginRequiredMixin, DetailView):
     def get_object(self):
         """
         URLパスからクーポンIDを取得し、対応するクーポン情報を返す
+        （get で取得済みの場合はそれを返す）
         Returns:
             coupon: 指定されたクーポンIDが存在すれば coupon インスタンス
         Raises:
             Http404: 該当するクーポンが存在しない場合
         """
-        coupon_id = self.kwargs.get("coupon_id")
-        coupon = Coupon.get_coupon(coupon_id)
+        coupon = getattr(self, "coupon", None)
+        if coupon is None:
+            coupon = Coupon.get_coupon(self.kwargs.get("coupon_id"))
         if coupon is None:
             raise Http404()
         return coupon
@@ -43,40 +45,18 @@ class CouponDetailView(LoginRequiredMixin, DetailView):
         """
         coupon_id = self.kwargs.get("coupon_id")
         try:
-            # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
-            store_user_id = Coupon.get_store_user_id(coupon_id)
-            if store_user_id is None:
-                raise Http404()
-            if store_user_id != request.user.id:
-                raise PermissionDenied()
-
-            # 削除済みの場合はホーム画面へリダイレクト
-            coupon_for_deleted_at = Coupon.get_for_delete_check(coupon_id)
-            if coupon_for_deleted_at is None:
+            # 表示用のクーポン（店舗情報付き）を1クエリで取得し、判定にも使用する
+            self.coupon = Coupon.get_coupon(coupon_id)
+            if self.coupon is None:
                 raise Http404()
+            state = CouponState.from_coupon(self.coupon)
 
-            deleted_at = coupon_for_deleted_at.deleted_at
-            if deleted_at is not None:
-                return redirect(reverse("coupon:coupon_list"))
-
-            # 有効期限切れの場合はホーム画面へリダイレクト
-            coupon_for_expiration_date = Coupon.get_for_expiration_check(coupon_id)
-            if coupon_for_expiration_date is None:
-                raise Http404()
-
-            expiration_date = coupon_for_expiration_date.expiration_date
-            today = timezone.localdate()
-            if expiration_date is not None and expiration_date < today:
-                return redirect(reverse("coupon:coupon_list"))
-
-            # 発行数上限に達している場合はホーム画面へリダイレクト
-            coupon_for_issuance_check = Coupon.get_for_issuance_check(coupon_id)
-            if coupon_for_issuance_check is None:
-                raise Http404()
+            # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
+            if not state.is_owned_by(request.user.id):
+                raise PermissionDenied()
 
-            max_issuance = coupon_for_issuance_check.max_issuance
-            issued_count = coupon_for_issuance_check.issued_count
-            if max_issuance is not None and max_issuance <= issued_count:
+            # 削除済み、有効期限切れまたは発行数上限に達している場合はホーム画面へリダイレクト
+            if not state.can_issue(timezone.localdate()):
                 return redirect(reverse("coupon:coupon_list"))
 
             return super().get(request, *args, **kwargs)
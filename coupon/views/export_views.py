@@ -0,0 +1,47 @@
+from django.views.generic import View
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+import logging
+
+from ..models import Coupon
+from .. import exports
+logger = logging.getLogger(__name__)
+
+
+class CouponCodeExportView(LoginRequiredMixin, View):
+    """
+    クーポンコードの一括エクスポート（?format=csv または jsonl）
+    - StreamingHttpResponse で少しずつ返し、件数によらずワーカーのメモリ使用量を一定にする
+    """
+
+    def get(self, request, *args, **kwargs):
+        coupon_id = self.kwargs.get("coupon_id")
+        export_format = request.GET.get("format", "csv")
+        if export_format not in exports.FORMATS:
+            raise Http404()
+
+        state = Coupon.get_state(coupon_id)
+        if state is None:
+            raise Http404()
+        # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
+        if not state.is_owned_by(request.user.id):
+            logger.warning(
+                "Unauthorized access attempt",
+                extra={
+                    "user_id": request.user.id,
+                    "coupon_id": coupon_id,
+                    "ip": request.META.get("REMOTE_ADDR"),
+                },
+            )
+            return redirect(reverse("coupon:coupon_list"))
+
+        response = StreamingHttpResponse(
+            exports.iter_export(coupon_id, export_format),
+            content_type=exports.CONTENT_TYPES[export_format],
+        )
+        filename = f"coupon_{coupon_id}_codes_{timezone.localdate():%Y%m%d}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
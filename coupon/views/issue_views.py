@@ -26,43 +26,18 @@ class CouponIssueView(LoginRequiredMixin, View):
         """
         coupon_id = self.kwargs.get("coupon_id")
         try:
-            # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
-            store_user_id = Coupon.get_store_user_id(coupon_id)
-            if store_user_id is None:
+            state = Coupon.get_state(coupon_id)
+            if state is None:
                 raise Http404()
-            if store_user_id != request.user.id:
+            # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
+            if not state.is_owned_by(request.user.id):
                 raise PermissionDenied()
 
-            # 削除済みの場合はホーム画面へリダイレクト
-            coupon_for_deleted_at = Coupon.get_for_delete_check(coupon_id)
-            if coupon_for_deleted_at is None:
-                return redirect(reverse("coupon:coupon_list"))
-
-            deleted_at = coupon_for_deleted_at.deleted_at
-            if deleted_at is not None:
-                return redirect(reverse("coupon:coupon_list"))
-
-            # 有効期限切れの場合はホーム画面へリダイレクト
-            coupon_for_expiration_date = Coupon.get_for_expiration_check(coupon_id)
-            if coupon_for_expiration_date is None:
-                return redirect(reverse("coupon:coupon_list"))
-
-            expiration_date = coupon_for_expiration_date.expiration_date
-            today = timezone.localdate()
-            if expiration_date is not None and expiration_date < today:
-                return redirect(reverse("coupon:coupon_list"))
-
-            # 発行数上限に達している場合はホーム画面へリダイレクト
-            coupon_for_issuance_check = Coupon.get_for_issuance_check(coupon_id)
-            if coupon_for_issuance_check is None:
-                return redirect(reverse("coupon:coupon_list"))
-
-            max_issuance = coupon_for_issuance_check.max_issuance
-            issued_count = coupon_for_issuance_check.issued_count
-            if max_issuance is not None and max_issuance <= issued_count:
+            # 削除済み、有効期限切れまたは発行数上限に達している場合はホーム画面へリダイレクト
+            if not state.can_issue(timezone.localdate()):
                 return redirect(reverse("coupon:coupon_list"))
 
-            coupon_code = CouponCode.issue(coupon_id)
+            coupon_code = CouponCode.issue(coupon_id, state=state)
             if coupon_code is None:
                 return redirect(reverse("coupon:coupon_list"))
             return redirect(
@@ -0,0 +1,35 @@
+from django.http import JsonResponse
+from django.urls import reverse
+
+from .list_views import CouponListView
+
+
+class CouponListApiView(CouponListView):
+    """
+    クーポン一覧のJSON版（無限スクロール用）
+    - クエリパラメータ cursor に前回の next_cursor を指定すると続きを返す
+    """
+
+    def render_to_response(self, context, **response_kwargs):
+        coupons = [
+            {
+                "id": coupon.id,
+                "title": coupon.title,
+                "target_product": coupon.target_product,
+                "discount": coupon.discount,
+                "expiration_date": coupon.expiration_date.isoformat() if coupon.expiration_date else None,
+                "max_issuance": coupon.max_issuance,
+                "issued_count": coupon.live_issued_count,
+                "redeemed_count": coupon.live_redeemed_count,
+                "usage_rate": coupon.usage_rate,
+                "can_delete": coupon.can_delete,
+                "sort_priority": coupon.sort_priority,
+                "detail_url": reverse("coupon:coupon_detail", args=[coupon.id]),
+                "delete_url": reverse("coupon:coupon_delete", args=[coupon.id]),
+            }
+            for coupon in context["coupon_list"]
+        ]
+        return JsonResponse({
+            "coupons": coupons,
+            "next_cursor": context["next_cursor"],
+        }, **response_kwargs)
@@ -1,19 +1,61 @@
-from django.db.models import Q, F, Case, When, Value, IntegerField
+from django.conf import settings
+from django.db.models import Q, F, Case, When, Value, IntegerField, BooleanField, FloatField
+from django.db.models.functions import Cast, Round
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import render
 from django.utils import timezone
+from datetime import date
 
 import logging
 now = timezone.localdate()
 
-from ..models import Coupon
+from ..models import Coupon, CouponStatus
 from account.models import Store
 logger = logging.getLogger(__name__)
 
 
+def encode_cursor(coupon):
+    """
+    一覧の並び順（sort_priority, expiration_date, id）から次ページのカーソル文字列を作成する
+    Args:
+        coupon (Coupon): ページの最後のクーポン（sort_priority を付与済み）
+    Returns:
+        str: "sort_priority.expiration_date.id" 形式のカーソル（無期限の場合 expiration_date は空）
+    """
+    expiration_date = coupon.expiration_date.isoformat() if coupon.expiration_date else ""
+    return f"{coupon.sort_priority}.{expiration_date}.{coupon.id}"
+
+
+def decode_cursor(value):
+    """
+    カーソル文字列を (sort_priority, expiration_date, id) に変換する
+    Returns:
+        tuple: (int, date | None, int)
+        None: カーソルが指定されていない、または不正な場合
+    """
+    if not value:
+        return None
+    try:
+        priority, expiration_date, coupon_id = value.split(".")
+        return (
+            int(priority),
+            date.fromisoformat(expiration_date) if expiration_date else None,
+            int(coupon_id),
+        )
+    except ValueError:
+        return None
+
+
 class CouponListView(LoginRequiredMixin, ListView):
+    """
+    クーポン一覧
+    - 並び順（sort_priority, expiration_date 降順, id 降順）のキーセットでページングする
+      （Coupon.sort_priority と店舗ごとの複合インデックス coupon_store_list_order_idx の順に読み込む）
+    - 利用率・削除可否はDB側で計算し、1ページ分のみ取得する
+    """
     template_name = "coupon/list.html"
+    context_object_name = "coupon_list"
 
     def setup(self, request, *args, **kwargs):
         """
@@ -24,55 +66,73 @@ class CouponListView(LoginRequiredMixin, ListView):
         super().setup(request, *args, **kwargs)
         user_id = self.request.user.id
         self.store_id = Store.get_store_id_for_user(user_id)
+        self.next_cursor = None
 
-    def get_queryset(self):
-        queryset = Coupon.get_coupon_list(self.store_id)
+    def get_page_size(self):
+        return getattr(settings, "COUPON_LIST_PAGE_SIZE", 30)
+
+    def get_base_queryset(self):
+        """
+        並び順・利用率・削除可否を付与したクーポン一覧のクエリセット（ページング前）
+        """
+        # 分散カウンタの未集約分を含めた発行数・使用数で計算する
+        queryset = Coupon.with_live_counts(Coupon.get_coupon_list(self.store_id))
 
         today = timezone.localdate()
-        # 期限内
-        not_expired = Q(expiration_date__gte=today)
-        # 無期限
-        no_expiration_limit = Q(expiration_date__isnull=True)
-        # 発行上限が設定されていない
-        no_issue_limit = Q(max_issuance__isnull=True)
-        # 発行上限にまだ達していない（上限未達 or 上限なし）
-        issue_limit_not_reached = Q(issued_count__lt=F("max_issuance")) | no_issue_limit
-        # 発行上限に達している
-        issue_limit_reached = Q(max_issuance__lte=F("issued_count"))
-        # すでに有効期限が切れている
-        already_expired = Q(expiration_date__lt=today)
-        queryset = queryset.annotate(
-            sort_priority=Case(
-                # 1) 期限内 & 上限未達
-                When(not_expired & issue_limit_not_reached, then=Value(0)),
-                # 2) 無期限
-                When(no_expiration_limit, then=Value(1)),
-                # 3) 期限内だが上限到達
-                When(not_expired & issue_limit_reached, then=Value(2)),
-                # 4) 期限切れ
-                When(already_expired, then=Value(3)),
-                default=Value(9),
+        # すでに有効期限が切れている（sweep_coupon_status の実行前は有効期限でも判定する）
+        already_expired = Q(status=CouponStatus.EXPIRED) | Q(expiration_date__lt=today)
+        # 並び順（sort_priority）は status から計算したDBの列を使い、インデックスの順に1ページ分のみ読み込む
+        return queryset.annotate(
+            # 利用率（%）: 未発行の場合は 0
+            usage_rate=Case(
+                When(
+                    live_issued_count__gt=0,
+                    then=Cast(
+                        Round(
+                            Cast("live_redeemed_count", FloatField()) * Value(100.0)
+                            / F("live_issued_count")
+                        ),
+                        IntegerField(),
+                    ),
+                ),
+                default=Value(0),
                 output_field=IntegerField(),
-            )
-        ).order_by("sort_priority", "-expiration_date")
+            ),
+            # 削除可能の場合に True（未発行のクーポン または 期限切れのクーポン）
+            can_delete=Case(
+                When(Q(live_issued_count=0) | already_expired, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+        ).order_by("sort_priority", "-expiration_date", "-id")
 
-        for coupon in queryset:
-            # 計算処理: 利用率（%）
-            if coupon.issued_count > 0:
-                coupon.usage_rate = round((coupon.redeemed_count / coupon.issued_count) * 100)
-            else:
-                coupon.usage_rate = 0
+    def get_queryset(self):
+        queryset = self.get_base_queryset()
 
-            # 削除可能の場合に True をセット（未発行のクーポン または 期限切れのクーポン）
-            coupon.can_delete = (
-                coupon.issued_count == 0
-                or coupon.expiration_date is not None and coupon.expiration_date < today
-            )
+        # カーソルより後ろ（並び順で後）のクーポンに絞り込む
+        # sort_priority ごとに有効期限は「すべて無期限」か「すべて期限あり」のどちらかになる
+        cursor = decode_cursor(self.request.GET.get("cursor"))
+        if cursor is not None:
+            priority, expiration_date, coupon_id = cursor
+            after = Q(sort_priority__gt=priority)
+            if expiration_date is None:
+                after |= Q(sort_priority=priority, id__lt=coupon_id)
+            else:
+                after |= Q(sort_priority=priority, expiration_date__lt=expiration_date)
+                after |= Q(sort_priority=priority, expiration_date=expiration_date, id__lt=coupon_id)
+            queryset = queryset.filter(after)
 
-        return queryset
+        # 次ページの有無を判定するため1件多く取得する
+        page_size = self.get_page_size()
+        coupons = list(queryset[:page_size + 1])
+        if len(coupons) > page_size:
+            coupons = coupons[:page_size]
+            self.next_cursor = encode_cursor(coupons[-1])
+        return coupons
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["store_name"] = Store.get_store_name(self.store_id)
         context["today"] = timezone.localdate()
+        context["next_cursor"] = self.next_cursor
         return context
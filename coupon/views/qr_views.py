@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.views.generic import View
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+import hashlib
+import logging
+
+from .. import qr
+logger = logging.getLogger(__name__)
+
+# 1年（immutable と合わせて再検証させない）
+QR_MAX_AGE = 60 * 60 * 24 * 365
+QR_CONTENT_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+
+class CouponQrImageView(View):
+    """
+    クーポンコードのQRコード画像（/coupon/qr/<uuid>.svg または .png）
+    - ?mode=short（デフォルト）: お客様向けページの短縮URL / ?mode=compact: コンパクト形式（店舗の読み取り用）
+      いずれも英数字モードで格納でき、小さい型番（読み取りやすいQRコード）になる
+    - ?mode=url / ?mode=uuid: 従来の形式（お客様向けページのURL / クーポンコードUUID）
+    - ?scale=: PNG の1モジュールあたりのピクセル数（1〜20、デフォルト 8）
+    - 内容は UUID から決まり変わらないため、DBは参照せず immutable でキャッシュさせる
+    """
+
+    def get(self, request, *args, **kwargs):
+        coupon_code_uuid = self.kwargs.get("coupon_code_uuid")
+        image_format = self.kwargs.get("image_format")
+        if image_format not in QR_CONTENT_TYPES:
+            raise Http404()
+
+        mode = request.GET.get("mode", "short")
+        if mode == "short":
+            text = qr.short_url(coupon_code_uuid)
+        elif mode == "compact":
+            text = qr.compact_payload(coupon_code_uuid)
+        elif mode == "url":
+            text = settings.COUPON_PUBLIC_BASE_URL.rstrip("/") + reverse(
+                "coupon:coupon_customer_view", args=[coupon_code_uuid]
+            )
+        elif mode == "uuid":
+            text = str(coupon_code_uuid)
+        else:
+            raise Http404()
+
+        try:
+            scale = int(request.GET.get("scale", "8"))
+        except ValueError:
+            raise Http404()
+        if not 1 <= scale <= 20:
+            raise Http404()
+
+        # 格納する文字列・形式・エンコーダーのバージョンが同じなら画像も同じ
+        basis = ":".join([str(qr.ENCODER_VERSION), image_format, str(scale), text])
+        etag = quote_etag(hashlib.sha1(basis.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            matrix = qr.encode(text)
+            if image_format == "svg":
+                content = qr.to_svg(matrix)
+            else:
+                content = qr.to_png(matrix, scale=scale)
+            response = HttpResponse(content, content_type=QR_CONTENT_TYPES[image_format])
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=QR_MAX_AGE, immutable=True)
+        return response
@@ -0,0 +1,124 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import DatabaseError
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.generic import View
+import logging
+
+from ..models import Coupon, CouponStatBucket
+from account.models import Store
+logger = logging.getLogger(__name__)
+
+
+class CouponStatsMixin:
+    """
+    発行数・使用数の推移APIの共通処理
+    - クエリパラメータ: granularity（hour / day）、from, to（YYYY-MM-DD、to を含む）
+    - 集計テーブル（CouponStatBucket）のみを参照する
+    """
+    default_days = {"day": 30, "hour": 1}
+
+    def get_range(self):
+        """
+        クエリパラメータから集計単位と期間を取得する
+        Returns:
+            tuple[str, date, date]: (集計単位, 開始日, 終了日)
+        Raises:
+            ValueError: パラメータが正しくない場合
+        """
+        granularity = self.request.GET.get("granularity", "day")
+        if granularity not in self.default_days:
+            raise ValueError("granularity には hour または day を指定してください")
+
+        today = timezone.localdate()
+        try:
+            date_to = date.fromisoformat(self.request.GET["to"]) if self.request.GET.get("to") else today
+            if self.request.GET.get("from"):
+                date_from = date.fromisoformat(self.request.GET["from"])
+            else:
+                date_from = date_to - timedelta(days=self.default_days[granularity] - 1)
+        except ValueError:
+            raise ValueError("from, to は YYYY-MM-DD 形式で指定してください")
+        if date_from > date_to:
+            raise ValueError("from には to 以前の日付を指定してください")
+        max_days = getattr(settings, "COUPON_STATS_MAX_DAYS", 92)
+        if (date_to - date_from).days + 1 > max_days:
+            raise ValueError(f"期間は{max_days}日以内で指定してください")
+        return granularity, date_from, date_to
+
+    def render_stats(self, **target):
+        """
+        指定された対象（coupon_id または store_id）の推移をJSONレスポンスにする
+        """
+        try:
+            granularity, date_from, date_to = self.get_range()
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        start = timezone.make_aware(datetime.combine(date_from, time.min))
+        end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+        try:
+            buckets = CouponStatBucket.series(start, end, granularity=granularity, **target)
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+
+        for bucket in buckets:
+            bucket["start"] = bucket["start"].isoformat()
+        return JsonResponse({
+            "granularity": granularity,
+            "from": date_from.isoformat(),
+            "to": date_to.isoformat(),
+            "buckets": buckets,
+            "total": {
+                "issued": sum(bucket["issued"] for bucket in buckets),
+                "redeemed": sum(bucket["redeemed"] for bucket in buckets),
+            },
+        })
+
+
+class CouponStatsApiView(LoginRequiredMixin, CouponStatsMixin, View):
+    """
+    クーポンごとの発行数・使用数の推移API
+    """
+
+    def get(self, request, *args, **kwargs):
+        coupon_id = self.kwargs.get("coupon_id")
+        try:
+            state = Coupon.get_state(coupon_id)
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        if state is None:
+            return JsonResponse({'error': '該当するクーポンが存在しません'}, status=404)
+
+        # 権限チェック（店舗ユーザーとログインユーザーの一致を確認）
+        if not state.is_owned_by(request.user.id):
+            logger.warning(
+                "Unauthorized access attempt",
+                extra={
+                    "user_id": request.user.id,
+                    "coupon_id": coupon_id,
+                    "ip": request.META.get("REMOTE_ADDR"),
+                },
+            )
+            return JsonResponse({'error': '権限がありません'}, status=403)
+
+        return self.render_stats(coupon_id=coupon_id)
+
+
+class StoreStatsApiView(LoginRequiredMixin, CouponStatsMixin, View):
+    """
+    店舗全体（全クーポン合計）の発行数・使用数の推移API
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            store_id = Store.get_store_id_for_user(request.user.id)
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        if store_id is None:
+            return JsonResponse({'error': '店舗情報が取得できません'}, status=400)
+
+        return self.render_stats(store_id=store_id)
@@ -0,0 +1,110 @@
+from abc import ABCMeta, abstractmethod
+
+from django.views.generic import View
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.db import DatabaseError
+import logging
+
+from coupon import code_filter, sharding
+from coupon.models import CouponCode, RedeemStatus
+from account.models import Store
+logger = logging.getLogger(__name__)
+
+
+class CouponVerifyBaseView(LoginRequiredMixin, View, metaclass=ABCMeta):
+    """
+    クーポン認証APIの共通処理（QR認証・手動認証）
+    - サブクラスで get_redeem_kwargs を実装し、CouponCode.redeem に渡す検索条件を返す
+    """
+    store_not_found_message = "該当する店舗が存在しません"
+    missing_code_message = "クーポンコードが指定されていません"
+
+    @abstractmethod
+    def get_redeem_kwargs(self):
+        """
+        CouponCode.redeem に渡す検索条件（code または uuid）を返す
+        Returns:
+            dict: {"code": str} または {"uuid": uuid}
+        """
+
+    def is_plausible(self, redeem_kwargs):
+        """
+        検索条件が発行済みのクーポンコードでありうるかをDBを参照せずに判定する
+        - False の場合は店舗の確認・DBの検索を行わずに「無効なクーポンコード」を返す
+        """
+        return True
+
+    def post(self, request, *args, **kwargs):
+        # 1. JSからクーポンコード・UUIDを取得
+        redeem_kwargs = self.get_redeem_kwargs()
+        code = next(iter(redeem_kwargs.values()), None)
+        if not code:
+            return JsonResponse({'error': self.missing_code_message}, status=400)
+        if not self.is_plausible(redeem_kwargs):
+            return JsonResponse({'error': RedeemStatus.NOT_FOUND.label}, status=400)
+
+        # 2. sessionからstore_idを取得
+        store_id = request.session.get('store_id')
+        if not store_id:
+            return JsonResponse({'error': '店舗情報が取得できません'}, status=400)
+        # 発行されていないことが確実なコード・UUIDはDBを検索しない（総当たり対策）
+        if not code_filter.might_exist(store_id, **redeem_kwargs):
+            return JsonResponse({'error': RedeemStatus.NOT_FOUND.label}, status=400)
+
+        # 3. 店舗の存在確認（店舗情報のキャッシュがあればDBを参照しない）
+        try:
+            if Store.get_store_name(store_id) is None:
+                return JsonResponse({'error': self.store_not_found_message}, status=400)
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        except Exception:
+            return JsonResponse({'error': '予期せぬエラー'}, status=500)
+
+        # 4. 判定と使用済み処理を1トランザクションで実行する
+        try:
+            result = CouponCode.redeem(store_id, **redeem_kwargs)
+        except sharding.ShardMovingError:
+            # 店舗のデータの移動中は ShardMiddleware が 503 を返す
+            raise
+        except DatabaseError:
+            return JsonResponse({'error': 'システムエラーが発生しました'}, status=500)
+        except Exception:
+            return JsonResponse({'error': '予期せぬエラー'}, status=500)
+
+        return self.render_result(result, code)
+
+    def render_result(self, result, code):
+        """
+        CouponCode.redeem の処理結果をJSONレスポンスに変換する
+        Args:
+            result (RedeemResult): 処理結果
+            code (str): リクエストされたクーポンコード・UUID
+        Returns:
+            JsonResponse: 成功時は200、失敗時は400
+        """
+        payload, status = self.build_result(result, code)
+        return JsonResponse(payload, status=status)
+
+    @staticmethod
+    def build_result(result, code):
+        """
+        CouponCode.redeem の処理結果をレスポンスの内容とステータスコードに変換する
+        Args:
+            result (RedeemResult): 処理結果
+            code (str): リクエストされたクーポンコード・UUID
+        Returns:
+            tuple[dict, int]: (レスポンスの内容, ステータスコード)
+        """
+        if result.status == RedeemStatus.EXPIRED:
+            expiration_date = result.coupon.expiration_date.strftime('%Y年%-m月%-d日')
+            return {'error': f"期限切れ：クーポンの有効期限は{expiration_date}までです。"}, 400
+        if not result.success:
+            return {'error': RedeemStatus(result.status).label}, 400
+
+        return {
+            'success': True,
+            'target_product': result.coupon.target_product,
+            'discount': result.coupon.discount,
+            'coupon_code': str(code),
+        }, 200
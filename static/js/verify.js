@@ -76,13 +76,14 @@ const checkImage = async () => {
 
         // Djangoへ送信する
         try {
-            const qrResponse = await fetch(`/coupon/api/verify/uuid/${qrData}/`, {
+            // コンパクト形式・UUID・URLのいずれもサーバー側で判別する
+            const qrResponse = await fetch('/coupon/api/verify/qr/', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                     'X-CSRFToken': getCookie('csrftoken')
                 },
-                body: JSON.stringify({})
+                body: JSON.stringify({payload: qrData})
             });
             const qrResult = await qrResponse.json();
 
@@ -156,6 +157,24 @@ const titleArea = document.getElementById('title-area'); // 成功時に非表
 const cameraArea = document.getElementById('camera-area'); // 成功時に非表示
 const manualArea = document.getElementById('manual-area'); // 成功時に非表示
 
+// クーポンコードの形式チェック（coupon/codes.py の is_plausible_code と同じ判定）
+// - 6文字: チェック文字なしのコード / 7文字: 末尾がチェック文字（ISO/IEC 7064 MOD 37,36）のコード
+const CODE_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789';
+function checkChar(payload) {
+    const modulus = CODE_CHARS.length;
+    let product = modulus;
+    for (const char of payload) {
+        const total = (product + CODE_CHARS.indexOf(char)) % modulus || modulus;
+        product = total * 2 % (modulus + 1);
+    }
+    return CODE_CHARS[(modulus + 1 - product) % modulus];
+}
+function isPlausibleCode(code) {
+    code = code.toUpperCase();
+    if (!/^[A-Z0-9]{6,7}$/.test(code)) return false;
+    return code.length === 6 || code[6] === checkChar(code.slice(0, 6));
+}
+
 const manualVerify = document.getElementById('manual-verify');
 manualVerify.addEventListener('click', async () => {
     scanning = false;
@@ -167,6 +186,12 @@ manualVerify.addEventListener('click', async () => {
         manualErrorArea.innerText = "コードを入力してください";
         return;
     }
+    // 入力ミスは送信せずに知らせる
+    if (!isPlausibleCode(manualCode)) {
+        manualErrorArea.style.display = "block";
+        manualErrorArea.innerText = "クーポンコードの入力に誤りがあります";
+        return;
+    }
     
     // Djangoへ送信
     try {